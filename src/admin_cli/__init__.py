@@ -2,6 +2,7 @@ import click
 
 from src.admin_cli.commands.cache import cache
 from src.admin_cli.commands.inspector_ui import inspector_ui
+from src.admin_cli.commands.server import server
 from src.admin_cli.commands.stack import stack
 
 
@@ -14,3 +15,4 @@ def cli():
 cli.add_command(cache)
 cli.add_command(stack)
 cli.add_command((inspector_ui))
+cli.add_command(server)
@@ -1,62 +1,226 @@
 import asyncio
+import json
 import math
+import time
 import traceback
-from asyncio.exceptions import TimeoutError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import aiohttp
+import boto3
 import click
 import mercantile
+import numpy as np
 import polars as pl
-from shapely import union_all, wkt
+from botocore.config import Config
+from shapely import wkt
 from tqdm import tqdm
 
+import src.utils.resources as resources
+from src.lambda_functions.get_naip_tile import BATCH_MAX_TILES
 from src.utils import logger
-from src.utils.conversion import bbox_to_box
+from src.utils.cache_lifecycle import (
+    CachePrunePolicy,
+    delete_cached_tiles,
+    list_cached_tiles,
+    select_tiles_to_prune,
+    summarize_cached_tiles,
+)
 from src.utils.env import TileServerConfig
 from src.utils.naip import get_naip_geotiffs
+from src.utils.seeding import AIMDConcurrency, HttpTileSeeder, SeedCheckpoint
 from src.utils.stack_info import (
     get_is_cache_enabled,
     get_is_stack_deployed,
     get_stack_output_value,
 )
+from src.utils.tile_cache import MBTilesTileCache, S3BundleTileCache
+from src.utils.tile_enumeration import enumerate_tiles
 
 pl.Config.set_tbl_rows(1000)
 pl.Config.set_tbl_hide_dataframe_shape(True)
 
 
-def _seed_tiles_by_year(tiles: list[mercantile.Tile], year: int):
+def _log_seed_summary(tiles: list[mercantile.Tile], year: int, counts: dict, elapsed: float, **extra) -> None:
+    zoom = tiles[0].z if tiles else None
+    extra_info = "".join(f", {name}: {value}" for name, value in extra.items())
+    logger.info(
+        f"seeded year: {year}, zoom: {zoom}, {len(tiles)} tiles in {elapsed:.1f}s "
+        f"({len(tiles) / max(elapsed, 1e-9):.1f} tiles/s){extra_info}, tiles by status: {counts}"
+    )
+
+
+def _seed_tiles_by_year(
+    tiles: list[mercantile.Tile], year: int, checkpoint: SeedCheckpoint | None = None, max_concurrency: int = 256
+):
     naip_tile_api_base_uri = get_stack_output_value("NAIPTileApi")
+    # requests in flight grow until the API pushes back (429/5xx/timeouts/slow responses)
+    concurrency = AIMDConcurrency(initial=min(16, max_concurrency), max_limit=max_concurrency)
+
+    start = time.perf_counter()
+    with tqdm(total=len(tiles)) as pbar:
+        seeder = HttpTileSeeder(naip_tile_api_base_uri, year, concurrency, checkpoint, progress=pbar.update)
+        counts = asyncio.run(seeder.run(tiles))
+    _log_seed_summary(tiles, year, counts, time.perf_counter() - start, concurrency=concurrency.limit)
+
+
+def _seed_tiles_by_year_batched(
+    tiles: list[mercantile.Tile],
+    year: int,
+    batch_size: int,
+    concurrency: int = 16,
+    checkpoint: SeedCheckpoint | None = None,
+):
+    naip_tile_function = get_stack_output_value("NAIPTileFunction")
+    lambda_client = boto3.client(
+        "lambda", config=Config(max_pool_connections=concurrency, read_timeout=900, retries={"max_attempts": 0})
+    )
+
+    # neighbouring tiles share NAIP geotiffs - batch tiles block by block
+    tiles = sorted(tiles, key=lambda t: (t.y // 16, t.x // 16, t.y, t.x))
+    batches = [tiles[i : i + batch_size] for i in range(0, len(tiles), batch_size)]
+
+    def _invoke_batch(batch_tiles: list[mercantile.Tile]) -> dict:
+        payload = {"year": year, "tiles": [{"x": t.x, "y": t.y, "z": t.z} for t in batch_tiles]}
+        response = lambda_client.invoke(FunctionName=naip_tile_function, Payload=json.dumps(payload).encode())
+        result = json.loads(response["Payload"].read())
+        if "FunctionError" in response or result.get("statusCode") != 200:
+            raise RuntimeError(f"batch invocation failed: {result}")
+        summary = json.loads(result["body"])
+        if checkpoint:
+            seeded_statuses = ("rendered", "empty", "cached")
+            seeded_tiles = [
+                mercantile.Tile(t["x"], t["y"], t["z"]) for t in summary["tiles"] if t["status"] in seeded_statuses
+            ]
+            checkpoint.add(seeded_tiles, year)
+        return summary["counts"]
+
+    counts = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, tqdm(total=len(tiles)) as pbar:
+        futures = {executor.submit(_invoke_batch, batch_tiles): batch_tiles for batch_tiles in batches}
+        for future in as_completed(futures):
+            try:
+                for status, count in future.result().items():
+                    counts[status] = counts.get(status, 0) + count
+            except Exception:
+                tqdm.write(f"{traceback.format_exc()} happened while processing batch starting at {futures[future][0]}")
+                counts["error"] = counts.get("error", 0) + len(futures[future])
+            pbar.update(len(futures[future]))
+    _log_seed_summary(tiles, year, counts, time.perf_counter() - start)
+
+
+def _get_cache_tileset(
+    tiles: list[mercantile.Tile],
+    year: int,
+    zoom: int,
+    cache,
+    checkpoint: SeedCheckpoint | None,
+    pyramid: bool,
+    footprint_bounds: np.ndarray,
+) -> dict:
+    cache_tileset = {"year": year, "zoom": zoom, "total tiles": len(tiles)}
+    if pyramid:
+        # pyramids are (re)built as a whole - missing tiles can't be built without their (cached) descendants.  tiles
+        # with imagery left out by coverage are read from the cache, rather than built as empty tiles
+        cache_tileset["all tiles"] = tiles
+        cache_tileset["footprint bounds"] = footprint_bounds
+    if checkpoint:
+        # tiles seeded by an interrupted run don't need to be checked again
+        tiles = [tile for tile in tiles if not checkpoint.contains(tile, year)]
+    cache_tileset["tiles"] = cache.get_missing_tile_images(tiles, year) if cache else tiles
+    return cache_tileset
+
+
+def _seed_cache_tilesets(
+    cache_tilesets: list[dict],
+    batch_size: int,
+    local: bool,
+    workers: int | None,
+    checkpoint: SeedCheckpoint | None,
+    max_concurrency: int,
+):
+    for cache_tileset in cache_tilesets:
+        info_msg = (
+            f"start seeding year: {cache_tileset['year']}, zoom: {cache_tileset['zoom']}, tiles: "
+            f"{len(cache_tileset['tiles'])}"
+        )
+        logger.info(info_msg)
+        if local:
+            # rendering stack & worker pool are only loaded when seeding locally
+            from src.tile_server.seed import seed_tiles
+
+            seed_tiles(cache_tileset["tiles"], cache_tileset["year"], workers)
+        elif batch_size:
+            _seed_tiles_by_year_batched(
+                cache_tileset["tiles"], cache_tileset["year"], batch_size, checkpoint=checkpoint
+            )
+        else:
+            _seed_tiles_by_year(cache_tileset["tiles"], cache_tileset["year"], checkpoint, max_concurrency)
 
-    async def _invoke_get_naip_tile_lambda(session: aiohttp.ClientSession, tile: mercantile.Tile, year: int):
-        url = f"{naip_tile_api_base_uri}/{year}/{tile.z}/{tile.y}/{tile.x}"
-        await session.request("GET", url=url)
-
-    async def _seed_tiles_runner(batch_size: int = 500):
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
-            pbar = tqdm(total=len(tiles))
-            batches = math.ceil(len(tiles) / batch_size)
-            for batch in range(batches):
-                batch_tiles = tiles[(batch * batch_size) : (batch * batch_size) + batch_size]
-                tasks = []
-                for t in batch_tiles:
-                    task = asyncio.create_task(_invoke_get_naip_tile_lambda(session=session, tile=t, year=year))
-                    task.tile = t
-                    tasks.append(task)
-
-                while tasks:
-                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                    for t in done:
-                        try:
-                            _ = await t
-                        except TimeoutError:
-                            tqdm.write(f"TimeoutError happened while processing {t.tile}")
-                        except Exception:
-                            tqdm.write(f"{traceback.format_exc()} happened while processing {t.tile}")
-                        pbar.update(1)
-
-            pbar.close()
-
-    asyncio.run(_seed_tiles_runner())
+
+def _seed_pyramids(cache_tilesets: list[dict], workers: int | None):
+    # rendering stack & worker pool are only loaded when seeding locally
+    from src.tile_server.seed import seed_pyramid
+
+    for year in dict.fromkeys(cache_tileset["year"] for cache_tileset in cache_tilesets):
+        year_tilesets = [cache_tileset for cache_tileset in cache_tilesets if cache_tileset["year"] == year]
+        if not any(cache_tileset["tiles"] for cache_tileset in year_tilesets):
+            logger.info(f"no missing tiles for year: {year}")
+            continue
+        tiles = [tile for cache_tileset in year_tilesets for tile in cache_tileset["all tiles"]]
+        logger.info(f"start building pyramid of year: {year}, tiles: {len(tiles)}")
+        seed_pyramid(tiles, year, workers, footprint_bounds=year_tilesets[0]["footprint bounds"])
+
+
+def _export_s3_tiles_by_year(
+    bucket: str, year: int, mbtiles_cache: MBTilesTileCache, workers: int, batch_size: int = 1000
+) -> int:
+    s3_client = resources.get_s3_client()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = [
+        obj["Key"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{year}/")
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(".png")
+    ]
+
+    def _get_s3_tile(key: str):
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        _, z, y, x = key.split("/")
+        tile = mercantile.Tile(int(x.split(".")[0]), int(y), int(z))
+        return tile, response["Body"].read(), response.get("Metadata", {}).get("is_rescaled") == "true"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=len(keys)) as pbar:
+        for batch in range(math.ceil(len(keys) / batch_size)):
+            batch_keys = keys[(batch * batch_size) : (batch * batch_size) + batch_size]
+            with mbtiles_cache.batch():
+                for tile, image_bytes, is_rescaled in executor.map(_get_s3_tile, batch_keys):
+                    mbtiles_cache.save_tile_bytes(tile, year, image_bytes, is_rescaled)
+                    pbar.update(1)
+
+    return len(keys)
+
+
+def _get_tile_cache_bucket(bucket: str | None) -> str:
+    if bucket:
+        return bucket
+    if not get_is_stack_deployed():
+        raise click.ClickException("Stack not deployed to AWS. Use --bucket to specify S3 tile cache bucket")
+    return get_stack_output_value("TileCacheBucket")
+
+
+def _cache_summary_df(cached_tiles) -> pl.DataFrame:
+    return pl.DataFrame(
+        [
+            {
+                "Year": year,
+                "Zoom Level": zoom,
+                "Tiles": zoom_summary["tiles"],
+                "Blank Tiles": zoom_summary["blank tiles"],
+                "MB": round(zoom_summary["bytes"] / 1024**2, 2),
+            }
+            for (year, zoom), zoom_summary in summarize_cached_tiles(cached_tiles).items()
+        ]
+    )
 
 
 def _validate_coverage(_ctx, _param, value):
@@ -72,10 +236,22 @@ def _validate_coverage(_ctx, _param, value):
         raise click.BadParameter("Error parsing coverage_wkt to geometry")
 
 
-def _seed_preflight_check(from_zoom, to_zoom, _years, _coverage, dry_run):
+def _seed_preflight_check(from_zoom, to_zoom, _years, _coverage, dry_run, local=False, pyramid=False, checkpoint=None):
     if from_zoom > to_zoom:
         raise click.BadParameter("from_zoom must be less that to_zoom")
 
+    if pyramid and not local:
+        raise click.BadParameter("--pyramid requires --local")
+
+    if checkpoint and local:
+        raise click.BadParameter("--checkpoint can't be used with --local")
+
+    if local:
+        # tiles are rendered on this machine, straight into the tile cache configured by env vars
+        if not dry_run and not TileServerConfig.from_env().tile_cache:
+            raise click.ClickException("No tile cache configured (TILE_CACHE_BUCKET, TILE_CACHE_BACKEND...)")
+        return
+
     if not dry_run and not get_is_stack_deployed():
         if not get_is_stack_deployed():
             msg = "Stack not deployed to AWS. If this is expected, try running with --dry_run flag"
@@ -109,11 +285,43 @@ def cache():
     help="WKT geometry (WGS84) of ground area to cache tiles for",
 )
 @click.option("--dry-run", is_flag=True, help="Only print summary of how many tiles would be cached")
-def seed(from_zoom, to_zoom, years, coverage, dry_run):
+@click.option(
+    "--batch-size",
+    type=click.IntRange(0, BATCH_MAX_TILES),
+    default=0,
+    help="Render this many tiles per (direct) Lambda invocation, 0 to request tiles one by one through the HTTP API",
+)
+@click.option(
+    "--local",
+    is_flag=True,
+    help="Render tiles with a pool of processes on this machine, straight into the tile cache configured by env vars",
+)
+@click.option("--workers", type=click.IntRange(min=1), help="With --local, number of render worker processes")
+@click.option(
+    "--pyramid",
+    is_flag=True,
+    help="With --local, render to_zoom only and build lower zoom levels by downsampling in memory, in one sweep",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="File seeded tiles are recorded in, so an interrupted seed resumes where it stopped (not with --local)",
+)
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    default=256,
+    show_default=True,
+    help="Max number of concurrent HTTP API requests, adapted to what the API can take",
+)
+def seed(
+    from_zoom, to_zoom, years, coverage, dry_run, batch_size, local, workers, pyramid, checkpoint, max_concurrency
+):
     """Seed Tile Cache for specific areas/years."""
-    _seed_preflight_check(from_zoom, to_zoom, years, coverage, dry_run)
+    _seed_preflight_check(from_zoom, to_zoom, years, coverage, dry_run, local, pyramid, checkpoint)
 
     cache = TileServerConfig.from_env().tile_cache
+    checkpoint = SeedCheckpoint(checkpoint) if checkpoint else None
     cache_tilesets = []
 
     for year in years:
@@ -122,23 +330,13 @@ def seed(from_zoom, to_zoom, years, coverage, dry_run):
         if not tileable_geotiffs:
             continue
 
-        tileable_geotiff_coverage = union_all([gt.get_extent() for gt in tileable_geotiffs])
+        # only tiles intersecting imagery (and coverage) are seeded - tiles in gaps between geotiffs would be blank
+        footprint_bounds = np.array([(gt.min_x, gt.min_y, gt.max_x, gt.max_y) for gt in tileable_geotiffs])
 
         # cache zoom levels in descending order to maximize downscaling of existing tiles
         for zoom in sorted(range(from_zoom, to_zoom + 1), reverse=True):
-            west, south, east, north = tileable_geotiff_coverage.bounds
-            tiles = []
-            for tile in mercantile.tiles(west, south, east, north, zooms=zoom):
-                tile_bounds = bbox_to_box(mercantile.bounds(tile))
-                if not coverage or coverage.intersects(tile_bounds):
-                    tiles.append(tile)
-
-            cache_tileset = {"year": year, "zoom": zoom, "total tiles": len(tiles)}
-            if cache:
-                cache_tileset["tiles"] = cache.get_missing_tile_images(tiles, year)
-            else:
-                cache_tileset["tiles"] = tiles
-            cache_tilesets.append(cache_tileset)
+            tiles = enumerate_tiles(footprint_bounds, zoom, coverage)
+            cache_tilesets.append(_get_cache_tileset(tiles, year, zoom, cache, checkpoint, pyramid, footprint_bounds))
 
     cache_summary_df = pl.DataFrame(
         [
@@ -155,11 +353,94 @@ def seed(from_zoom, to_zoom, years, coverage, dry_run):
 
     logger.info(f"Cache Summary:\n{cache_summary_df}")
 
-    if not dry_run:
-        for cache_tileset in cache_tilesets:
-            info_msg = (
-                f"start seeding year: {cache_tileset['year']}, zoom: {cache_tileset['zoom']}, tiles: "
-                f"{len(cache_tileset['tiles'])}"
-            )
-            logger.info(info_msg)
-            _seed_tiles_by_year(cache_tileset["tiles"], cache_tileset["year"])
+    if dry_run:
+        return
+    if pyramid:
+        _seed_pyramids(cache_tilesets, workers)
+    else:
+        _seed_cache_tilesets(cache_tilesets, batch_size, local, workers, checkpoint, max_concurrency)
+    if checkpoint:
+        checkpoint.close()
+
+
+@cache.command(name="export-mbtiles")
+@click.option(
+    "--output-dir",
+    required=True,
+    type=click.Path(file_okay=False),
+    help="Directory MBTiles files (one per year) are written to",
+)
+@click.option("--years", "-y", type=int, multiple=True, required=True, help="NAIP years to export")
+@click.option("--bucket", help="S3 tile cache bucket to export from, defaults to TileCacheBucket of deployed stack")
+@click.option("--workers", type=int, default=32, help="Number of parallel S3 reads")
+def export_mbtiles(output_dir, years, bucket, workers):
+    """Export S3 Tile Cache to MBTiles files."""
+    bucket = _get_tile_cache_bucket(bucket)
+    mbtiles_cache = MBTilesTileCache(output_dir)
+    try:
+        for year in years:
+            logger.info(f"start exporting year: {year} from bucket: {bucket}")
+            exported_tiles = _export_s3_tiles_by_year(bucket, year, mbtiles_cache, workers)
+            logger.info(f"exported {exported_tiles} tiles to {mbtiles_cache.get_path(year)}")
+    finally:
+        mbtiles_cache.close()
+
+
+@cache.command(name="compact-bundles")
+@click.option("--years", "-y", type=int, multiple=True, help="NAIP years to compact, defaults to all years")
+@click.option("--bucket", help="S3 tile cache bucket, defaults to TileCacheBucket of deployed stack")
+@click.option("--bundle-size", type=int, default=128, help="Bundle size (TILE_CACHE_BUNDLE_SIZE) of the tile cache")
+def compact_bundles(years, bucket, bundle_size):
+    """Merge loose tiles of a bundled S3 Tile Cache into their bundles."""
+    bundle_cache = S3BundleTileCache(_get_tile_cache_bucket(bucket), bundle_size=bundle_size)
+    for year in years or [None]:
+        merged_tiles = bundle_cache.compact(year)
+        logger.info(f"merged {merged_tiles} tiles into bundles of year: {year or 'all'}")
+
+
+@cache.command()
+@click.option("--years", "-y", type=int, multiple=True, required=True, help="NAIP years to summarize")
+@click.option("--bucket", help="S3 tile cache bucket, defaults to TileCacheBucket of deployed stack")
+@click.option("--workers", type=int, default=32, help="Number of parallel S3 list requests")
+def stats(years, bucket, workers):
+    """Print number & size of cached tiles per year/zoom level."""
+    bucket = _get_tile_cache_bucket(bucket)
+    cached_tiles = [cached_tile for year in years for cached_tile in list_cached_tiles(bucket, year, workers)]
+    logger.info(f"Cache Stats:\n{_cache_summary_df(cached_tiles)}")
+
+
+@cache.command()
+@click.option("--years", "-y", type=int, multiple=True, required=True, help="NAIP years to prune")
+@click.option("--bucket", help="S3 tile cache bucket, defaults to TileCacheBucket of deployed stack")
+@click.option("--ttl", type=int, help="Prune tiles cached more than this many seconds ago")
+@click.option("--min_zoom", type=int, help="Prune tiles at or above this zoom level")
+@click.option("--max_zoom", type=int, help="Prune tiles at or below this zoom level")
+@click.option("--rescaled-only", is_flag=True, help="Prune only tiles created by rescaling other tiles")
+@click.option("--blank-only", is_flag=True, help="Prune only blank tiles (i.e. no NAIP imagery)")
+@click.option("--max_bytes", type=int, help="Also prune oldest tiles until each year takes up at most this many bytes")
+@click.option("--workers", type=int, default=8, help="Number of parallel S3 requests")
+@click.option("--dry-run", is_flag=True, help="Only print summary of tiles that would be pruned")
+def prune(years, bucket, ttl, min_zoom, max_zoom, rescaled_only, blank_only, max_bytes, workers, dry_run):
+    """Delete cached tiles matching a policy (tiles must match all given filters)."""
+    policy = CachePrunePolicy(
+        ttl=ttl,
+        min_zoom=min_zoom,
+        max_zoom=max_zoom,
+        rescaled_only=rescaled_only,
+        blank_only=blank_only,
+        max_bytes=max_bytes,
+    )
+    if not policy.has_filters and policy.max_bytes is None:
+        raise click.UsageError("At least one prune filter (or --max_bytes) is required")
+
+    bucket = _get_tile_cache_bucket(bucket)
+    prune_tiles = []
+    for year in years:
+        prune_tiles += select_tiles_to_prune(bucket, list_cached_tiles(bucket, year, workers), policy, workers=workers)
+    logger.info(f"Tiles to prune:\n{_cache_summary_df(prune_tiles)}")
+
+    if not dry_run and prune_tiles:
+        deleted_tiles, deleted_bytes = delete_cached_tiles(bucket, prune_tiles, workers=workers)
+        logger.info(f"pruned {deleted_tiles} tiles, reclaimed {deleted_bytes / 1024 ** 2:.2f} MB")
+        if deleted_tiles < len(prune_tiles):
+            logger.warning(f"failed to delete {len(prune_tiles) - deleted_tiles} tiles")
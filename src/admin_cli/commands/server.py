@@ -0,0 +1,26 @@
+import click
+
+
+@click.group
+def server():
+    """Standalone tile server related commands."""
+    pass
+
+
+@server.command()
+@click.option("--host", default="0.0.0.0", show_default=True, help="interface to listen on")
+@click.option("--port", default=8080, show_default=True, help="port to listen on")
+@click.option("--workers", type=click.IntRange(min=1), help="number of render worker processes [default: CPU count]")
+@click.option(
+    "--max-pending",
+    default=64,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="max number of tiles waiting to be rendered, before requests are turned away with a 503",
+)
+def start(host: str, port: int, workers: int | None, max_pending: int):
+    """Start a standalone tile server (outside of AWS Lambda), configured with the Lambda function's env vars."""
+    # aiohttp server & rendering stack are only loaded when the server is started
+    from src.tile_server.app import run
+
+    run(host, port, workers, max_pending)
@@ -1,18 +1,504 @@
+import base64
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
+from io import BytesIO
 
 import mercantile
 
 import src.utils.conversion as conversion
-import src.utils.naip as naip
+import src.utils.metrics as metrics
+import src.utils.resources as resources
+from src.utils import logger
 from src.utils.env import TileServerConfig
+from src.utils.lazy import lazy_import
+from src.utils.prefetch import queue_renders
+from src.utils.single_flight import SingleFlight
+from src.utils.tile_cache import (
+    BLANK_TILE_BYTES,
+    BLANK_TILE_ETAG,
+    RescalePlanner,
+    TileCache,
+    tile_etag,
+)
+
+# the rendering stack (rasterio/GDAL, polars, pyproj, shapely, NAIP index...) and PIL are only loaded on first cache
+# miss - cold starts of requests for cached tiles only import boto3
+naip = lazy_import("src.utils.naip")
+Image = lazy_import("PIL.Image")
+
+# concurrent requests (threads) for the same tile in this process share a single render
+_render_single_flight = SingleFlight()
+
+# max number of tiles rendered by a single batch invocation
+BATCH_MAX_TILES = 256
+
+# seconds left, after a render ran out of time, to build a fallback tile & respond
+RENDER_FALLBACK_SECONDS = 10
+
+# max (base64 encoded) response body - Lambda's 6 MB response payload limit, less room for the rest of the response
+MAX_RESPONSE_BODY_BYTES = 6 * 1024 * 1024 - 16 * 1024
 
 
-@lru_cache(maxsize=1)
 def _get_tile_server_config() -> TileServerConfig:
-    return TileServerConfig.from_env()
+    # created once per (warm) container, along with its tile cache - see src.utils.resources
+    return resources.registry.get("tile_server_config", TileServerConfig.from_env)
+
+
+@lru_cache(maxsize=1)
+def _get_cache_write_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-write")
+
+
+def _save_tile_bytes(
+    tile_cache: TileCache, tile: mercantile.Tile, year: int, image_bytes: bytes | None, release_lease: bool
+) -> None:
+    try:
+        if image_bytes:
+            tile_cache.save_tile_bytes(tile, year, image_bytes)
+        else:
+            tile_cache.handle_null_tile_image(tile, year)
+    finally:
+        if release_lease:
+            tile_cache.release_render_lease(tile, year)
+
+
+def _get_render_deadline(context: object, tile_server_config: TileServerConfig) -> float | None:
+    if tile_server_config.render_deadline <= 0:
+        return None
+    budget = tile_server_config.render_deadline
+    if context:
+        # leave time to build a fallback tile & respond before the function times out
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000 - RENDER_FALLBACK_SECONDS)
+    return time.monotonic() + budget
+
+
+def _get_cache_year(year: int | str) -> int | str:
+    # resolving "latest" needs the NAIP index - don't load it for other requests
+    return naip.get_cache_year(year) if year == "latest" else year
+
+
+def _get_degraded_tile_image(
+    tile: mercantile.Tile, year: int, tile_server_config: TileServerConfig, partial_image: Image, deadline: float
+) -> Image:
+    # the render ran out of time - serve the best approximation available (which isn't cached), and queue a full render
+    metrics.put_metric(metrics.RENDER_DEGRADED)
+    tile_cache = tile_server_config.tile_cache
+    if tile_server_config.render_function_name and tile_cache:
+        try:
+            queue_renders(tile_server_config.render_function_name, [tile], year)
+        except Exception as e:
+            logger.error(f"error queueing full render of tile {tile}: {e}")
+
+    if partial_image:
+        return partial_image
+    plan = RescalePlanner(tile_cache, respect_zoom_limits=False).plan(tile, year) if tile_cache else None
+    if plan:
+        return plan.execute()
+    try:
+        # the render deadline leaves RENDER_FALLBACK_SECONDS before the function times out - half of it to draft
+        return naip.get_tile_image(tile, year, deadline + RENDER_FALLBACK_SECONDS / 2, draft=True)
+    except naip.RenderDeadlineExceeded as e:
+        # a blank tile (which isn't cached either) rather than timing out
+        return e.image or Image.new("RGBA", (256, 256))
+
+
+def _render_tile_image(
+    tile: mercantile.Tile, year: int, tile_server_config: TileServerConfig, deadline: float | None
+) -> tuple[Image, bool]:
+    try:
+        render_start = time.perf_counter()
+        tile_image = naip.get_tile_image(tile, year, deadline)
+        metrics.put_metric(metrics.RENDER_TIME, (time.perf_counter() - render_start) * 1000, "Milliseconds")
+        return tile_image, True
+    except naip.RenderDeadlineExceeded as e:
+        return _get_degraded_tile_image(tile, year, tile_server_config, e.image, deadline), False
+
+
+def _render_and_cache_tile_image(
+    tile: mercantile.Tile, year: int, tile_server_config: TileServerConfig, deadline: float | None = None
+) -> tuple[Image, bytes | None, Future | None]:
+    tile_cache = tile_server_config.tile_cache
+    lease_ttl = tile_server_config.render_lease_ttl
+    has_lease = not lease_ttl or tile_cache.acquire_render_lease(tile, year, lease_ttl)
+    if not has_lease:
+        # another invocation is rendering this tile - wait for it, or serve an approximation from a cached ancestor
+        image_bytes = tile_cache.wait_for_tile_bytes(tile, year, tile_server_config.render_lease_wait)
+        if image_bytes:
+            return None, image_bytes, None
+        plan = RescalePlanner(tile_cache, respect_zoom_limits=False).plan(tile, year)
+        if plan:
+            return plan.execute(), None, None
+
+    release_lease = bool(lease_ttl and has_lease)
+    try:
+        tile_image, is_final = _render_tile_image(tile, year, tile_server_config, deadline)
+        # tiles are cached as PNG - encode once, and reuse the encoded tile for the response where possible
+        image_bytes = conversion.img_to_bytes(tile_image, "PNG") if tile_image and is_final else None
+    except BaseException:
+        if release_lease:
+            tile_cache.release_render_lease(tile, year)
+        raise
+
+    if not is_final:
+        # degraded tiles aren't cached
+        if release_lease:
+            tile_cache.release_render_lease(tile, year)
+        return tile_image, None, None
+
+    # recorded up front - metrics are only collected in the request's thread, not in the cache write thread
+    metrics.put_metric(metrics.BYTES_WRITTEN, len(image_bytes or BLANK_TILE_BYTES), "Bytes")
+    if tile_server_config.cache_write_behind:
+        cache_write = _get_cache_write_executor().submit(
+            _save_tile_bytes, tile_cache, tile, year, image_bytes, release_lease
+        )
+        return tile_image, image_bytes, cache_write
+    _save_tile_bytes(tile_cache, tile, year, image_bytes, release_lease)
+    return tile_image, image_bytes, None
+
+
+def _encode_response_body(tile_image: Image, image_bytes: bytes | None, image_format: str) -> bytes:
+    if image_bytes and image_format == "PNG":
+        return base64.b64encode(image_bytes)
+    if not tile_image:
+        tile_image = Image.open(BytesIO(image_bytes))
+    return conversion.img_to_b64(tile_image, image_format)
+
+
+def _wait_for_cache_write(cache_write: Future | None) -> None:
+    if not cache_write:
+        return
+    try:
+        cache_write.result()
+    except Exception as e:
+        # the tile was rendered fine - still serve it, it will just be rendered again on next request
+        logger.error(f"error writing tile to cache: {e}")
+
+
+def _queue_prefetch(tile: mercantile.Tile, year: int, tile_server_config: TileServerConfig) -> Future | None:
+    prefetcher = tile_server_config.prefetcher
+    if not prefetcher:
+        return None
+    tiles = prefetcher.select(tile, year, tile_server_config.max_zoom)
+    if not tiles:
+        return None
+    metrics.put_metric(metrics.PREFETCH_QUEUED, len(tiles))
+    # queued (i.e. lambda invoked) while the tile is served
+    return _get_cache_write_executor().submit(prefetcher.queue, tiles, year)
+
+
+def _wait_for_prefetch(prefetch: Future | None) -> None:
+    if not prefetch:
+        return
+    try:
+        prefetch.result()
+    except Exception as e:
+        # prefetching is best effort
+        logger.error(f"error queueing prefetch: {e}")
+
+
+def _format_etag(etag: str, image_format: str) -> str:
+    # etags are computed from cached (PNG) tiles - tiles served in another format are another representation
+    return f'"{etag}"' if image_format == "PNG" else f'"{etag}-{image_format.lower()}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    return etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+
+
+def _get_not_modified_response(tile: mercantile.Tile, etag: str, tile_server_config: TileServerConfig) -> dict:
+    metrics.put_metric(metrics.NOT_MODIFIED)
+    is_empty = etag == BLANK_TILE_ETAG
+    return {
+        "statusCode": 304,
+        "headers": {
+            "ETag": _format_etag(etag, tile_server_config.image_format),
+            "Cache-Control": tile_server_config.get_cache_control(tile.z, is_empty),
+        },
+        "body": None,
+        "isBase64Encoded": False,
+    }
+
+
+def _get_redirect_response(
+    tile: mercantile.Tile, year: int, etag: str, tile_server_config: TileServerConfig
+) -> dict | None:
+    cache_control = tile_server_config.get_cache_control(tile.z, etag == BLANK_TILE_ETAG)
+    url = tile_server_config.tile_cache.get_tile_url(
+        tile,
+        year,
+        base_url=tile_server_config.cache_redirect_base_url,
+        expires_in=tile_server_config.cache_redirect_expires,
+        cache_control=cache_control,
+    )
+    if not url:
+        return None
+
+    metrics.put_metric(metrics.CACHE_REDIRECT)
+    if not tile_server_config.cache_redirect_base_url:
+        # clients must not reuse a presigned url after it expires
+        cache_control = f"private, max-age={tile_server_config.cache_redirect_expires // 2}"
+    return {
+        "statusCode": 302,
+        "headers": {"Location": url, "Cache-Control": cache_control},
+        "body": None,
+        "isBase64Encoded": False,
+    }
+
+
+def _get_etag_response(
+    tile: mercantile.Tile, year: int, tile_server_config: TileServerConfig, if_none_match: str | None
+) -> dict | None:
+    # only the cached tile's etag is looked up (e.g. a HEAD request), not the tile itself
+    etag = tile_server_config.tile_cache.get_tile_etag(tile, year)
+    if not etag:
+        return None
+    if if_none_match and _etag_matches(if_none_match, _format_etag(etag, tile_server_config.image_format)):
+        return _get_not_modified_response(tile, etag, tile_server_config)
+    if tile_server_config.cache_redirect:
+        return _get_redirect_response(tile, year, etag, tile_server_config)
+    return None
+
+
+def _get_tile_image_response(
+    tile: mercantile.Tile, tile_image: Image, image_bytes: bytes | None, tile_server_config: TileServerConfig
+) -> dict:
+    if not tile_image and not image_bytes:
+        return {
+            "statusCode": 404,
+            "headers": {"Cache-Control": tile_server_config.get_cache_control(tile.z, is_empty=True)},
+            "body": None,
+            "isBase64Encoded": False,
+        }
+
+    headers = {"Content-Type": f"image/{tile_server_config.image_format.lower()}"}
+    if image_bytes:
+        headers["ETag"] = _format_etag(tile_etag(image_bytes), tile_server_config.image_format)
+        headers["Cache-Control"] = tile_server_config.get_cache_control(tile.z, image_bytes == BLANK_TILE_BYTES)
+    else:
+        # approximate tile (i.e. exact tile being rendered elsewhere, or render ran out of time) - clients shouldn't
+        # keep it
+        headers["Cache-Control"] = "no-cache"
+        headers["X-Tile-Degraded"] = "true"
+    return {
+        "statusCode": 200,
+        "headers": headers,
+        "body": _encode_response_body(tile_image, image_bytes, tile_server_config.image_format),
+        "isBase64Encoded": True,
+    }
+
+
+def _get_cached_tile_response(
+    tile: mercantile.Tile, year: int, tile_server_config: TileServerConfig, if_none_match: str | None = None
+) -> dict | None:
+    tile_cache = tile_server_config.tile_cache
+    if not tile_cache:
+        return None
+    if if_none_match or tile_server_config.cache_redirect:
+        etag_response = _get_etag_response(tile, year, tile_server_config, if_none_match)
+        if etag_response:
+            return etag_response
+
+    # cached tiles are served without being decoded
+    image_bytes = tile_cache.get_tile_image_bytes(tile, year)
+    return _get_tile_image_response(tile, None, image_bytes, tile_server_config) if image_bytes else None
+
+
+def _get_tile_response(
+    tile: mercantile.Tile,
+    year: int,
+    tile_server_config: TileServerConfig,
+    if_none_match: str | None = None,
+    deadline: float | None = None,
+) -> dict:
+    cached_tile_response = _get_cached_tile_response(tile, year, tile_server_config, if_none_match)
+    if cached_tile_response:
+        return cached_tile_response
+
+    cache_write = None
+    if tile_server_config.tile_cache:
+        tile_image, image_bytes, cache_write = _render_single_flight.do(
+            (tile, year), _render_and_cache_tile_image, tile, year, tile_server_config, deadline
+        )
+        if tile_image:
+            metrics.put_metric(metrics.CACHE_MISS_RENDER)
+        elif image_bytes:
+            # rendered & cached by another invocation, while this one waited for it
+            metrics.put_metric(metrics.CACHE_HIT)
+        else:
+            metrics.put_metric(metrics.CACHE_MISS_EMPTY)
+    else:
+        tile_image, is_final = _render_tile_image(tile, year, tile_server_config, deadline)
+        image_bytes = conversion.img_to_bytes(tile_image, "PNG") if tile_image and is_final else None
+
+    # the cache write (if any) runs in the background while the response body is encoded
+    response = _get_tile_image_response(tile, tile_image, image_bytes, tile_server_config)
+
+    # lambda freezes the container once the handler returns - the cache write must finish before then
+    _wait_for_cache_write(cache_write)
+    return response
+
+
+def _parse_batch_tiles(event: dict) -> list[mercantile.Tile] | None:
+    if "tile_range" in event:
+        tile_range = event["tile_range"]
+        z = conversion.val_to_type(tile_range.get("z"), int)
+        min_x, max_x, min_y, max_y = [
+            conversion.val_to_type(tile_range.get(k), int) for k in ("min_x", "max_x", "min_y", "max_y")
+        ]
+        if None in (z, min_x, max_x, min_y, max_y):
+            return None
+        return [mercantile.Tile(x, y, z) for y in range(min_y, max_y + 1) for x in range(min_x, max_x + 1)]
+
+    tiles = []
+    for t in event.get("tiles") or []:
+        x, y, z = [conversion.val_to_type(t.get(k), int) for k in ("x", "y", "z")]
+        if None in (x, y, z):
+            return None
+        tiles.append(mercantile.Tile(x, y, z))
+    return tiles
+
+
+def _render_batch(
+    tiles: list[mercantile.Tile], year: int, tile_server_config: TileServerConfig, deadline: float
+) -> dict:
+    # tiles not rendered before deadline (e.g. lambda function about to time out) are skipped
+    statuses = {tile: "skipped" for tile in tiles}
+    cache_writes = {}
+    tile_cache = tile_server_config.tile_cache
+    for tile, tile_image in naip.get_tile_images(tiles, year):
+        if time.monotonic() > deadline:
+            break
+        statuses[tile] = "rendered" if tile_image else "empty"
+        metrics.put_metric(metrics.CACHE_MISS_RENDER if tile_image else metrics.CACHE_MISS_EMPTY)
+        if tile_cache:
+            image_bytes = conversion.img_to_bytes(tile_image, "PNG") if tile_image else None
+            metrics.put_metric(metrics.BYTES_WRITTEN, len(image_bytes or BLANK_TILE_BYTES), "Bytes")
+            # next tile is rendered while this one is written
+            cache_writes[tile] = _get_cache_write_executor().submit(
+                _save_tile_bytes, tile_cache, tile, year, image_bytes, False
+            )
+
+    for tile, cache_write in cache_writes.items():
+        try:
+            cache_write.result()
+        except Exception as e:
+            logger.error(f"error writing tile {tile} to cache: {e}")
+            statuses[tile] = "error"
+    return statuses
+
+
+def _get_cached_statuses(tiles: list[mercantile.Tile], year: int, tile_server_config: TileServerConfig) -> dict:
+    tile_cache = tile_server_config.tile_cache
+    is_cached = _get_cache_write_executor().map(lambda t: tile_cache.contains_tile_image(t, year), tiles)
+    return {tile: "cached" for tile, cached in zip(tiles, list(is_cached)) if cached}
+
+
+def _handle_batch(event: dict, context: object, tile_server_config: TileServerConfig) -> dict:
+    # leave time to finish writing the tile being rendered & respond
+    remaining_seconds = context.get_remaining_time_in_millis() / 1000 if context else 900
+    deadline = time.monotonic() + remaining_seconds - 10
+    year = conversion.val_to_year(event.get("year"))
+    tiles = _parse_batch_tiles(event)
+    if not year or not tiles or len(tiles) > BATCH_MAX_TILES:
+        return {"statusCode": 400, "body": None, "isBase64Encoded": False}
+    year = _get_cache_year(year)
 
+    statuses = {
+        tile: "invalid"
+        for tile in tiles
+        if tile.z < tile_server_config.min_zoom or tile.z > tile_server_config.max_zoom
+    }
+    if event.get("skip_cached") and tile_server_config.tile_cache:
+        # e.g. prefetched tiles - only render tiles not cached yet
+        statuses.update(_get_cached_statuses([t for t in tiles if t not in statuses], year, tile_server_config))
+    with metrics.collect_metrics(tile_server_config.metrics_namespace):
+        statuses.update(_render_batch([t for t in tiles if t not in statuses], year, tile_server_config, deadline))
 
-def handler(event: dict, _context: object) -> dict:
+    summary = {
+        "year": year,
+        "tiles": [{"x": t.x, "y": t.y, "z": t.z, "status": statuses[t]} for t in tiles],
+        "counts": {status: list(statuses.values()).count(status) for status in set(statuses.values())},
+    }
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(summary),
+        "isBase64Encoded": False,
+    }
+
+
+def _parse_bbox(val: str | list | None) -> tuple[float, float, float, float] | None:
+    try:
+        bbox = tuple(float(v) for v in (val.split(",") if isinstance(val, str) else val))
+    except (TypeError, ValueError):
+        return None
+    if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        return None
+    return bbox
+
+
+def _parse_image_request(event: dict, tile_server_config: TileServerConfig) -> dict | None:
+    # image parameters are path/query string parameters when invoked through gateway api, event properties otherwise
+    params = {**event, **(event.get("pathParameters") or {}), **(event.get("queryStringParameters") or {})}
+    image_request = {
+        "bbox": _parse_bbox(params.get("bbox")),
+        "year": conversion.val_to_year(params.get("year")),
+        "width": conversion.val_to_type(params.get("width"), int),
+        "height": conversion.val_to_type(params.get("height"), int),
+        "epsg": conversion.val_to_type(params.get("epsg", 3857), int),
+    }
+    if not all(image_request.values()):
+        return None
+    if not 0 < image_request["width"] <= tile_server_config.image_max_size:
+        return None
+    if not 0 < image_request["height"] <= tile_server_config.image_max_size:
+        return None
+    return image_request
+
+
+def _handle_image(event: dict, context: object, tile_server_config: TileServerConfig) -> dict:
+    image_request = _parse_image_request(event, tile_server_config)
+    if not image_request:
+        return {"statusCode": 400, "body": None, "isBase64Encoded": False}
+
+    with metrics.collect_metrics(tile_server_config.metrics_namespace):
+        try:
+            render_start = time.perf_counter()
+            image = naip.get_image(
+                **image_request,
+                max_geotiffs=tile_server_config.image_max_geotiffs,
+                deadline=_get_render_deadline(context, tile_server_config),
+            )
+            metrics.put_metric(metrics.RENDER_TIME, (time.perf_counter() - render_start) * 1000, "Milliseconds")
+        except ValueError as e:
+            logger.error(f"invalid image request {image_request}: {e}")
+            return {"statusCode": 400, "body": None, "isBase64Encoded": False}
+        except naip.RenderDeadlineExceeded:
+            # unlike tiles, a partial image isn't a useful approximation of the image requested
+            metrics.put_metric(metrics.RENDER_DEGRADED)
+            return {"statusCode": 504, "body": None, "isBase64Encoded": False}
+
+    if not image:
+        return {"statusCode": 404, "body": None, "isBase64Encoded": False}
+    body = conversion.img_to_b64(image, tile_server_config.image_format)
+    if len(body) > MAX_RESPONSE_BODY_BYTES:
+        # returned as is, Lambda would fail the invocation - and API Gateway answer with an opaque 502
+        logger.error(f"image {image_request} too large to return: {len(body)} bytes encoded")
+        return {"statusCode": 413, "body": None, "isBase64Encoded": False}
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": f"image/{tile_server_config.image_format.lower()}"},
+        "body": body,
+        "isBase64Encoded": True,
+    }
+
+
+def handler(event: dict, context: object) -> dict:
     """NAIP slippy map tile AWS Lambda function handler.
 
     https://docs.aws.amazon.com/lambda/latest/dg/python-handler.html
@@ -25,10 +511,14 @@ def handler(event: dict, _context: object) -> dict:
         when lambda function invoked through gateway api - event.pathParameters should
         have x,y,z,year properties.  when lambda invoked directly (e.g. through boto3),
         event dict itself should have x,y,z,year properties
-    _context: object
+
+        year can also be a year range (e.g. "2016-2021") or "latest" (all years), for tiles composited from the
+        newest imagery available for each pixel.  such tiles are cached under the range instead of a year ("latest"
+        under the range of years in the NAIP index)
+    context: object
         information about the invocation, function, and execution environment
 
-        not used anywhere in this function
+        used to stop rendering before the function times out
 
     Returns
     -------
@@ -39,14 +529,30 @@ def handler(event: dict, _context: object) -> dict:
         if getting tile wasn't successful - statusCode will be something other than 200
         (depending on reason why tile wasn't successful) and body will be null
 
+        in batch mode (event has a year and either a "tiles" list of x,y,z dicts, or a "tile_range" dict with z,
+        min_x, max_x, min_y, max_y properties), up to BATCH_MAX_TILES tiles are rendered and saved to the tile cache.
+        with "skip_cached": true, tiles already cached aren't rendered again.  body is a json summary with a status
+        (rendered, empty, cached, invalid, skipped or error) per tile
+
+        in image mode (event, or the query string when invoked through gateway api, has a "bbox" of
+        "left,bottom,right,top", a width, a height and optionally an epsg - 3857 by default), a single image of the
+        bounding box is returned.  width & height are limited to IMAGE_MAX_SIZE pixels, and the bounding box to
+        IMAGE_MAX_GEOTIFFS NAIP geotiffs (statusCode 400 otherwise).  images too large to return once encoded get a
+        statusCode 413
+
     """
+    if "tiles" in event or "tile_range" in event:
+        return _handle_batch(event, context, _get_tile_server_config())
+    if "bbox" in event or "bbox" in (event.get("queryStringParameters") or {}):
+        return _handle_image(event, context, _get_tile_server_config())
+
     if "pathParameters" in event:
-        year = conversion.val_to_type(event["pathParameters"].get("year"), int)
+        year = conversion.val_to_year(event["pathParameters"].get("year"))
         x = conversion.val_to_type(event["pathParameters"].get("x"), int)
         y = conversion.val_to_type(event["pathParameters"].get("y"), int)
         z = conversion.val_to_type(event["pathParameters"].get("z"), int)
     else:
-        year = conversion.val_to_type(event.get("year"), int)
+        year = conversion.val_to_year(event.get("year"))
         x = conversion.val_to_type(event.get("x"), int)
         y = conversion.val_to_type(event.get("y"), int)
         z = conversion.val_to_type(event.get("z"), int)
@@ -58,25 +564,17 @@ def handler(event: dict, _context: object) -> dict:
     if z < tile_server_config.min_zoom or z > tile_server_config.max_zoom:
         return {"statusCode": 400, "body": None, "isBase64Encoded": False}
 
+    headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
     tile = mercantile.Tile(x, y, z)
-    if tile_server_config.tile_cache:
-        tile_image = tile_server_config.tile_cache.get_tile_image(tile, year)
-        if not tile_image:
-            tile_image = naip.get_tile_image(tile, year)
-            if tile_image:
-                tile_server_config.tile_cache.save_tile_image(tile, year, tile_image)
-            else:
-                tile_server_config.tile_cache.handle_null_tile_image(tile, year)
-    else:
-        tile_image = naip.get_tile_image(tile, year)
-
-    if tile_image:
-        b64_tile = conversion.img_to_b64(tile_image, tile_server_config.image_format)
-        return {
-            "statusCode": 200,
-            "headers": {"Content-Type": f"image/{tile_server_config.image_format.lower()}"},
-            "body": b64_tile,
-            "isBase64Encoded": True,
-        }
-    else:
-        return {"statusCode": 404, "body": None, "isBase64Encoded": False}
+    year = _get_cache_year(year)
+    with metrics.collect_metrics(tile_server_config.metrics_namespace, Zoom=z):
+        prefetch = _queue_prefetch(tile, year, tile_server_config)
+        response = _get_tile_response(
+            tile,
+            year,
+            tile_server_config,
+            headers.get("if-none-match"),
+            _get_render_deadline(context, tile_server_config),
+        )
+        _wait_for_prefetch(prefetch)
+        return response
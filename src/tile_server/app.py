@@ -0,0 +1,228 @@
+import asyncio
+import base64
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import mercantile
+from aiohttp import web
+
+import src.lambda_functions.get_naip_tile as get_naip_tile
+import src.utils.conversion as conversion
+import src.utils.metrics as metrics
+from src.utils import logger
+
+
+def _init_render_worker() -> None:
+    # runs once per worker process - load the rendering stack (NAIP index, rasterio/GDAL) & tile cache up front, and
+    # make the GDAL options the worker's default environment.  each render still opens its own rasterio.Env (with the
+    # requester pays session), GDAL's block & HTTP caches are process-wide so they stay warm across renders
+    import rasterio.env
+
+    import src.utils.naip as naip
+
+    rasterio.env.defenv(**naip.GDAL_ENV_OPTIONS)
+    get_naip_tile._get_tile_server_config()
+
+
+def _render_tile(tile: mercantile.Tile, year: int) -> dict:
+    tile_server_config = get_naip_tile._get_tile_server_config()
+    with metrics.collect_metrics(tile_server_config.metrics_namespace, Zoom=tile.z):
+        deadline = get_naip_tile._get_render_deadline(None, tile_server_config)
+        return get_naip_tile._get_tile_response(tile, year, tile_server_config, deadline=deadline)
+
+
+def _render_image(event: dict) -> dict:
+    return get_naip_tile._handle_image(event, None, get_naip_tile._get_tile_server_config())
+
+
+def _get_cached_tile_response(tile: mercantile.Tile, year: int, if_none_match: str | None) -> dict | None:
+    tile_server_config = get_naip_tile._get_tile_server_config()
+    with metrics.collect_metrics(tile_server_config.metrics_namespace, Zoom=tile.z):
+        return get_naip_tile._get_cached_tile_response(tile, year, tile_server_config, if_none_match)
+
+
+def _to_web_response(response: dict) -> web.Response:
+    body = response.get("body")
+    if body and response.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    return web.Response(status=response["statusCode"], headers=response.get("headers"), body=body)
+
+
+class TileServer:
+    """Standalone tile server, serving the same tiles (& tile cache) as the NAIP tile Lambda function.
+
+    Requests are handled by an asyncio event loop: cached tiles are looked up on a thread pool, while tiles that have
+    to be rendered are sent to a pool of worker processes (rendering is CPU bound).  Concurrent requests for the same
+    tile share a single render, and once max_pending tiles are waiting to be rendered, requests for other tiles are
+    turned away with a 503 instead of queueing up without bound.
+    """
+
+    def __init__(self, workers: int | None = None, max_pending: int = 64, render_executor: Executor | None = None):
+        """Initialize TileServer.
+
+        Parameters
+        ----------
+        workers: int | None
+            number of render worker processes, defaults to number of CPUs
+        max_pending: int
+            max number of tiles waiting to be (or being) rendered
+        render_executor: Executor | None
+            executor tiles are rendered with, defaults to a pool of worker processes
+        """
+        self.max_pending = max_pending
+        self._render_executor = render_executor or ProcessPoolExecutor(
+            max_workers=workers,
+            # forking a process with live boto3/GDAL threads isn't safe - start workers from scratch
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
+        )
+        self._lookup_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="tile-lookup")
+        self._renders: dict[tuple[mercantile.Tile, int], asyncio.Future] = {}
+        self._image_renders = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of tiles (and images) waiting to be (or being) rendered."""
+        return len(self._renders) + self._image_renders
+
+    async def _render(self, tile: mercantile.Tile, year: int) -> dict | None:
+        key = (tile, year)
+        render = self._renders.get(key)
+        if render is None:
+            if self.pending >= self.max_pending:
+                return None
+            loop = asyncio.get_running_loop()
+            render = asyncio.ensure_future(loop.run_in_executor(self._render_executor, _render_tile, tile, year))
+            self._renders[key] = render
+            render.add_done_callback(lambda _render: self._renders.pop(key, None))
+        # shielded - a client disconnecting must not cancel a render other requests are waiting for
+        return await asyncio.shield(render)
+
+    async def get_tile(self, request: web.Request) -> web.Response:
+        """Handle a /tile/{year}/{z}/{y}/{x} request.
+
+        Parameters
+        ----------
+        request: web.Request
+            tile request
+
+        Returns
+        -------
+        web.Response
+            tile response, same as the Lambda function's
+        """
+        year = conversion.val_to_year(request.match_info["year"])
+        z, y, x = [conversion.val_to_type(request.match_info[k], int) for k in ("z", "y", "x")]
+        tile_server_config = get_naip_tile._get_tile_server_config()
+        if x is None or y is None or not z or not year:
+            return web.Response(status=400)
+        if z < tile_server_config.min_zoom or z > tile_server_config.max_zoom:
+            return web.Response(status=400)
+
+        tile = mercantile.Tile(x, y, z)
+        year = get_naip_tile._get_cache_year(year)
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            self._lookup_executor, _get_cached_tile_response, tile, year, request.headers.get("If-None-Match")
+        )
+        if not response:
+            response = await self._render(tile, year)
+        if not response:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return _to_web_response(response)
+
+    async def get_image(self, request: web.Request) -> web.Response:
+        """Handle a /image/{year}?bbox=left,bottom,right,top&width=&height=[&epsg=] request.
+
+        Images aren't cached, so each request is rendered (subject to the same max_pending as tiles).
+
+        Parameters
+        ----------
+        request: web.Request
+            image request
+
+        Returns
+        -------
+        web.Response
+            image response, same as the Lambda function's
+        """
+        if self.pending >= self.max_pending:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        event = {"pathParameters": dict(request.match_info), "queryStringParameters": dict(request.query)}
+        self._image_renders += 1
+        try:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self._render_executor, _render_image, event)
+        finally:
+            self._image_renders -= 1
+        return _to_web_response(response)
+
+    async def close(self, _app: web.Application | None = None) -> None:
+        """Wait for pending renders to finish, then shut down worker processes & threads.
+
+        Parameters
+        ----------
+        _app: web.Application | None
+            application being cleaned up, when used as an aiohttp cleanup callback
+
+        Returns
+        -------
+        None
+        """
+        if self._renders:
+            logger.info(f"waiting for {self.pending} pending renders")
+            await asyncio.gather(*self._renders.values(), return_exceptions=True)
+        self._render_executor.shutdown(wait=True, cancel_futures=True)
+        self._lookup_executor.shutdown(wait=True)
+
+
+def create_app(
+    workers: int | None = None, max_pending: int = 64, render_executor: Executor | None = None
+) -> web.Application:
+    """Create the standalone tile server's aiohttp application.
+
+    Parameters
+    ----------
+    workers: int | None
+        number of render worker processes, defaults to number of CPUs
+    max_pending: int
+        max number of tiles waiting to be (or being) rendered, before requests are turned away with a 503
+    render_executor: Executor | None
+        executor tiles are rendered with, defaults to a pool of worker processes
+
+    Returns
+    -------
+    web.Application
+        tile server application
+    """
+    tile_server = TileServer(workers, max_pending, render_executor)
+    app = web.Application()
+    app.router.add_get("/tile/{year}/{z}/{y}/{x}", tile_server.get_tile)
+    app.router.add_get("/image/{year}", tile_server.get_image)
+    app.on_cleanup.append(tile_server.close)
+    return app
+
+
+def run(host: str = "0.0.0.0", port: int = 8080, workers: int | None = None, max_pending: int = 64) -> None:
+    """Run the standalone tile server until interrupted (SIGINT/SIGTERM).
+
+    On shutdown, the server stops accepting connections, lets in flight requests & pending renders finish, then stops
+    its worker processes.  Configuration (tile cache, zoom limits...) is read from the same environment variables as
+    the Lambda function's.
+
+    Parameters
+    ----------
+    host: str
+        interface to listen on
+    port: int
+        port to listen on
+    workers: int | None
+        number of render worker processes, defaults to number of CPUs
+    max_pending: int
+        max number of tiles waiting to be (or being) rendered, before requests are turned away with a 503
+
+    Returns
+    -------
+    None
+    """
+    web.run_app(create_app(workers, max_pending), host=host, port=port, shutdown_timeout=60)
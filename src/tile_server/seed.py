@@ -0,0 +1,335 @@
+import math
+import multiprocessing
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+import mercantile
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+import src.lambda_functions.get_naip_tile as get_naip_tile
+import src.utils.conversion as conversion
+import src.utils.naip as naip
+from src.tile_server.app import _init_render_worker
+from src.utils import logger
+from src.utils.tile_enumeration import intersects_footprints
+
+# zoom levels built by a single pyramid job, i.e. a job renders up to 4**PYRAMID_JOB_DEPTH max zoom tiles
+PYRAMID_JOB_DEPTH = 4
+
+# zoom levels of max zoom tiles rendered at once by a pyramid job, i.e. up to 4**PYRAMID_RENDER_DEPTH tiles
+PYRAMID_RENDER_DEPTH = 3
+
+# marks a tile that couldn't be built - its ancestors aren't built either
+_FAILED = object()
+
+# marks a tile missing some of its imagery - it (and its ancestors) would be truncated, so it isn't written
+_PARTIAL = object()
+
+
+def _render_block(tiles: list[mercantile.Tile], year: int) -> dict[str, int]:
+    # runs in a worker process - renders a block of neighbouring tiles straight into the tile cache
+    tile_server_config = get_naip_tile._get_tile_server_config()
+    statuses = get_naip_tile._render_batch(tiles, year, tile_server_config, deadline=math.inf)
+    return dict(Counter(statuses.values()))
+
+
+def _get_tile_blocks(tiles: list[mercantile.Tile], block_size: int) -> list[list[mercantile.Tile]]:
+    # neighbouring tiles share NAIP geotiffs - render tiles block by block
+    tiles = sorted(tiles, key=lambda t: (t.y // 16, t.x // 16, t.y, t.x))
+    return [tiles[i : i + block_size] for i in range(0, len(tiles), block_size)]
+
+
+def seed_tiles(
+    tiles: list[mercantile.Tile],
+    year: int | str,
+    workers: int | None = None,
+    block_size: int = 64,
+    render_executor: Executor | None = None,
+) -> dict[str, int]:
+    """Render tiles straight into the configured tile cache, with a pool of local worker processes.
+
+    Unlike seeding through the Lambda function, there are no API round trips, timeouts or concurrency limits - e.g.
+    for large backfills on a single big host.  Like the standalone tile server's, each worker loads the NAIP index &
+    tile cache once and keeps a GDAL environment open for its lifetime, and each block of tiles is rendered with a
+    single NAIP index query, opening each of its geotiffs once.  Configuration (tile cache...) is read from the same
+    environment variables as the Lambda function's.
+
+    Parameters
+    ----------
+    tiles: list[mercantile.Tile]
+        mercator slippy-map tiles to render
+    year: int | str
+        NAIP imagery year, year range (e.g. "2016-2021") or "latest"
+    workers: int | None
+        number of render worker processes, defaults to number of CPUs
+    block_size: int
+        number of neighbouring tiles rendered by a worker at a time
+    render_executor: Executor | None
+        executor tiles are rendered with, defaults to a pool of worker processes
+
+    Returns
+    -------
+    dict[str, int]
+        number of tiles by status (rendered, empty or error)
+    """
+    render_executor = render_executor or ProcessPoolExecutor(
+        max_workers=workers,
+        # forking a process with live boto3/GDAL threads isn't safe - start workers from scratch
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_render_worker,
+    )
+    counts = Counter()
+    start = time.perf_counter()
+    with render_executor, tqdm(total=len(tiles), unit="tile") as pbar:
+        blocks = {
+            render_executor.submit(_render_block, block, year): block for block in _get_tile_blocks(tiles, block_size)
+        }
+        for future in as_completed(blocks):
+            try:
+                counts.update(future.result())
+            except Exception:
+                tqdm.write(f"{traceback.format_exc()} happened while processing block starting at {blocks[future][0]}")
+                counts["error"] += len(blocks[future])
+            pbar.update(len(blocks[future]))
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"seeded year: {year}, {len(tiles)} tiles in {elapsed:.1f}s ({len(tiles) / max(elapsed, 1e-9):.1f} tiles/s), "
+        f"tiles by status: {dict(counts)}"
+    )
+    return dict(counts)
+
+
+def _get_ancestor(tile: mercantile.Tile, zoom: int) -> mercantile.Tile:
+    # unlike mercantile.parent, a tile is its own ancestor at its zoom level
+    return mercantile.Tile(tile.x >> (tile.z - zoom), tile.y >> (tile.z - zoom), zoom)
+
+
+def _merge_children(children: list) -> np.ndarray | None:
+    # children in mercantile.children order (top-left, top-right, bottom-right, bottom-left), None for empty tiles
+    if any(child is _FAILED for child in children):
+        return _FAILED
+    if any(child is _PARTIAL for child in children):
+        return _PARTIAL
+    if all(child is None for child in children):
+        return None
+    empty = np.zeros((256, 256, 4), "uint8")
+    tl, tr, br, bl = [child if child is not None else empty for child in children]
+    merged_tile_data = np.concatenate((np.concatenate((tl, tr), axis=1), np.concatenate((bl, br), axis=1)), axis=0)
+    return np.asarray(Image.fromarray(merged_tile_data).resize((256, 256)))
+
+
+def _get_unseeded_tile(tile: mercantile.Tile, year: int | str, footprint_bounds: np.ndarray | None):
+    # a tile that isn't seeded has no imagery - unless it intersects an imagery footprint (e.g. it is outside
+    # coverage), then it is read from the tile cache.  if it isn't cached either, its ancestors can only be partial
+    if footprint_bounds is None or not intersects_footprints(tile, footprint_bounds):
+        return None
+    image_bytes = get_naip_tile._get_tile_server_config().tile_cache.get_tile_bytes(tile, year)
+    if not image_bytes:
+        return _PARTIAL
+    return np.asarray(Image.open(BytesIO(image_bytes)).convert("RGBA"))
+
+
+def _write_tile(tile: mercantile.Tile, year: int | str, tile_data: np.ndarray | None) -> Future:
+    # tile is encoded & uploaded in the background, while the next tile is built
+    tile_cache = get_naip_tile._get_tile_server_config().tile_cache
+    image_bytes = conversion.img_to_bytes(Image.fromarray(tile_data), "PNG") if tile_data is not None else None
+    return get_naip_tile._get_cache_write_executor().submit(
+        get_naip_tile._save_tile_bytes, tile_cache, tile, year, image_bytes, False
+    )
+
+
+def _write_built_tile(tile: mercantile.Tile, year: int | str, tile_data) -> tuple[Future | None, str]:
+    if tile_data is _FAILED:
+        logger.error(f"tile {tile} not built, one of its descendants couldn't be built")
+        return None, "error"
+    if tile_data is _PARTIAL:
+        logger.warning(f"tile {tile} not built, some of its imagery is neither seeded nor cached")
+        return None, "partial"
+    return _write_tile(tile, year, tile_data), "downscaled" if tile_data is not None else "empty"
+
+
+def _wait_for_writes(writes: dict[mercantile.Tile, tuple[Future, str]]) -> Counter:
+    counts = Counter()
+    for tile, (write, status) in writes.items():
+        try:
+            if write:
+                write.result()
+            counts[status] += 1
+        except Exception as e:
+            logger.error(f"error writing tile {tile} to cache: {e}")
+            counts["error"] += 1
+    return counts
+
+
+def _build_pyramid_job(
+    root: mercantile.Tile,
+    year: int | str,
+    max_zoom: int,
+    tiles: set[mercantile.Tile],
+    footprint_bounds: np.ndarray | None = None,
+) -> tuple[np.ndarray | None, dict[str, int]]:
+    # runs in a worker process - renders the max zoom tiles under root, and builds every zoom level from max zoom up
+    # to root by downsampling in memory.  returns the root tile data, for the caller to build lower zoom levels from
+    render_zoom = max(root.z, max_zoom - PYRAMID_RENDER_DEPTH)
+    rendered = {}
+    writes = {}
+
+    def _build(tile: mercantile.Tile) -> np.ndarray | None:
+        if tile.z == render_zoom:
+            # neighbouring max zoom tiles are rendered at once - sharing NAIP index queries & opened geotiffs
+            leaves = [t for t in tiles if t.z == max_zoom and _get_ancestor(t, render_zoom) == tile]
+            for leaf, leaf_image in naip.get_tile_images(leaves, year):
+                rendered[leaf] = np.asarray(leaf_image.convert("RGBA")) if leaf_image else None
+                writes[leaf] = (_write_tile(leaf, year, rendered[leaf]), "rendered" if leaf_image else "empty")
+        if tile.z == max_zoom:
+            return rendered.pop(tile, None)
+
+        # children are only kept in memory until their parent is built
+        children = [
+            _build(child) if child in tiles else _get_unseeded_tile(child, year, footprint_bounds)
+            for child in mercantile.children(tile)
+        ]
+        tile_data = _merge_children(children)
+        writes[tile] = _write_built_tile(tile, year, tile_data)
+        return tile_data
+
+    root_data = _build(root)
+    return root_data, dict(_wait_for_writes(writes))
+
+
+class _PyramidBase:
+    """Builds the zoom levels below pyramid jobs' roots, from the roots' tile data, as jobs finish."""
+
+    def __init__(
+        self, tiles: set[mercantile.Tile], min_zoom: int, year: int | str, footprint_bounds: np.ndarray | None = None
+    ):
+        self.tiles = tiles
+        self.min_zoom = min_zoom
+        self.year = year
+        self.footprint_bounds = footprint_bounds
+        self.writes = {}
+        # children built so far, of tiles not built yet
+        self._pending = {}
+
+    def add(self, tile: mercantile.Tile, tile_data) -> None:
+        # once all children of a tile are built, build it - and so on down to min zoom
+        while tile.z > self.min_zoom:
+            parent = mercantile.parent(tile)
+            children = self._pending.setdefault(parent, {})
+            children[tile] = tile_data
+            if len(children) < sum(1 for child in mercantile.children(parent) if child in self.tiles):
+                return
+            del self._pending[parent]
+            tile, tile_data = parent, self._build(parent, children)
+
+    def flush(self) -> None:
+        # build tiles whose children were only partially built, i.e. expected children aren't tiles to seed
+        while self._pending:
+            parent = max(self._pending, key=lambda t: t.z)
+            self.add(parent, self._build(parent, self._pending.pop(parent)))
+
+    def _build(self, tile: mercantile.Tile, children: dict):
+        tile_data = _merge_children(
+            [
+                (
+                    children.get(child)
+                    if child in self.tiles
+                    else _get_unseeded_tile(child, self.year, self.footprint_bounds)
+                )
+                for child in mercantile.children(tile)
+            ]
+        )
+        self.writes[tile] = _write_built_tile(tile, self.year, tile_data)
+        return tile_data
+
+
+def seed_pyramid(
+    tiles: list[mercantile.Tile],
+    year: int | str,
+    workers: int | None = None,
+    render_executor: Executor | None = None,
+    footprint_bounds: np.ndarray | None = None,
+) -> dict[str, int]:
+    """Build a tile pyramid bottom-up: render the max zoom level, and build lower zoom levels by downsampling.
+
+    Unlike seeding zoom levels one by one (where lower zoom levels are downscaled from tiles read back from the tile
+    cache), every level is built in memory in one sweep - each tile is written to the tile cache once, and never read
+    back.  Space is split into pyramid jobs, one per tile PYRAMID_JOB_DEPTH zoom levels above the max zoom level.
+    Workers render the max zoom tiles of a job block by block, building its levels depth first, so only a few blocks
+    of tiles are held in memory at a time.  The zoom levels below the jobs' roots are built from the roots as jobs
+    finish.  Tiles already cached are built (and written) again.
+
+    Tiles that aren't seeded are merged as empty tiles, unless they intersect one of footprint_bounds - i.e. they
+    have imagery, but were left out (e.g. by a coverage filter).  Those are read from the tile cache, and tiles
+    missing any of them from the cache too aren't written (status partial), rather than cached truncated.
+
+    Parameters
+    ----------
+    tiles: list[mercantile.Tile]
+        mercator slippy-map tiles to seed, of all zoom levels - e.g. tiles intersecting imagery
+    year: int | str
+        NAIP imagery year, year range (e.g. "2016-2021") or "latest"
+    workers: int | None
+        number of render worker processes, defaults to number of CPUs
+    render_executor: Executor | None
+        executor pyramid jobs are run with, defaults to a pool of worker processes
+    footprint_bounds: np.ndarray | None
+        (n, 4) array of west, south, east, north bounds (WGS84) of the imagery footprints tiles were enumerated from,
+        None if tiles include every tile with imagery
+
+    Returns
+    -------
+    dict[str, int]
+        number of tiles by status (rendered, downscaled, empty, partial or error)
+    """
+    if not tiles:
+        return {}
+    tiles = set(tiles)
+    min_zoom, max_zoom = min(t.z for t in tiles), max(t.z for t in tiles)
+    job_zoom = max(min_zoom, max_zoom - PYRAMID_JOB_DEPTH)
+    jobs = {}
+    for tile in tiles:
+        if tile.z >= job_zoom:
+            jobs.setdefault(_get_ancestor(tile, job_zoom), set()).add(tile)
+
+    render_executor = render_executor or ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_render_worker,
+    )
+    pyramid_base = _PyramidBase(tiles, min_zoom, year, footprint_bounds)
+    counts = Counter()
+    start = time.perf_counter()
+    with render_executor, tqdm(total=len(tiles), unit="tile") as pbar:
+        # jobs are submitted in quadkey order, so siblings finish close together and lower levels are built early
+        futures = {
+            render_executor.submit(_build_pyramid_job, root, year, max_zoom, jobs[root], footprint_bounds): root
+            for root in sorted(jobs, key=mercantile.quadkey)
+        }
+        for future in as_completed(futures):
+            root = futures[future]
+            try:
+                root_data, job_counts = future.result()
+                counts.update(job_counts)
+            except Exception:
+                tqdm.write(f"{traceback.format_exc()} happened while building pyramid of {root}")
+                root_data = _FAILED
+                counts["error"] += len(jobs[root])
+            pyramid_base.add(root, root_data)
+            pbar.update(len(jobs[root]))
+        pyramid_base.flush()
+        counts.update(_wait_for_writes(pyramid_base.writes))
+        pbar.update(len(pyramid_base.writes))
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"seeded year: {year}, {len(tiles)} tiles in {elapsed:.1f}s ({len(tiles) / max(elapsed, 1e-9):.1f} tiles/s), "
+        f"tiles by status: {dict(counts)}"
+    )
+    return dict(counts)
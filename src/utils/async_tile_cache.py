@@ -0,0 +1,246 @@
+import asyncio
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+import aiohttp
+import boto3
+import mercantile
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from PIL import Image
+from yarl import URL
+
+from src.utils.tile_cache import encode_tile_image
+
+_S3_XML_NAMESPACE = {"s3": "http://s3.amazonaws.com/doc/2006-03-01/"}
+
+
+class AsyncS3TileCache:
+    """asyncio S3 tile cache, using the same object layout as S3TileCache.
+
+    Requests are SigV4 signed with botocore and sent over a pooled aiohttp session, so that hundreds of cache
+    lookups/writes can be in flight from a single process (e.g. when seeding).  Must be used as an async context
+    manager, which opens & closes the connection pool:
+
+        async with AsyncS3TileCache("my-bucket", max_connections=200) as tile_cache:
+            missing_tiles = await tile_cache.get_missing_tile_images(tiles, 2021)
+
+    Unlike TileCache implementations, no rescaling is attempted for tiles that are not cached.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        max_connections: int = 100,
+        region: str | None = None,
+        endpoint_url: str | None = None,
+        timeout: float = 30,
+    ):
+        """Initialize AsyncS3TileCache instance.
+
+        Parameters
+        ----------
+        bucket: str
+            S3 bucket name to be used as tile cache
+        max_connections: int
+            max number of concurrent connections to S3
+        region: str | None
+            AWS region of bucket, defaults to region of default boto3 session
+        endpoint_url: str | None
+            S3 endpoint (e.g. for testing against a local S3 compatible server), defaults to AWS S3 regional endpoint
+        timeout: float
+            total timeout, in seconds, of a single S3 request
+        """
+        session = boto3.session.Session()
+        self._credentials = session.get_credentials()
+        self._region = region or session.region_name or "us-east-1"
+        self._bucket_url = f"{endpoint_url or f'https://s3.{self._region}.amazonaws.com'}/{bucket}"
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._session = None
+
+    async def __aenter__(self) -> "AsyncS3TileCache":
+        """Open connection pool."""
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self._max_connections, limit_per_host=self._max_connections),
+            timeout=aiohttp.ClientTimeout(total=self._timeout),
+        )
+        return self
+
+    async def __aexit__(self, *_exc_info) -> None:
+        """Close connection pool."""
+        await self._session.close()
+        self._session = None
+
+    def _get_key(self, tile: mercantile.Tile, year: int):
+        return f"{year}/{tile.z}/{tile.y}/{tile.x}.png"
+
+    async def _request(
+        self, method: str, key: str = "", params: dict | None = None, data: bytes = b"", headers: dict | None = None
+    ) -> tuple[int, bytes]:
+        if self._session is None:
+            raise RuntimeError("AsyncS3TileCache must be used as an async context manager")
+
+        aws_request = AWSRequest(
+            method=method, url=f"{self._bucket_url}/{key}", params=params or {}, data=data, headers=headers or {}
+        )
+        S3SigV4Auth(self._credentials.get_frozen_credentials(), "s3", self._region).add_auth(aws_request)
+        prepared_request = aws_request.prepare()
+        # url is already encoded (and signed as such) - stop aiohttp from re-quoting it
+        async with self._session.request(
+            method, URL(prepared_request.url, encoded=True), data=data or None, headers=dict(prepared_request.headers)
+        ) as response:
+            return response.status, await response.read()
+
+    @staticmethod
+    def _raise_for_status(status: int, body: bytes, expected: tuple[int, ...] = (200,)) -> None:
+        if status not in expected:
+            raise aiohttp.ClientError(f"Unexpected S3 response status {status}: {body[:500]!r}")
+
+    async def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        status, body = await self._request("GET", self._get_key(tile, year))
+        if status == 404:
+            return None
+        self._raise_for_status(status, body)
+        return body
+
+    async def get_tile_image(self, tile: mercantile.Tile, year: int) -> Image:
+        """Get tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        Image
+            image if tile found in cache, None if not
+
+        """
+        image_bytes = await self.get_tile_bytes(tile, year)
+        return Image.open(BytesIO(image_bytes)) if image_bytes else None
+
+    async def save_tile_bytes(
+        self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False
+    ) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
+
+        Returns
+        -------
+            None
+        """
+        headers = {"Content-Type": "image/png"}
+        if is_rescaled:
+            headers["x-amz-meta-is_rescaled"] = "true"
+        status, body = await self._request("PUT", self._get_key(tile, year), data=image_bytes, headers=headers)
+        self._raise_for_status(status, body)
+
+    async def save_tile_image(self, tile: mercantile.Tile, year: int, image: Image, is_rescaled: bool = False) -> None:
+        """Save tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image: Image
+            tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
+
+        Returns
+        -------
+            None
+        """
+        await self.save_tile_bytes(tile, year, encode_tile_image(image), is_rescaled)
+
+    async def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        status, body = await self._request("HEAD", self._get_key(tile, year))
+        self._raise_for_status(status, body, expected=(200, 404))
+        return status == 200
+
+    async def _list_keys(self, prefix: str) -> list[str]:
+        keys = []
+        params = {"list-type": "2", "prefix": prefix}
+        while True:
+            status, body = await self._request("GET", params=params)
+            self._raise_for_status(status, body)
+            root = ET.fromstring(body)
+            keys.extend(key.text for key in root.iterfind("s3:Contents/s3:Key", _S3_XML_NAMESPACE))
+            continuation_token = root.findtext("s3:NextContinuationToken", namespaces=_S3_XML_NAMESPACE)
+            if not continuation_token:
+                return keys
+            params = {**params, "continuation-token": continuation_token}
+
+    async def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
+
+        Each zoom level of the requested tiles is listed concurrently.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        zoom_keys = await asyncio.gather(*[self._list_keys(f"{year}/{z}/") for z in {tile.z for tile in tiles}])
+
+        inventory = set()
+        for key in (key for keys in zoom_keys for key in keys):
+            if key.endswith(".png"):
+                _, z, y, x = key.split("/")
+                inventory.add((int(x.split(".")[0]), int(y), int(z)))
+
+        return list(filter(lambda tile: (tile.x, tile.y, tile.z) not in inventory, tiles))
@@ -0,0 +1,254 @@
+import math
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+import src.utils.resources as resources
+from src.utils.tile_cache import BLANK_TILE_ETAG
+
+# max number of keys accepted by a single S3 DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class CachedTileObject:
+    """A tile stored in a S3TileCache bucket, as listed (i.e. without fetching the tile itself)."""
+
+    key: str
+    year: int
+    zoom: int
+    size: int
+    last_modified: datetime
+    is_blank: bool
+
+
+@dataclass
+class CachePrunePolicy:
+    """Which cached tiles to prune.
+
+    Tiles must match all the filters that are set (ttl, zoom range, rescaled/blank) to be pruned.  If max_bytes is
+    set, the oldest tiles are also pruned until the remaining tiles of a year take up at most max_bytes.
+
+    S3 does not record when an object was last read, so age is based on when the tile was (last) cached.
+    """
+
+    ttl: int | None = None
+    min_zoom: int | None = None
+    max_zoom: int | None = None
+    rescaled_only: bool = False
+    blank_only: bool = False
+    max_bytes: int | None = None
+
+    def matches(self, cached_tile: CachedTileObject, now: datetime) -> bool:
+        """Check if a cached tile matches the listable filters of this policy (i.e. all but rescaled_only).
+
+        Parameters
+        ----------
+        cached_tile: CachedTileObject
+            cached tile to check
+        now: datetime
+            time the tile's age is relative to
+
+        Returns
+        -------
+        bool
+            True if tile matches, False otherwise
+        """
+        if self.ttl is not None and now - cached_tile.last_modified < timedelta(seconds=self.ttl):
+            return False
+        if self.min_zoom is not None and cached_tile.zoom < self.min_zoom:
+            return False
+        if self.max_zoom is not None and cached_tile.zoom > self.max_zoom:
+            return False
+        if self.blank_only and not cached_tile.is_blank:
+            return False
+        return True
+
+    @property
+    def has_filters(self) -> bool:
+        """Check if any filter (vs only a max_bytes cap) is set."""
+        return (
+            self.ttl is not None
+            or self.min_zoom is not None
+            or self.max_zoom is not None
+            or self.rescaled_only
+            or self.blank_only
+        )
+
+
+def _list_common_prefixes(s3_client, bucket: str, prefix: str) -> list[str]:
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [
+        common_prefix["Prefix"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
+        for common_prefix in page.get("CommonPrefixes", [])
+    ]
+
+
+def _list_cached_tiles_by_prefix(s3_client, bucket: str, year: int, prefix: str) -> list[CachedTileObject]:
+    blank_tile_etag = f'"{BLANK_TILE_ETAG}"'
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [
+        CachedTileObject(
+            key=obj["Key"],
+            year=year,
+            zoom=int(obj["Key"].split("/")[1]),
+            size=obj["Size"],
+            last_modified=obj["LastModified"],
+            is_blank=obj.get("ETag") == blank_tile_etag,
+        )
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(".png")
+    ]
+
+
+def list_cached_tiles(bucket: str, year: int, workers: int = 32) -> list[CachedTileObject]:
+    """List tiles of a year cached in a S3TileCache bucket.
+
+    A single listing returns at most 1000 keys per request, so the year is split into one prefix per tile row
+    ({year}/{z}/{y}/), and prefixes are listed in parallel.  Blank tiles are recognized by their ETag, which for
+    objects uploaded with a single PUT is the MD5 of the object.
+
+    Parameters
+    ----------
+    bucket: str
+        S3 tile cache bucket
+    year: int
+        naip year
+    workers: int
+        number of parallel list requests
+
+    Returns
+    -------
+    list[CachedTileObject]
+        cached tiles
+    """
+    s3_client = resources.get_s3_client()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        zoom_prefixes = _list_common_prefixes(s3_client, bucket, f"{year}/")
+        row_prefixes = [
+            row_prefix
+            for row_prefixes in executor.map(lambda p: _list_common_prefixes(s3_client, bucket, p), zoom_prefixes)
+            for row_prefix in row_prefixes
+        ]
+        row_tiles = executor.map(lambda p: _list_cached_tiles_by_prefix(s3_client, bucket, year, p), row_prefixes)
+        return [cached_tile for cached_tiles in row_tiles for cached_tile in cached_tiles]
+
+
+def summarize_cached_tiles(cached_tiles: Iterable[CachedTileObject]) -> dict[tuple[int, int], dict]:
+    """Account count and size of cached tiles per year/zoom.
+
+    Parameters
+    ----------
+    cached_tiles: Iterable[CachedTileObject]
+        cached tiles
+
+    Returns
+    -------
+    dict[tuple[int, int], dict]
+        {(year, zoom): {"tiles": count, "blank tiles": count, "bytes": size}}
+    """
+    summary = defaultdict(lambda: {"tiles": 0, "blank tiles": 0, "bytes": 0})
+    for cached_tile in cached_tiles:
+        year_zoom_summary = summary[(cached_tile.year, cached_tile.zoom)]
+        year_zoom_summary["tiles"] += 1
+        year_zoom_summary["blank tiles"] += int(cached_tile.is_blank)
+        year_zoom_summary["bytes"] += cached_tile.size
+    return dict(sorted(summary.items()))
+
+
+def _is_rescaled(bucket: str, key: str, s3_client) -> bool:
+    metadata = s3_client.head_object(Bucket=bucket, Key=key).get("Metadata", {})
+    return metadata.get("is_rescaled") == "true"
+
+
+def select_tiles_to_prune(
+    bucket: str,
+    cached_tiles: list[CachedTileObject],
+    policy: CachePrunePolicy,
+    workers: int = 32,
+    now: datetime | None = None,
+) -> list[CachedTileObject]:
+    """Select the cached tiles (of a single year) a policy prunes.
+
+    Parameters
+    ----------
+    bucket: str
+        S3 tile cache bucket
+    cached_tiles: list[CachedTileObject]
+        cached tiles of a year
+    policy: CachePrunePolicy
+        prune policy
+    workers: int
+        number of parallel requests used to check if tiles were rescaled
+    now: datetime | None
+        time tile ages are relative to, defaults to current time
+
+    Returns
+    -------
+    list[CachedTileObject]
+        cached tiles to prune
+    """
+    now = now or datetime.now(timezone.utc)
+    if policy.has_filters:
+        selected_tiles = [cached_tile for cached_tile in cached_tiles if policy.matches(cached_tile, now)]
+        if policy.rescaled_only and selected_tiles:
+            # rescaled flag is object metadata, which isn't listed - only check tiles matching other filters
+            s3_client = resources.get_s3_client()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                is_rescaled = executor.map(lambda t: _is_rescaled(bucket, t.key, s3_client), selected_tiles)
+                selected_tiles = [t for t, rescaled in zip(selected_tiles, list(is_rescaled)) if rescaled]
+    else:
+        selected_tiles = []
+
+    if policy.max_bytes is not None:
+        selected_keys = {t.key for t in selected_tiles}
+        remaining_tiles = sorted((t for t in cached_tiles if t.key not in selected_keys), key=lambda t: t.last_modified)
+        remaining_bytes = sum(t.size for t in remaining_tiles)
+        for cached_tile in remaining_tiles:
+            if remaining_bytes <= policy.max_bytes:
+                break
+            selected_tiles.append(cached_tile)
+            remaining_bytes -= cached_tile.size
+
+    return selected_tiles
+
+
+def delete_cached_tiles(bucket: str, cached_tiles: list[CachedTileObject], workers: int = 8) -> tuple[int, int]:
+    """Delete cached tiles with parallel, batched DeleteObjects requests.
+
+    Parameters
+    ----------
+    bucket: str
+        S3 tile cache bucket
+    cached_tiles: list[CachedTileObject]
+        cached tiles to delete
+    workers: int
+        number of parallel DeleteObjects requests
+
+    Returns
+    -------
+    tuple[int, int]
+        number of tiles & bytes deleted
+    """
+    s3_client = resources.get_s3_client()
+    batches = [
+        cached_tiles[(batch * DELETE_BATCH_SIZE) : (batch * DELETE_BATCH_SIZE) + DELETE_BATCH_SIZE]
+        for batch in range(math.ceil(len(cached_tiles) / DELETE_BATCH_SIZE))
+    ]
+
+    def _delete_batch(batch_tiles: list[CachedTileObject]) -> tuple[int, int]:
+        response = s3_client.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": t.key} for t in batch_tiles], "Quiet": True}
+        )
+        # in quiet mode only errors are reported
+        failed_keys = {error["Key"] for error in response.get("Errors", [])}
+        deleted_tiles = [t for t in batch_tiles if t.key not in failed_keys]
+        return len(deleted_tiles), sum(t.size for t in deleted_tiles)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_delete_batch, batches))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
@@ -1,13 +1,18 @@
 import base64
+import re
 from io import BytesIO
 from typing import Any
 
 import mercantile
-from PIL import Image
-from shapely.geometry import Polygon, box
 
+from src.utils.lazy import lazy_import
 
-def bbox_to_box(bbox: mercantile.Bbox) -> Polygon:
+# not needed to serve cached tiles - see src.utils.lazy
+Image = lazy_import("PIL.Image")
+shapely = lazy_import("shapely")
+
+
+def bbox_to_box(bbox: mercantile.Bbox) -> "shapely.Polygon":
     """Convert mercantile.Bbox to shapely.box.
 
     Parameters
@@ -20,11 +25,11 @@ def bbox_to_box(bbox: mercantile.Bbox) -> Polygon:
     Polygon
         converted bbox
     """
-    return box(bbox[0], bbox[1], bbox[2], bbox[3])
+    return shapely.box(bbox[0], bbox[1], bbox[2], bbox[3])
 
 
-def img_to_b64(image: Image, format: str = "PNG") -> bytes:
-    """base64 encode a PIL image.
+def img_to_bytes(image: Image, format: str = "PNG") -> bytes:
+    """Encode a PIL image.
 
     Parameters
     ----------
@@ -35,7 +40,7 @@ def img_to_b64(image: Image, format: str = "PNG") -> bytes:
     Returns
     -------
     bytes
-        base64 encoded image
+        encoded image
 
     """
     buffered = BytesIO()
@@ -44,7 +49,25 @@ def img_to_b64(image: Image, format: str = "PNG") -> bytes:
     elif image.mode == "RGBA" and format == "JPEG":
         image = image.convert("RGB")
     image.save(buffered, format=format)
-    return base64.b64encode(buffered.getvalue())
+    return buffered.getvalue()
+
+
+def img_to_b64(image: Image, format: str = "PNG") -> bytes:
+    """base64 encode a PIL image.
+
+    Parameters
+    ----------
+    image: PIL.image
+        image to encode
+    format: str
+
+    Returns
+    -------
+    bytes
+        base64 encoded image
+
+    """
+    return base64.b64encode(img_to_bytes(image, format))
 
 
 def val_to_type(val: Any, val_type: type, raise_error: bool = False) -> Any:
@@ -70,3 +93,28 @@ def val_to_type(val: Any, val_type: type, raise_error: bool = False) -> Any:
         if raise_error:
             raise
         return None
+
+
+def val_to_year(val: Any) -> int | str | None:
+    """Converts a value to a NAIP year: a year, a year range (e.g. "2016-2021") or "latest" (all years).
+
+    Parameters
+    ----------
+    val: Any
+        value to convert
+
+    Returns
+    -------
+    int | str | None
+        year as int, year range or "latest" as str, None if conversion failed
+    """
+    year = val_to_type(val, int)
+    if year is not None:
+        return year
+    year = str(val).strip().lower()
+    if year == "latest":
+        return year
+    year_range = re.fullmatch(r"(\d{4})-(\d{4})", year)
+    if year_range and year_range[1] <= year_range[2]:
+        return year
+    return None
@@ -1,7 +1,40 @@
 import os
+from functools import cached_property
+
+import mercantile
 
 from src.utils import logger
-from src.utils.tile_cache import S3TileCache, TileCache
+from src.utils.prefetch import Prefetcher
+from src.utils.tile_cache import (
+    DiskTileCache,
+    FileSystemTileCache,
+    MBTilesTileCache,
+    MemoryTileCache,
+    S3BundleTileCache,
+    S3TileCache,
+    TieredTileCache,
+    TileCache,
+)
+
+TILE_CACHE_BACKENDS = ("s3", "s3_bundle", "filesystem", "mbtiles")
+
+
+def _parse_zoom_values(zoom_values: str) -> dict[int, int]:
+    """Parse per zoom level values, formatted as comma separated zoom(-range):value pairs, e.g. "10-14:3600,20:60"."""
+    values = {}
+    for zoom_value in filter(None, (zv.strip() for zv in zoom_values.split(","))):
+        zooms, value = zoom_value.split(":")
+        min_zoom, _, max_zoom = zooms.partition("-")
+        for zoom in range(int(min_zoom), int(max_zoom or min_zoom) + 1):
+            values[zoom] = int(value)
+    return values
+
+
+def _estimate_render_cost(tile: mercantile.Tile, year: int) -> int:
+    # naip (rasterio, polars, NAIP index...) is only imported once a tile has to be rescaled or rendered
+    import src.utils.naip as naip
+
+    return naip.estimate_render_cost(tile, year)
 
 
 class TileServerConfig:
@@ -16,10 +49,38 @@ class TileServerConfig:
         upscale_min_zoom: int,
         rescaling_enabled: bool,
         tile_cache_bucket: str,
+        memory_cache_max_bytes: int = 0,
+        memory_cache_ttl: int | None = None,
+        disk_cache_dir: str = "/tmp/naip-tile-cache",
+        disk_cache_max_bytes: int = 0,
+        disk_cache_ttl: int | None = None,
+        tile_cache_backend: str = "s3",
+        tile_cache_dir: str = "",
+        tile_cache_shard_size: int = 256,
+        tile_cache_bundle_size: int = 128,
+        rescale_max_depth: int = 3,
+        rescale_max_fetches: int = 64,
+        render_lease_ttl: int = 0,
+        render_lease_wait: float = 10,
+        cache_write_behind: bool = True,
+        metrics_namespace: str = "NAIPTileServer",
+        cache_control_max_age: int = 86400,
+        cache_control_max_age_by_zoom: dict[int, int] | None = None,
+        cache_control_empty_max_age: int = 3600,
+        cache_redirect: bool = False,
+        cache_redirect_base_url: str = "",
+        cache_redirect_expires: int = 3600,
+        prefetch_max_tiles: int = 0,
+        prefetch_max_tiles_per_minute: int = 120,
+        render_function_name: str = "",
+        render_deadline: float = 40,
+        image_max_size: int = 1536,
+        image_max_geotiffs: int = 64,
     ):
         """Initialize TileServerConfig with validation."""
         assert min_zoom < max_zoom
         assert downscale_max_zoom < upscale_min_zoom
+        assert tile_cache_backend in TILE_CACHE_BACKENDS
 
         self.image_format = image_format
         self.max_zoom = max_zoom
@@ -28,6 +89,34 @@ class TileServerConfig:
         self.upscale_min_zoom = upscale_min_zoom
         self.rescaling_enabled = rescaling_enabled
         self.tile_cache_bucket = tile_cache_bucket
+        self.memory_cache_max_bytes = memory_cache_max_bytes
+        self.memory_cache_ttl = memory_cache_ttl
+        self.disk_cache_dir = disk_cache_dir
+        self.disk_cache_max_bytes = disk_cache_max_bytes
+        self.disk_cache_ttl = disk_cache_ttl
+        self.tile_cache_backend = tile_cache_backend
+        self.tile_cache_dir = tile_cache_dir
+        self.tile_cache_shard_size = tile_cache_shard_size
+        self.tile_cache_bundle_size = tile_cache_bundle_size
+        self.rescale_max_depth = rescale_max_depth
+        self.rescale_max_fetches = rescale_max_fetches
+        self.render_lease_ttl = render_lease_ttl
+        self.render_lease_wait = render_lease_wait
+        self.cache_write_behind = cache_write_behind
+        self.metrics_namespace = metrics_namespace
+        self.cache_control_max_age = cache_control_max_age
+        self.cache_control_max_age_by_zoom = cache_control_max_age_by_zoom or {}
+        self.cache_control_empty_max_age = cache_control_empty_max_age
+        # cached tiles are PNG encoded - only redirect to them if that's the format tiles are served in
+        self.cache_redirect = cache_redirect and image_format == "PNG"
+        self.cache_redirect_base_url = cache_redirect_base_url
+        self.cache_redirect_expires = cache_redirect_expires
+        self.prefetch_max_tiles = prefetch_max_tiles
+        self.prefetch_max_tiles_per_minute = prefetch_max_tiles_per_minute
+        self.render_function_name = render_function_name
+        self.render_deadline = render_deadline
+        self.image_max_size = image_max_size
+        self.image_max_geotiffs = image_max_geotiffs
 
     @staticmethod
     def from_env():
@@ -40,24 +129,159 @@ class TileServerConfig:
             upscale_min_zoom=int(os.getenv("UPSCALE_MIN_ZOOM", 18)),
             rescaling_enabled=bool(os.getenv("RESCALING_ENABLED", "TRUE")),
             tile_cache_bucket=os.getenv("TILE_CACHE_BUCKET", "none"),
+            memory_cache_max_bytes=int(os.getenv("MEMORY_CACHE_MAX_BYTES", 0)),
+            memory_cache_ttl=int(os.getenv("MEMORY_CACHE_TTL", 0)) or None,
+            disk_cache_dir=os.getenv("DISK_CACHE_DIR", "/tmp/naip-tile-cache"),
+            disk_cache_max_bytes=int(os.getenv("DISK_CACHE_MAX_BYTES", 0)),
+            disk_cache_ttl=int(os.getenv("DISK_CACHE_TTL", 0)) or None,
+            tile_cache_backend=os.getenv("TILE_CACHE_BACKEND", "s3").lower(),
+            tile_cache_dir=os.getenv("TILE_CACHE_DIR", ""),
+            tile_cache_shard_size=int(os.getenv("TILE_CACHE_SHARD_SIZE", 256)),
+            tile_cache_bundle_size=int(os.getenv("TILE_CACHE_BUNDLE_SIZE", 128)),
+            rescale_max_depth=int(os.getenv("RESCALE_MAX_DEPTH", 3)),
+            rescale_max_fetches=int(os.getenv("RESCALE_MAX_FETCHES", 64)),
+            render_lease_ttl=int(os.getenv("RENDER_LEASE_TTL", 0)),
+            render_lease_wait=float(os.getenv("RENDER_LEASE_WAIT", 10)),
+            cache_write_behind=os.getenv("CACHE_WRITE_BEHIND", "TRUE").upper() == "TRUE",
+            metrics_namespace=os.getenv("METRICS_NAMESPACE", "NAIPTileServer"),
+            cache_control_max_age=int(os.getenv("CACHE_CONTROL_MAX_AGE", 86400)),
+            cache_control_max_age_by_zoom=_parse_zoom_values(os.getenv("CACHE_CONTROL_MAX_AGE_BY_ZOOM", "")),
+            cache_control_empty_max_age=int(os.getenv("CACHE_CONTROL_EMPTY_MAX_AGE", 3600)),
+            cache_redirect=os.getenv("CACHE_REDIRECT", "FALSE").upper() == "TRUE",
+            cache_redirect_base_url=os.getenv("CACHE_REDIRECT_BASE_URL", ""),
+            cache_redirect_expires=int(os.getenv("CACHE_REDIRECT_EXPIRES", 3600)),
+            prefetch_max_tiles=int(os.getenv("PREFETCH_MAX_TILES", 0)),
+            prefetch_max_tiles_per_minute=int(os.getenv("PREFETCH_MAX_TILES_PER_MINUTE", 120)),
+            # defaults to this (Lambda) function
+            render_function_name=os.getenv("RENDER_FUNCTION_NAME", os.getenv("AWS_LAMBDA_FUNCTION_NAME", "")),
+            render_deadline=float(os.getenv("RENDER_DEADLINE", 40)),
+            image_max_size=int(os.getenv("IMAGE_MAX_SIZE", 1536)),
+            image_max_geotiffs=int(os.getenv("IMAGE_MAX_GEOTIFFS", 64)),
         )
         return tile_server_config
 
-    @property
-    def tile_cache(self) -> TileCache | None:
-        """Instantiate TileCache based on config."""
+    def get_cache_control(self, zoom: int, is_empty: bool = False) -> str:
+        """Get Cache-Control header value for a tile response.
+
+        Parameters
+        ----------
+        zoom: int
+            zoom level of tile
+        is_empty: bool
+            True if tile has no NAIP imagery (i.e. blank tile or not found)
+
+        Returns
+        -------
+        str
+            Cache-Control header value
+        """
+        if is_empty:
+            max_age = self.cache_control_empty_max_age
+        else:
+            max_age = self.cache_control_max_age_by_zoom.get(zoom, self.cache_control_max_age)
+        return f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+    def _get_local_cache_tiers(self) -> list[TileCache]:
+        tiers = []
+        if self.memory_cache_max_bytes > 0:
+            tiers.append(MemoryTileCache(max_bytes=self.memory_cache_max_bytes, ttl=self.memory_cache_ttl))
+        if self.disk_cache_max_bytes > 0:
+            try:
+                tiers.append(
+                    DiskTileCache(
+                        directory=self.disk_cache_dir, max_bytes=self.disk_cache_max_bytes, ttl=self.disk_cache_ttl
+                    )
+                )
+            except OSError as e:
+                logger.error(f"error creating DiskTileCache in {self.disk_cache_dir}: {e}")
+        return tiers
+
+    def _get_backend_tile_cache(self, rescaling_enabled: bool) -> TileCache | None:
+        if self.tile_cache_backend in ("filesystem", "mbtiles"):
+            if not self.tile_cache_dir:
+                logger.warning("TILE_CACHE_DIR env var missing - no tilecache")
+                return None
+            try:
+                if self.tile_cache_backend == "mbtiles":
+                    tile_cache = MBTilesTileCache(
+                        directory=self.tile_cache_dir,
+                        downscale_max_zoom=self.downscale_max_zoom,
+                        upscale_min_zoom=self.upscale_min_zoom,
+                        rescaling_enabled=rescaling_enabled,
+                    )
+                else:
+                    tile_cache = FileSystemTileCache(
+                        directory=self.tile_cache_dir,
+                        shard_size=self.tile_cache_shard_size,
+                        downscale_max_zoom=self.downscale_max_zoom,
+                        upscale_min_zoom=self.upscale_min_zoom,
+                        rescaling_enabled=rescaling_enabled,
+                    )
+                logger.info(f"Successfully created {type(tile_cache).__name__} in directory: {self.tile_cache_dir}")
+                return tile_cache
+            except Exception as e:
+                logger.error(f"error creating {self.tile_cache_backend} tile cache in {self.tile_cache_dir}: {e}")
+                return None
+
         if not self.tile_cache_bucket:
             logger.warning("TILE_CACHE_S3_BUCKET env var missing - no tilecache")
             return None
         try:
-            tile_cache = S3TileCache(
-                bucket=self.tile_cache_bucket,
+            if self.tile_cache_backend == "s3_bundle":
+                tile_cache = S3BundleTileCache(
+                    bucket=self.tile_cache_bucket,
+                    bundle_size=self.tile_cache_bundle_size,
+                    downscale_max_zoom=self.downscale_max_zoom,
+                    upscale_min_zoom=self.upscale_min_zoom,
+                    rescaling_enabled=rescaling_enabled,
+                )
+            else:
+                tile_cache = S3TileCache(
+                    bucket=self.tile_cache_bucket,
+                    downscale_max_zoom=self.downscale_max_zoom,
+                    upscale_min_zoom=self.upscale_min_zoom,
+                    rescaling_enabled=rescaling_enabled,
+                )
+            logger.info(f"Successfully created {type(tile_cache).__name__} backed by bucket: {self.tile_cache_bucket}")
+            return tile_cache
+        except Exception as e:
+            logger.error(
+                f"error creating {self.tile_cache_backend} tile cache backed by bucket {self.tile_cache_bucket}: {e}"
+            )
+            return None
+
+    @cached_property
+    def tile_cache(self) -> TileCache | None:
+        """Instantiate TileCache based on config.
+
+        The instance is created once per config, so that in-process tiers (memory/disk) survive across requests
+        handled by a warm container.
+        """
+        local_tiers = self._get_local_cache_tiers()
+        tile_cache = self._get_backend_tile_cache(rescaling_enabled=self.rescaling_enabled and not local_tiers)
+        if not tile_cache:
+            return None
+
+        if local_tiers:
+            logger.info(f"Using TieredTileCache with tiers: {[type(tier).__name__ for tier in local_tiers]}")
+            tile_cache = TieredTileCache(
+                tiers=local_tiers + [tile_cache],
                 downscale_max_zoom=self.downscale_max_zoom,
                 upscale_min_zoom=self.upscale_min_zoom,
                 rescaling_enabled=self.rescaling_enabled,
             )
-            logger.info(f"Successfully created S3TileCache backed by bucket: {self.tile_cache_bucket}")
-            return tile_cache
-        except Exception as e:
-            logger.error(f"error creating S3TileCache backed by bucket {self.tile_cache_bucket}: {e}")
+
+        tile_cache.rescale_max_depth = self.rescale_max_depth
+        tile_cache.rescale_max_fetches = self.rescale_max_fetches
+        tile_cache.render_cost_estimator = _estimate_render_cost
+        return tile_cache
+
+    @cached_property
+    def prefetcher(self) -> Prefetcher | None:
+        """Instantiate Prefetcher based on config, None if prefetching is disabled.
+
+        Like the tile cache, the instance is created once per config, so its budget & known tiles span requests.
+        """
+        if self.prefetch_max_tiles <= 0 or not self.render_function_name or not self.tile_cache:
             return None
+        return Prefetcher(self.render_function_name, self.prefetch_max_tiles, self.prefetch_max_tiles_per_minute)
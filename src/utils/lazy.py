@@ -0,0 +1,39 @@
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module lazily, i.e. the module is only loaded when one of its attributes is first accessed.
+
+    Used to keep heavy modules (e.g. PIL, numpy, rasterio) off the import path of the Lambda function handler, so
+    that cold starts of requests answered straight from the tile cache don't pay for them.
+
+    https://docs.python.org/3/library/importlib.html#implementing-lazy-imports
+
+    Parameters
+    ----------
+    name: str
+        absolute module name
+
+    Returns
+    -------
+    ModuleType
+        module, loaded on first attribute access
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # as a regular import would, bind submodule to its (already imported) parent package
+    parent_name, _, child_name = name.rpartition(".")
+    if parent_name:
+        setattr(sys.modules[parent_name], child_name, module)
+    return module
@@ -0,0 +1,145 @@
+import json
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# metric names
+CACHE_HIT = "CacheHit"
+CACHE_HIT_BLANK = "CacheHitBlank"
+CACHE_MISS_RENDER = "CacheMissRender"
+CACHE_MISS_EMPTY = "CacheMissEmpty"
+UPSCALE = "Upscale"
+DOWNSCALE = "Downscale"
+BYTES_READ = "BytesRead"
+BYTES_WRITTEN = "BytesWritten"
+RENDER_TIME = "RenderTime"
+NOT_MODIFIED = "NotModified"
+CACHE_REDIRECT = "CacheRedirect"
+PREFETCH_QUEUED = "PrefetchQueued"
+RENDER_DEGRADED = "RenderDegraded"
+
+_current_metrics: ContextVar["MetricsCollector | None"] = ContextVar("current_metrics", default=None)
+
+
+class MetricsCollector:
+    """Collects metrics (e.g. of a single request) and formats them as CloudWatch Embedded Metric Format.
+
+    https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+
+    Every value of a metric is kept, so CloudWatch can compute statistics (percentiles etc.) for metrics recorded
+    more than once, e.g. bytes read for each tile fetched while rescaling.
+    """
+
+    def __init__(self, namespace: str, dimensions: dict[str, str] | None = None):
+        """Initialize MetricsCollector.
+
+        Parameters
+        ----------
+        namespace: str
+            CloudWatch namespace metrics are published to
+        dimensions: dict[str, str] | None
+            dimensions metrics are published for, in addition to no dimensions at all
+        """
+        self.namespace = namespace
+        self.dimensions = dimensions or {}
+        self._values = defaultdict(list)
+        self._units = {}
+
+    def put_metric(self, name: str, value: float = 1, unit: str = "Count") -> None:
+        """Record a metric value.
+
+        Parameters
+        ----------
+        name: str
+            metric name
+        value: float
+            metric value
+        unit: str
+            CloudWatch metric unit
+
+        Returns
+        -------
+        None
+        """
+        self._values[name].append(value)
+        self._units[name] = unit
+
+    def to_emf(self) -> dict | None:
+        """Format collected metrics as an Embedded Metric Format log event.
+
+        Returns
+        -------
+        dict | None
+            log event, None if no metrics were collected
+        """
+        if not self._values:
+            return None
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [[]] + ([list(self.dimensions.keys())] if self.dimensions else []),
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit in self._units.items()],
+                    }
+                ],
+            },
+            **{name: str(value) for name, value in self.dimensions.items()},
+            **{name: values if len(values) > 1 else values[0] for name, values in self._values.items()},
+        }
+
+
+@contextmanager
+def collect_metrics(namespace: str, **dimensions) -> Iterator[MetricsCollector]:
+    """Collect metrics recorded (with put_metric) within the context, and log them as one EMF event on exit.
+
+    Metrics are only collected in the thread/task that entered the context.
+
+    Parameters
+    ----------
+    namespace: str
+        CloudWatch namespace metrics are published to, if empty metrics are collected but not logged
+    dimensions:
+        dimensions metrics are published for
+
+    Returns
+    -------
+    Iterator[MetricsCollector]
+        collector
+    """
+    collector = MetricsCollector(namespace, dimensions)
+    token = _current_metrics.set(collector)
+    try:
+        yield collector
+    finally:
+        _current_metrics.reset(token)
+        emf = collector.to_emf()
+        if namespace and emf:
+            # EMF events must be logged as raw json lines - bypass logger formatting
+            sys.stdout.write(json.dumps(emf) + "\n")
+            sys.stdout.flush()
+
+
+def put_metric(name: str, value: float = 1, unit: str = "Count") -> None:
+    """Record a metric value with the current collector, if any.
+
+    Parameters
+    ----------
+    name: str
+        metric name
+    value: float
+        metric value
+    unit: str
+        CloudWatch metric unit
+
+    Returns
+    -------
+    None
+    """
+    collector = _current_metrics.get()
+    if collector:
+        collector.put_metric(name, value, unit)
@@ -1,7 +1,12 @@
+import math
 import os
+import time
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
 from functools import cache
+from itertools import groupby
 from pathlib import Path
+from typing import Callable, Iterator
 
 import affine
 import mercantile
@@ -11,17 +16,24 @@ import pyproj
 import rasterio
 from PIL import Image
 from rasterio.plot import reshape_as_image
-from rasterio.session import AWSSession
 from rasterio.vrt import WarpedVRT
 from shapely import Geometry
 from shapely.geometry import box
 from shapely.ops import transform
 
+import src.utils.resources as resources
 from src.utils.conversion import bbox_to_box
 
 _naip_index_parquet = os.path.join(Path(__file__).parent.parent, "data", "naip_index.parquet")
 _NAIP_INDEX_DF = pl.read_parquet(_naip_index_parquet)
 
+# draft images are read at 1/DRAFT_SCALE resolution (i.e. from coarse overviews), then upsampled
+DRAFT_SCALE = 8
+
+# rough cost of reading a tile sized window from a NAIP geotiff (header, overview/block reads and warping), expressed
+# as a number of tile cache fetches
+GEOTIFF_READ_COST = 8
+
 
 @dataclass()
 class AWSGeotiff:
@@ -55,69 +67,72 @@ class AWSGeotiff:
         return self.s3_path.split("/")[5]
 
 
-session = AWSSession(
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    requester_pays=True,
-)
+# GDAL options for reading cloud optimized geotiffs over HTTP: skip directory listings & sidecar file probes, reuse
+# connections (HTTP/2 multiplexing) and retry throttled/failed requests
+GDAL_ENV_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MAX_RETRY": "3",
+    "GDAL_HTTP_RETRY_DELAY": "0.5",
+    "VSI_CACHE": "TRUE",
+}
 
 
-def _build_image(
-    bounds: box,
-    year: int,
-    epsg: int = 3857,
-    height: int = 256,
-    width: int = 256,
-) -> Image:
-    geotiffs = get_naip_geotiffs(bounds, year, epsg)
-    if not geotiffs:
+class RenderDeadlineExceeded(Exception):
+    """Raised when an image could not be built before its deadline.
+
+    image is the partially composited image (i.e. imagery read before the deadline), None if no imagery was read.
+    """
+
+    def __init__(self, image: Image):
+        """Initialize RenderDeadlineExceeded.
+
+        Parameters
+        ----------
+        image: Image | None
+            partially composited image
+        """
+        super().__init__("render deadline exceeded")
+        self.image = image
+
+
+def _get_crop(
+    vrt: WarpedVRT, bounds: box, dst_transform: rasterio.transform.AffineTransformer
+) -> tuple[rasterio.windows.Window, tuple[slice, slice]] | None:
+    vrt_bounds = box(vrt.bounds[0], vrt.bounds[1], vrt.bounds[2], vrt.bounds[3])
+    if not vrt_bounds.intersects(bounds):
+        # this would occur only if geometry in naip_index is inaccurate
         return None
 
-    composite_image = np.zeros((width, height, 3), "uint8")
+    # determine intersecting area of geotiff with bounds
+    crop_bounds = bounds.intersection(vrt_bounds).bounds
 
-    # Output image transform
-    left, bottom, right, top = bounds.bounds
-    xres = (right - left) / width
-    yres = (top - bottom) / height
-    dst_transform = rasterio.transform.AffineTransformer(affine.Affine(xres, 0.0, left, 0.0, -yres, top))
+    # determine the window to use in reading from the dataset.
+    crop_window = vrt.window(crop_bounds[0], crop_bounds[1], crop_bounds[2], crop_bounds[3])
+
+    # determine where crop data will be written in composite image
+    ul_y, ul_x = dst_transform.rowcol(crop_bounds[0], crop_bounds[3])
+    lr_y, lr_x = dst_transform.rowcol(crop_bounds[2], crop_bounds[1])
+    return crop_window, (slice(ul_y, lr_y), slice(ul_x, lr_x))
 
-    with rasterio.Env(session):
-        for geotiff in geotiffs:
-            with rasterio.open(geotiff.s3_path) as src:
-                with WarpedVRT(src, crs=f"EPSG:{epsg}") as vrt:
-                    vrt_bounds = box(vrt.bounds[0], vrt.bounds[1], vrt.bounds[2], vrt.bounds[3])
-                    if not vrt_bounds.intersects(bounds):
-                        # this would occur only if geometry in naip_index is inaccurate
-                        continue
-
-                    # determine intersecting area of geotiff with bounds
-                    crop_bounds = bounds.intersection(vrt_bounds).bounds
-
-                    # determine the window to use in reading from the dataset.
-                    crop_window = vrt.window(crop_bounds[0], crop_bounds[1], crop_bounds[2], crop_bounds[3])
-
-                    # determine where crop data will be written in composite image
-                    ul_y, ul_x = dst_transform.rowcol(crop_bounds[0], crop_bounds[3])
-                    lr_y, lr_x = dst_transform.rowcol(crop_bounds[2], crop_bounds[1])
-
-                    # crop applicable data from this geotiff
-                    crop_data = reshape_as_image(
-                        vrt.read(
-                            window=crop_window,
-                            out_shape=(3, (lr_y - ul_y), (lr_x - ul_x)),
-                        )
-                    )
-
-                    # naip geotiffs can overlap.  and in overlapping areas, some
-                    # image(layers) might have valid pixel data and the other(layers)
-                    # dont (ie black pixels).  to avoid overwriting valid pixel data we
-                    # compare crop data with composite data, and only overwrite if crop
-                    # data has higher pixel value
-                    current_data = composite_image[ul_y:lr_y, ul_x:lr_x, :]
-                    crop_data = np.maximum(crop_data, current_data)
-
-                    composite_image[ul_y:lr_y, ul_x:lr_x, :] = crop_data
 
+def _read_crop(
+    vrt: WarpedVRT, crop_window: rasterio.windows.Window, height: int, width: int, draft: bool
+) -> np.ndarray:
+    if not draft:
+        return reshape_as_image(vrt.read(window=crop_window, out_shape=(3, height, width)))
+    # a small read is served from the geotiff's coarse overviews - then upsampled to crop size
+    draft_data = vrt.read(
+        window=crop_window, out_shape=(3, math.ceil(height / DRAFT_SCALE), math.ceil(width / DRAFT_SCALE))
+    )
+    return reshape_as_image(draft_data).repeat(DRAFT_SCALE, axis=0).repeat(DRAFT_SCALE, axis=1)[:height, :width]
+
+
+def _to_rgba_image(composite_image: np.ndarray) -> Image:
+    height, width, _ = composite_image.shape
     # Add an alpha channel, fully opaque (255)
     rgba = np.dstack((composite_image, np.zeros((height, width), dtype=np.uint8) + 255))
     # Make mask of black pixels - mask is True where image is black
@@ -128,6 +143,96 @@ def _build_image(
     return Image.fromarray(rgba)
 
 
+def _composite_image(
+    bounds: box,
+    geotiffs: list[AWSGeotiff],
+    open_vrt: Callable[[AWSGeotiff], WarpedVRT],
+    height: int = 256,
+    width: int = 256,
+    deadline: float | None = None,
+    draft: bool = False,
+) -> Image:
+    composite_image = np.zeros((height, width, 3), "uint8")
+    # pixels no (newer) imagery has been composited into yet
+    unfilled_mask = np.ones((height, width), bool)
+
+    # Output image transform
+    left, bottom, right, top = bounds.bounds
+    xres = (right - left) / width
+    yres = (top - bottom) / height
+    dst_transform = rasterio.transform.AffineTransformer(affine.Affine(xres, 0.0, left, 0.0, -yres, top))
+
+    def _fill(year_image: np.ndarray) -> None:
+        fill_mask = unfilled_mask & year_image.any(axis=2)
+        composite_image[fill_mask] = year_image[fill_mask]
+        unfilled_mask[fill_mask] = False
+
+    # years are composited newest first - older imagery only fills in pixels newer imagery has no data for
+    for _, year_geotiffs in groupby(sorted(geotiffs, key=lambda gt: -gt.year), key=lambda gt: gt.year):
+        year_image = np.zeros((height, width, 3), "uint8")
+        for geotiff in year_geotiffs:
+            if deadline is not None and time.monotonic() > deadline:
+                _fill(year_image)
+                raise RenderDeadlineExceeded(_to_rgba_image(composite_image) if not unfilled_mask.all() else None)
+
+            vrt = open_vrt(geotiff)
+            crop = _get_crop(vrt, bounds, dst_transform)
+            if not crop or not unfilled_mask[crop[1]].any():
+                # area outside of bounds, or already filled by newer imagery - skip reading
+                continue
+            crop_window, (rows, cols) = crop
+            crop_data = _read_crop(vrt, crop_window, rows.stop - rows.start, cols.stop - cols.start, draft)
+
+            # naip geotiffs can overlap.  and in overlapping areas, some
+            # image(layers) might have valid pixel data and the other(layers)
+            # dont (ie black pixels).  to avoid overwriting valid pixel data we
+            # compare crop data with composite data, and only overwrite if crop
+            # data has higher pixel value
+            year_image[rows, cols] = np.maximum(crop_data, year_image[rows, cols])
+
+        _fill(year_image)
+        if not unfilled_mask.any():
+            # tile filled - no need to read older imagery
+            break
+
+    return _to_rgba_image(composite_image)
+
+
+@contextmanager
+def _open_vrts(epsg: int = 3857) -> Iterator[Callable[[AWSGeotiff], WarpedVRT]]:
+    # geotiffs are opened (header/overview reads) once, and kept open until context exits
+    with rasterio.Env(resources.get_rasterio_session(), **GDAL_ENV_OPTIONS), ExitStack() as stack:
+        vrts = {}
+
+        def _open_vrt(geotiff: AWSGeotiff) -> WarpedVRT:
+            if geotiff.s3_path not in vrts:
+                src = stack.enter_context(rasterio.open(geotiff.s3_path))
+                vrts[geotiff.s3_path] = stack.enter_context(WarpedVRT(src, crs=f"EPSG:{epsg}"))
+            return vrts[geotiff.s3_path]
+
+        yield _open_vrt
+
+
+def _build_image(
+    bounds: box,
+    year: int | str,
+    epsg: int = 3857,
+    height: int = 256,
+    width: int = 256,
+    deadline: float | None = None,
+    draft: bool = False,
+    max_geotiffs: int | None = None,
+) -> Image:
+    geotiffs = get_naip_geotiffs(bounds, resolve_years(year), epsg)
+    if not geotiffs:
+        return None
+    if max_geotiffs is not None and len(geotiffs) > max_geotiffs:
+        raise ValueError(f"area covers {len(geotiffs)} NAIP geotiffs, max is {max_geotiffs}")
+
+    with _open_vrts(epsg) as open_vrt:
+        return _composite_image(bounds, geotiffs, open_vrt, height, width, deadline, draft)
+
+
 @cache
 def _get_transformer(src_epsg: int, dest_epsg: int):
     src_crs = pyproj.CRS(f"EPSG:{src_epsg}")
@@ -135,15 +240,73 @@ def _get_transformer(src_epsg: int, dest_epsg: int):
     return pyproj.Transformer.from_crs(src_crs, dest_crs, always_xy=True).transform
 
 
-def get_naip_geotiffs(coverage: Geometry = None, year: int = None, epsg: int = 4326) -> list[AWSGeotiff] | None:
-    """Find NAIP rgb geotiffs that cover a specific area, for a specific year.
+def get_years() -> list[int]:
+    """Get years NAIP imagery is available for.
+
+    Returns
+    -------
+    list[int]
+        years, newest first
+    """
+    return sorted(_NAIP_INDEX_DF.get_column("year").unique().to_list(), reverse=True)
+
+
+def resolve_years(year: int | str) -> list[int]:
+    """Resolve a year, a year range ("2016-2021") or "latest" (all years) into the years to composite imagery from.
+
+    Parameters
+    ----------
+    year: int | str
+        year, year range or "latest"
+
+    Returns
+    -------
+    list[int]
+        years, newest first - i.e. in order of priority
+
+    """
+    if isinstance(year, int):
+        return [year]
+    if year == "latest":
+        return get_years()
+    min_year, _, max_year = year.partition("-")
+    return list(range(int(max_year or min_year), int(min_year) - 1, -1))
+
+
+def get_cache_year(year: int | str) -> int | str:
+    """Get the year tiles of a year, a year range or "latest" are cached under.
+
+    Tiles of "latest" are cached under the range of years in the NAIP index (e.g. "2010-2022"), which composites the
+    same imagery - so once imagery of a new year is added to the index, "latest" tiles are cached under a new key
+    instead of being served stale.
+
+    Parameters
+    ----------
+    year: int | str
+        year, year range or "latest"
+
+    Returns
+    -------
+    int | str
+        year or year range
+    """
+    if year != "latest":
+        return year
+    years = get_years()
+    return f"{min(years)}-{max(years)}"
+
+
+def get_naip_geotiffs(
+    coverage: Geometry = None, year: int | list[int] = None, epsg: int = 4326
+) -> list[AWSGeotiff] | None:
+    """Find NAIP rgb geotiffs that cover a specific area, for a specific year (or years).
 
     Parameters
     ----------
     coverage: shapely.Geometry
         geometry to filter geotiffs by
-    year: int
-        year to filter geotiffs by
+    year: int | list[int]
+        year (or years) to filter geotiffs by
     epsg: int
         coordinate reference system that bounds uses
 
@@ -164,9 +327,11 @@ def get_naip_geotiffs(coverage: Geometry = None, year: int = None, epsg: int = 4
             wgs84_coverage = coverage
         bounds = wgs84_coverage.bounds
 
+    if year:
+        year_filter = pl.col("year").is_in(year) if isinstance(year, list) else pl.col("year") == year
     if coverage and year:
         rows = _NAIP_INDEX_DF.filter(
-            (pl.col("year") == year)
+            year_filter
             & ~(
                 (pl.col("max_x") < bounds[0])
                 | (pl.col("min_x") > bounds[2])
@@ -184,7 +349,7 @@ def get_naip_geotiffs(coverage: Geometry = None, year: int = None, epsg: int = 4
             )
         ).rows(named=True)
     else:
-        rows = _NAIP_INDEX_DF.filter((pl.col("year") == year)).rows(named=True)
+        rows = _NAIP_INDEX_DF.filter(year_filter).rows(named=True)
 
     geotiffs = [AWSGeotiff(**row) for row in rows]
 
@@ -195,21 +360,150 @@ def get_naip_geotiffs(coverage: Geometry = None, year: int = None, epsg: int = 4
     return geotiffs
 
 
-def get_tile_image(tile: mercantile.Tile, year: int) -> Image:
-    """Get a NAIP slippy map tile for a specific year.
+def get_tile_image(tile: mercantile.Tile, year: int | str, deadline: float | None = None, draft: bool = False) -> Image:
+    """Get a NAIP slippy map tile for a specific year, or composited from the newest imagery of a range of years.
 
     Parameters
     ----------
     tile: mercantile.Tile
         mercator slippy-map tile
-    year: int
-        NAIP imagery year
+    year: int | str
+        NAIP imagery year, year range (e.g. "2016-2021") or "latest" - see resolve_years
+    deadline: float | None
+        time.monotonic() time by which no more imagery should be read, None for no deadline
+    draft: bool
+        read imagery from coarse overviews only (i.e. a fast, low resolution draft of the tile)
 
     Returns
     -------
     Image
         a tile image, or None if imagery not available for tile for specific year
 
+    Raises
+    ------
+    RenderDeadlineExceeded
+        if deadline passed before all imagery was read, with the partially composited tile image
+
     """
     tile_box = bbox_to_box(mercantile.xy_bounds(tile))
-    return _build_image(tile_box, year)
+    return _build_image(tile_box, year, deadline=deadline, draft=draft)
+
+
+def get_image(
+    bbox: tuple[float, float, float, float],
+    year: int | str,
+    width: int,
+    height: int,
+    epsg: int = 3857,
+    max_geotiffs: int | None = None,
+    deadline: float | None = None,
+) -> Image:
+    """Get a NAIP image of an arbitrary bounding box, size and coordinate reference system.
+
+    The whole image is built in one pass, i.e. the NAIP index is queried once and each geotiff is read once, instead
+    of stitching the many tiles covering the bounding box.
+
+    Parameters
+    ----------
+    bbox: tuple[float, float, float, float]
+        left, bottom, right, top of image, in epsg coordinates
+    year: int | str
+        NAIP imagery year, year range (e.g. "2016-2021") or "latest" - see resolve_years
+    width: int
+        image width in pixels
+    height: int
+        image height in pixels
+    epsg: int
+        coordinate reference system of bbox & image
+    max_geotiffs: int | None
+        max number of NAIP geotiffs the image may be built from, None for no limit
+    deadline: float | None
+        time.monotonic() time by which no more imagery should be read, None for no deadline
+
+    Returns
+    -------
+    Image
+        image, or None if imagery not available for bounding box for specific year
+
+    Raises
+    ------
+    ValueError
+        if epsg is not a valid coordinate reference system, or bbox covers more than max_geotiffs geotiffs
+    RenderDeadlineExceeded
+        if deadline passed before all imagery was read, with the partially composited image
+
+    """
+    try:
+        pyproj.CRS.from_epsg(epsg)
+    except pyproj.exceptions.CRSError as e:
+        raise ValueError(f"invalid epsg {epsg}") from e
+    return _build_image(box(*bbox), year, epsg, height, width, deadline, max_geotiffs=max_geotiffs)
+
+
+def estimate_render_cost(tile: mercantile.Tile, year: int | str) -> int:
+    """Estimate the cost of building a tile image from NAIP imagery, in equivalent tile cache fetches.
+
+    Parameters
+    ----------
+    tile: mercantile.Tile
+        mercator slippy-map tile
+    year: int | str
+        NAIP imagery year, year range (e.g. "2016-2021") or "latest" - see resolve_years
+
+    Returns
+    -------
+    int
+        estimated cost, 0 if imagery not available for tile for specific year
+    """
+    tile_box = bbox_to_box(mercantile.bounds(tile))
+    return len(get_naip_geotiffs(tile_box, resolve_years(year))) * GEOTIFF_READ_COST
+
+
+def get_tile_images(tiles: list[mercantile.Tile], year: int | str) -> Iterator[tuple[mercantile.Tile, Image]]:
+    """Get NAIP slippy map tiles for a specific year, sharing work between tiles.
+
+    The NAIP index is queried once for the area covered by all tiles, and each geotiff is opened once, no matter how
+    many of the tiles it covers.  So tiles should be close to each other (e.g. a block of tiles).
+
+    Parameters
+    ----------
+    tiles: list[mercantile.Tile]
+        mercator slippy-map tiles
+    year: int | str
+        NAIP imagery year, year range (e.g. "2016-2021") or "latest" - see resolve_years
+
+    Returns
+    -------
+    Iterator[tuple[mercantile.Tile, Image]]
+        tiles and their images (None if imagery not available for tile), in order of tiles
+    """
+    if not tiles:
+        return
+
+    tiles_bounds = [mercantile.bounds(tile) for tile in tiles]
+    coverage = box(
+        min(b.west for b in tiles_bounds),
+        min(b.south for b in tiles_bounds),
+        max(b.east for b in tiles_bounds),
+        max(b.north for b in tiles_bounds),
+    )
+    candidate_geotiffs = get_naip_geotiffs(coverage, resolve_years(year))
+
+    with _open_vrts() as open_vrt:
+        for tile, tile_bounds in zip(tiles, tiles_bounds):
+            # same (bbox overlap) test as get_naip_geotiffs
+            geotiffs = [
+                gt
+                for gt in candidate_geotiffs
+                if not (
+                    gt.max_x < tile_bounds.west
+                    or gt.min_x > tile_bounds.east
+                    or gt.max_y < tile_bounds.south
+                    or gt.min_y > tile_bounds.north
+                )
+            ]
+            if not geotiffs:
+                yield tile, None
+                continue
+            tile_box = bbox_to_box(mercantile.xy_bounds(tile))
+            yield tile, _composite_image(tile_box, geotiffs, open_vrt)
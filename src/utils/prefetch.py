@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import mercantile
+
+import src.utils.resources as resources
+
+
+def get_prefetch_candidates(tile: mercantile.Tile, max_zoom: int) -> list[mercantile.Tile]:
+    """Get tiles a slippy map is likely to request next: edge neighbours (panning), then children (zooming in).
+
+    Parameters
+    ----------
+    tile: mercantile.Tile
+        mercator slippy-map tile just served
+    max_zoom: int
+        max zoom level tiles are served for
+
+    Returns
+    -------
+    list[mercantile.Tile]
+        candidate tiles, most likely first
+    """
+    max_xy = 2**tile.z - 1
+    neighbours = [
+        mercantile.Tile(tile.x + dx, tile.y + dy, tile.z)
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))
+        if 0 <= tile.x + dx <= max_xy and 0 <= tile.y + dy <= max_xy
+    ]
+    children = mercantile.children(tile) if tile.z < max_zoom else []
+    return neighbours + children
+
+
+def queue_renders(function_name: str, tiles: list[mercantile.Tile], year: int | str, skip_cached: bool = True) -> None:
+    """Queue renders of tiles into the tile cache, with an async (batch mode) Lambda invocation.
+
+    Parameters
+    ----------
+    function_name: str
+        name of Lambda function rendering tiles
+    tiles: list[mercantile.Tile]
+        tiles to render, at most BATCH_MAX_TILES
+    year: int | str
+        naip year
+    skip_cached: bool
+        don't render tiles already cached
+
+    Returns
+    -------
+    None
+    """
+    payload = {"year": year, "tiles": [{"x": t.x, "y": t.y, "z": t.z} for t in tiles], "skip_cached": skip_cached}
+    resources.get_lambda_client().invoke(
+        FunctionName=function_name, InvocationType="Event", Payload=json.dumps(payload)
+    )
+
+
+class Prefetcher:
+    """Queues renders of tiles likely to be requested next, into the tile cache, with an async Lambda invocation.
+
+    Prefetching is bounded per request (max_tiles) and per container (a token bucket refilled at max_tiles_per_minute).
+    Tiles recently served or queued by this container are assumed to be cached, and aren't queued (again).
+    """
+
+    def __init__(self, function_name: str, max_tiles: int, max_tiles_per_minute: int, known_tiles_max: int = 10000):
+        """Initialize Prefetcher.
+
+        Parameters
+        ----------
+        function_name: str
+            name of Lambda function rendering prefetched tiles (in batch mode)
+        max_tiles: int
+            max number of tiles prefetched per request
+        max_tiles_per_minute: int
+            max number of tiles prefetched by this container per minute
+        known_tiles_max: int
+            max number of recently served/queued tiles remembered
+        """
+        self.function_name = function_name
+        self.max_tiles = max_tiles
+        self.max_tiles_per_minute = max_tiles_per_minute
+        self._known_tiles_max = known_tiles_max
+        self._known_tiles = OrderedDict()
+        self._tokens = float(max_tiles_per_minute)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take_tokens(self, count: int) -> int:
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_tiles_per_minute, self._tokens + (now - self._refilled_at) * self.max_tiles_per_minute / 60
+        )
+        self._refilled_at = now
+        taken = min(count, int(self._tokens))
+        self._tokens -= taken
+        return taken
+
+    def _add_known_tile(self, key: tuple) -> None:
+        self._known_tiles[key] = True
+        self._known_tiles.move_to_end(key)
+        if len(self._known_tiles) > self._known_tiles_max:
+            self._known_tiles.popitem(last=False)
+
+    def select(self, tile: mercantile.Tile, year: int | str, max_zoom: int) -> list[mercantile.Tile]:
+        """Select tiles to prefetch after serving a tile, and record them (and the served tile) as known.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile just served
+        year: int | str
+            naip year
+        max_zoom: int
+            max zoom level tiles are served for
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            tiles to prefetch, within budget
+        """
+        with self._lock:
+            self._add_known_tile((tile, year))
+            candidates = [t for t in get_prefetch_candidates(tile, max_zoom) if (t, year) not in self._known_tiles][
+                : self.max_tiles
+            ]
+            tiles = candidates[: self._take_tokens(len(candidates))]
+            for t in tiles:
+                self._add_known_tile((t, year))
+            return tiles
+
+    def queue(self, tiles: list[mercantile.Tile], year: int | str) -> None:
+        """Queue renders of tiles not in the tile cache yet, with an async (batch mode) Lambda invocation.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            tiles to prefetch
+        year: int | str
+            naip year
+
+        Returns
+        -------
+        None
+        """
+        queue_renders(self.function_name, tiles, year)
@@ -0,0 +1,158 @@
+import os
+import threading
+from typing import Any, Callable
+
+import boto3
+from botocore.config import Config
+
+# S3 connections are shared by the request thread, rescaling threads & cache write threads - size pool accordingly
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 64))
+
+
+class ResourceRegistry:
+    """Process-wide registry of resources that are expensive to create (AWS clients, sessions, config...).
+
+    In AWS Lambda a process lives as long as its (warm) container, so resources are created once per container and
+    reused across requests.  Resources can be explicitly refreshed, e.g. after a configuration change.
+    """
+
+    def __init__(self):
+        """Initialize ResourceRegistry."""
+        self._lock = threading.RLock()
+        self._resources = {}
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Get a resource, creating it on first use.
+
+        Parameters
+        ----------
+        name: str
+            resource name
+        factory: Callable[[], Any]
+            function creating the resource
+
+        Returns
+        -------
+        Any
+            resource
+        """
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    def refresh(self, name: str | None = None) -> None:
+        """Drop a resource (or all resources), so that it is created again on next use.
+
+        Parameters
+        ----------
+        name: str | None
+            resource name, None to refresh all resources
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            names = [name] if name else list(self._resources.keys())
+            for resource_name in names:
+                self._resources.pop(resource_name, None)
+
+
+registry = ResourceRegistry()
+
+
+def _create_boto3_session() -> boto3.session.Session:
+    return boto3.session.Session()
+
+
+def _get_boto3_session() -> boto3.session.Session:
+    return registry.get("boto3_session", _create_boto3_session)
+
+
+def get_s3_config() -> Config:
+    """Get botocore config tuned for many small, concurrent S3 requests.
+
+    Returns
+    -------
+    Config
+        botocore config
+    """
+    return Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=5,
+        read_timeout=30,
+        retries={"max_attempts": 5, "mode": "adaptive"},
+        # presigned (tile cache) URLs are SigV4 signed, which all regions accept
+        signature_version="s3v4",
+    )
+
+
+def get_s3_client():
+    """Get the process-wide S3 client.
+
+    Returns
+    -------
+    S3.Client
+        boto3 S3 client
+    """
+    return registry.get("s3_client", lambda: _get_boto3_session().client("s3", config=get_s3_config()))
+
+
+def get_s3_resource():
+    """Get the process-wide S3 resource.
+
+    Returns
+    -------
+    S3.ServiceResource
+        boto3 S3 resource
+    """
+    return registry.get("s3_resource", lambda: _get_boto3_session().resource("s3", config=get_s3_config()))
+
+
+def get_lambda_client():
+    """Get the process-wide Lambda client.
+
+    Returns
+    -------
+    Lambda.Client
+        boto3 Lambda client
+    """
+    return registry.get("lambda_client", lambda: _get_boto3_session().client("lambda"))
+
+
+def _create_rasterio_session():
+    # rasterio is only imported when NAIP imagery is read - see src.utils.lazy
+    from rasterio.session import AWSSession
+
+    return AWSSession(session=_get_boto3_session(), requester_pays=True)
+
+
+def get_rasterio_session():
+    """Get the process-wide rasterio session used to read (requester pays) NAIP geotiffs.
+
+    Returns
+    -------
+    AWSSession
+        rasterio AWS session
+    """
+    return registry.get("rasterio_session", _create_rasterio_session)
+
+
+def refresh(name: str | None = None) -> None:
+    """Refresh a resource (or all resources) of the process-wide registry.
+
+    Parameters
+    ----------
+    name: str | None
+        resource name (e.g. "s3_client"), None to refresh all resources
+
+    Returns
+    -------
+    None
+    """
+    registry.refresh(name)
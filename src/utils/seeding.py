@@ -0,0 +1,310 @@
+import asyncio
+import heapq
+import random
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Callable
+
+import aiohttp
+import mercantile
+
+from src.utils import logger
+
+
+class AIMDConcurrency:
+    """Concurrency limit adapted with additive increase / multiplicative decrease (AIMD), as TCP congestion control.
+
+    The limit grows by 1 for every limit's worth of requests answered within target_latency, and is cut by
+    decrease_factor on overload (throttling, server errors, timeouts or slow responses).  Requests already in flight
+    when the limit is cut are likely to fail too, so the limit is cut at most once per cooldown.
+    """
+
+    def __init__(
+        self,
+        initial: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        target_latency: float = 30,
+        decrease_factor: float = 0.5,
+        cooldown: float | None = None,
+    ):
+        """Initialize AIMDConcurrency.
+
+        Parameters
+        ----------
+        initial: int
+            initial concurrency limit
+        min_limit: int
+            min concurrency limit
+        max_limit: int
+            max concurrency limit
+        target_latency: float
+            seconds a request may take before it is considered a sign of overload
+        decrease_factor: float
+            factor the limit is multiplied by on overload
+        cooldown: float | None
+            min seconds between two decreases, defaults to target_latency
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = target_latency if cooldown is None else cooldown
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> int:
+        """Current number of requests allowed in flight."""
+        return int(self._limit)
+
+    def on_success(self, latency: float) -> None:
+        """Record a successful request.
+
+        Parameters
+        ----------
+        latency: float
+            seconds the request took
+
+        Returns
+        -------
+        None
+        """
+        if latency > self.target_latency:
+            self.on_overload()
+        else:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def on_overload(self) -> None:
+        """Record a request failing because of overload (throttled, server error, timeout).
+
+        Returns
+        -------
+        None
+        """
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+
+
+class SeedCheckpoint:
+    """Append-only file of the tiles seeded so far, so an interrupted seed can resume where it stopped.
+
+    Each line is a seeded tile: "{year} {z} {x} {y}".
+    """
+
+    def __init__(self, path: str | Path):
+        """Initialize SeedCheckpoint, loading tiles seeded by previous runs.
+
+        Parameters
+        ----------
+        path: str | Path
+            checkpoint file, created if it doesn't exist
+        """
+        self.path = Path(path)
+        self._seeded = set()
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                if line.strip():
+                    year, z, x, y = line.split()
+                    self._seeded.add((year, mercantile.Tile(int(x), int(y), int(z))))
+        # opened on first tile recorded, e.g. not for dry runs
+        self._file = None
+        # tiles may be recorded from several threads, e.g. one per batch invocation
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        """Number of tiles seeded."""
+        return len(self._seeded)
+
+    def contains(self, tile: mercantile.Tile, year: int | str) -> bool:
+        """Check if a tile was seeded.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int | str
+            naip year
+
+        Returns
+        -------
+        bool
+            True if seeded, False otherwise
+        """
+        return (str(year), tile) in self._seeded
+
+    def add(self, tiles: list[mercantile.Tile], year: int | str) -> None:
+        """Record tiles as seeded.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            mercator slippy-map tiles
+        year: int | str
+            naip year
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._seeded.update((str(year), tile) for tile in tiles)
+            if not self._file:
+                self._file = self.path.open("a")
+            # flushed right away - a seed may be interrupted at any time
+            self._file.write("".join(f"{year} {tile.z} {tile.x} {tile.y}\n" for tile in tiles))
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close checkpoint file.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class HttpTileSeeder:
+    """Seeds tiles by requesting them from the tile API, as many at a time as the API can take.
+
+    Concurrency is adapted with AIMD: throttled (429), failed (5xx), timed out or slow requests cut the number of
+    requests in flight, which otherwise grows.  Such failed tiles are retried with exponential backoff (and jitter),
+    other failures (e.g. 400) are not.  Degraded tiles (render ran out of time, X-Tile-Degraded header) aren't cached
+    by the API, so they are retried too.  Tiles without imagery (404) are seeded too, as blank tiles.
+    """
+
+    def __init__(
+        self,
+        base_uri: str,
+        year: int | str,
+        concurrency: AIMDConcurrency,
+        checkpoint: SeedCheckpoint | None = None,
+        max_attempts: int = 5,
+        backoff: float = 1,
+        timeout: float = 120,
+        progress: Callable[[int], None] | None = None,
+    ):
+        """Initialize HttpTileSeeder.
+
+        Parameters
+        ----------
+        base_uri: str
+            tile API base URI, tiles are requested from {base_uri}/{year}/{z}/{y}/{x}
+        year: int | str
+            naip year
+        concurrency: AIMDConcurrency
+            adaptive concurrency limit
+        checkpoint: SeedCheckpoint | None
+            checkpoint seeded tiles are recorded in
+        max_attempts: int
+            max number of times a tile is requested
+        backoff: float
+            seconds before the first retry of a tile, doubled for each following retry
+        timeout: float
+            seconds before a request times out
+        progress: Callable[[int], None] | None
+            called with the number of tiles done (seeded or given up on)
+        """
+        self.base_uri = base_uri
+        self.year = year
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.progress = progress or (lambda _count: None)
+        self.counts = Counter()
+        # (time ready to be retried, attempt, tile)
+        self._retries = []
+
+    async def _request(self, session: aiohttp.ClientSession, tile: mercantile.Tile) -> tuple[int | None, bool, float]:
+        start = time.monotonic()
+        degraded = False
+        try:
+            url = f"{self.base_uri}/{self.year}/{tile.z}/{tile.y}/{tile.x}"
+            # a redirect (to the tile cache) means the tile is cached - no need to follow it
+            async with session.get(url, allow_redirects=False) as response:
+                await response.read()
+                status = response.status
+                degraded = response.headers.get("X-Tile-Degraded") == "true"
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logger.debug(f"request for tile {tile} failed: {e!r}")
+            status = None
+        return status, degraded, time.monotonic() - start
+
+    def _handle_response(
+        self, tile: mercantile.Tile, attempt: int, status: int | None, degraded: bool, latency: float
+    ) -> None:
+        # a degraded tile means the render ran out of time - the tile isn't cached, and a full render is queued
+        if status is not None and status != 429 and status < 500 and not degraded:
+            self.concurrency.on_success(latency)
+            if status < 400 or status == 404:
+                self.counts["seeded" if status != 404 else "empty"] += 1
+                if self.checkpoint:
+                    self.checkpoint.add([tile], self.year)
+            else:
+                logger.error(f"tile {tile} failed with status {status}, not retried")
+                self.counts["failed"] += 1
+            self.progress(1)
+            return
+
+        self.concurrency.on_overload()
+        if attempt < self.max_attempts:
+            delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            heapq.heappush(self._retries, (time.monotonic() + delay, attempt + 1, tile))
+            self.counts["retries"] += 1
+        else:
+            failure = "degraded" if degraded else status or "timeout/error"
+            logger.error(f"tile {tile} failed with status {failure} after {attempt} attempts")
+            self.counts["failed"] += 1
+            self.progress(1)
+
+    def _get_ready_retries(self) -> list[tuple[mercantile.Tile, int]]:
+        ready = []
+        while self._retries and self._retries[0][0] <= time.monotonic():
+            _, attempt, tile = heapq.heappop(self._retries)
+            ready.append((tile, attempt))
+        return ready
+
+    async def run(self, tiles: list[mercantile.Tile]) -> dict[str, int]:
+        """Seed tiles.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            mercator slippy-map tiles
+
+        Returns
+        -------
+        dict[str, int]
+            number of tiles by status (seeded, empty or failed), and number of retries
+        """
+        pending = deque((tile, 1) for tile in tiles)
+        in_flight = {}
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            while pending or in_flight or self._retries:
+                pending.extend(self._get_ready_retries())
+                while pending and len(in_flight) < self.concurrency.limit:
+                    tile, attempt = pending.popleft()
+                    in_flight[asyncio.create_task(self._request(session, tile))] = (tile, attempt)
+
+                # wake up when a request finishes, or when the next retry is due
+                next_retry = max(0.0, self._retries[0][0] - time.monotonic()) if self._retries else None
+                if not in_flight:
+                    await asyncio.sleep(next_retry)
+                    continue
+                done, _ = await asyncio.wait(in_flight, timeout=next_retry, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tile, attempt = in_flight.pop(task)
+                    self._handle_response(tile, attempt, *task.result())
+        return dict(self.counts)
@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function, while callers arriving before it finishes wait and receive the same
+    result (or exception).  Once the call finishes, the next caller for the key runs the function again.
+    """
+
+    def __init__(self):
+        """Initialize SingleFlight instance."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """Call func, unless a call for key is already in flight - in which case wait for its result.
+
+        Parameters
+        ----------
+        key: Hashable
+            key identifying the call
+        func: Callable
+            function to call
+        args:
+            positional arguments for func
+        kwargs:
+            keyword arguments for func
+
+        Returns
+        -------
+        Any
+            result of func
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = Future()
+                self._calls[key] = call
+
+        if not is_leader:
+            return call.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result
@@ -1,9 +1,102 @@
+import hashlib
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import cache
 from io import BytesIO
+from typing import Callable
 
-import boto3
 import mercantile
-from PIL import Image
+from botocore.exceptions import ClientError
+
+import src.utils.metrics as metrics
+import src.utils.resources as resources
+from src.utils.lazy import lazy_import
+
+# only needed to decode, rescale & encode tiles - not to serve cached tiles
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+
+def encode_tile_image(image: Image) -> bytes:
+    """PNG encode a tile image, the format tiles are stored in by all TileCache implementations.
+
+    Parameters
+    ----------
+    image: Image
+        tile image
+
+    Returns
+    -------
+    bytes
+        PNG encoded tile image
+    """
+    image_bytes = BytesIO()
+    image.save(image_bytes, format="PNG")
+    return image_bytes.getvalue()
+
+
+_rescale_thread_state = threading.local()
+
+
+def _mark_rescale_worker() -> None:
+    _rescale_thread_state.is_rescale_worker = True
+
+
+@cache
+def _get_rescale_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all TileCache instances for fetching tiles used in rescaling."""
+    return ThreadPoolExecutor(
+        max_workers=int(os.getenv("RESCALE_WORKERS", 16)),
+        thread_name_prefix="tile-rescale",
+        initializer=_mark_rescale_worker,
+    )
+
+
+def tile_etag(image_bytes: bytes) -> str:
+    """Compute entity tag of a PNG encoded tile image.
+
+    Parameters
+    ----------
+    image_bytes: bytes
+        PNG encoded tile image
+
+    Returns
+    -------
+    str
+        MD5 hex digest of image
+    """
+    return hashlib.md5(image_bytes).hexdigest()
+
+
+def _encode_blank_tile() -> bytes:
+    # PNG encoded transparent tile, byte for byte as encode_tile_image encodes it (first row "sub" filtered, following
+    # rows "up" filtered) - built without PIL, so serving cached tiles doesn't load the rendering stack
+    def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    pixel_rows = b"\x01\xff\x00\x00\x00" + bytes(255 * 4) + (b"\x02" + bytes(256 * 4)) * 255
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", 256, 256, 8, 6, 0, 0, 0))
+        + _png_chunk(b"IDAT", zlib.compress(pixel_rows))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+# PNG encoded blank tile (i.e. no NAIP imagery), saved by handle_null_tile_image
+BLANK_TILE_BYTES = _encode_blank_tile()
+BLANK_TILE_ETAG = tile_etag(BLANK_TILE_BYTES)
 
 
 class TileCache(ABC):
@@ -24,6 +117,10 @@ class TileCache(ABC):
         self._rescaling_enabled = rescaling_enabled
         self._downscale_max_zoom = downscale_max_zoom
         self._upscale_min_zoom = upscale_min_zoom
+        # limits on how much work is spent creating a missing tile by rescaling - see RescalePlanner
+        self.rescale_max_depth = 3
+        self.rescale_max_fetches = 64
+        self.render_cost_estimator = None
 
     @property
     def downscale_max_zoom(self) -> int:
@@ -41,8 +138,91 @@ class TileCache(ABC):
         return self._upscale_min_zoom
 
     @abstractmethod
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        pass
+
+    @abstractmethod
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
+
+        Returns
+        -------
+            None
+        """
+        pass
+
+    def get_tile_image_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        If the tile is not cached, and rescaling is enabled, an attempt is made to create the tile by rescaling cached
+        tiles from other zoom levels (see RescalePlanner).  Successfully rescaled tiles are saved back to the cache.
+
+        Unlike get_tile_image, cached tiles are returned as is, without being decoded.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache (or rescaled), None if not
+
+        """
+        image_bytes = self.get_tile_bytes(tile, year)
+        if image_bytes:
+            metrics.put_metric(metrics.CACHE_HIT)
+            metrics.put_metric(metrics.BYTES_READ, len(image_bytes), "Bytes")
+            if image_bytes == BLANK_TILE_BYTES:
+                metrics.put_metric(metrics.CACHE_HIT_BLANK)
+            return image_bytes
+
+        if not self.rescaling_enabled:
+            return None
+
+        rescale_plan = RescalePlanner(self).plan(tile, year)
+        if not rescale_plan:
+            return None
+
+        rescaled_tile_bytes = encode_tile_image(rescale_plan.execute())
+        metrics.put_metric(metrics.DOWNSCALE if rescale_plan.is_downscale else metrics.UPSCALE)
+        for source_bytes in filter(None, rescale_plan.sources.values()):
+            metrics.put_metric(metrics.BYTES_READ, len(source_bytes), "Bytes")
+        self.save_tile_bytes(tile, year, rescaled_tile_bytes, is_rescaled=True)
+        metrics.put_metric(metrics.BYTES_WRITTEN, len(rescaled_tile_bytes), "Bytes")
+        return rescaled_tile_bytes
+
     def get_tile_image(self, tile: mercantile.Tile, year: int) -> Image:
-        """Get tile image from cache.
+        """Get tile image from cache, rescaling cached tiles if needed (see get_tile_image_bytes).
 
         Parameters
         ----------
@@ -57,9 +237,9 @@ class TileCache(ABC):
             image if tile found in cache, None if not
 
         """
-        pass
+        image_bytes = self.get_tile_image_bytes(tile, year)
+        return Image.open(BytesIO(image_bytes)) if image_bytes else None
 
-    @abstractmethod
     def save_tile_image(self, tile: mercantile.Tile, year: int, image: Image, is_rescaled: bool = False) -> None:
         """Save tile image to cache.
 
@@ -78,7 +258,59 @@ class TileCache(ABC):
         -------
             None
         """
-        pass
+        self.save_tile_bytes(tile, year, encode_tile_image(image), is_rescaled)
+
+    def get_tile_etag(self, tile: mercantile.Tile, year: int) -> str | None:
+        """Get entity tag (MD5 hex digest of PNG encoded image) of a cached tile.
+
+        Implementations that store a content hash alongside tiles override this, to avoid reading the tile itself.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        str | None
+            entity tag if tile found in cache, None if not
+        """
+        image_bytes = self.get_tile_bytes(tile, year)
+        return tile_etag(image_bytes) if image_bytes else None
+
+    def get_tile_url(
+        self,
+        tile: mercantile.Tile,
+        year: int,
+        base_url: str = "",
+        expires_in: int = 3600,
+        cache_control: str | None = None,
+    ) -> str | None:
+        """Get a URL clients can download a cached tile from directly, if the cache is reachable over HTTP.
+
+        The tile is not checked to exist in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        base_url: str
+            base URL (e.g. of a CDN) the cache is served from, if empty a presigned URL is created (if supported)
+        expires_in: int
+            seconds a presigned URL is valid for
+        cache_control: str | None
+            Cache-Control header the tile should be served with, if supported
+
+        Returns
+        -------
+        str | None
+            URL of tile, None if cache isn't reachable over HTTP
+        """
+        return None
 
     @abstractmethod
     def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
@@ -118,10 +350,11 @@ class TileCache(ABC):
         """
         pass
 
-    @abstractmethod
     def handle_null_tile_image(self, tile: mercantile.Tile, year: int) -> None:
-        """Handle null tile image.  Will vary based on TileCache implementation.
+        """Handle null tile image.  Implementations may override this.
 
+        To maximize efficacy of rescaling and prevent redundant,expensive calls to generate tiles where NAIP imagery
+        is not available, just save blank tiles
         Parameters
         ----------
         tile: mercantile.Tile
@@ -134,10 +367,13 @@ class TileCache(ABC):
         None
 
         """
-        pass
+        self.save_tile_bytes(tile, year, BLANK_TILE_BYTES)
+
+    def acquire_render_lease(self, tile: mercantile.Tile, year: int, ttl: int) -> bool:
+        """Try to acquire a lease to render a tile, so concurrent invocations don't all render the same tile.
 
-    def get_tile_image_from_downscaling(self, tile: mercantile.Tile, year: int) -> Image:
-        """Create tile image via merging & downscaling tiles from the next zoom level.
+        Implementations backed by storage shared between invocations override this, by default no coordination
+        happens and the lease is always acquired.
 
         Parameters
         ----------
@@ -145,25 +381,61 @@ class TileCache(ABC):
             mercator slippy-map tile
         year: int
             naip year
+        ttl: int
+            seconds after which a lease is considered abandoned (e.g. holder timed out) and can be taken over
 
         Returns
         -------
-        Image
-            image if downscaling was possible, None otherwise
+        bool
+            True if lease acquired, False if another invocation holds the lease
         """
-        children_tile_images = []
-        for child_tile in mercantile.children(tile):
-            chile_tile_image = self.get_tile_image(child_tile, year)
-            if not chile_tile_image:
-                return None
-            children_tile_images.append(chile_tile_image)
+        return True
+
+    def release_render_lease(self, tile: mercantile.Tile, year: int) -> None:
+        """Release a lease acquired with acquire_render_lease.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        None
+        """
+        return None
+
+    def wait_for_tile_bytes(
+        self, tile: mercantile.Tile, year: int, timeout: float, poll_interval: float = 0.25
+    ) -> bytes | None:
+        """Poll cache until a tile (e.g. being rendered by another invocation) is available.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        timeout: float
+            max seconds to wait
+        poll_interval: float
+            seconds between polls
 
-        downscaled_tile_img = Image.new("RGBA", (512, 512))
-        downscaled_tile_img.paste(children_tile_images[0], (0, 0))
-        downscaled_tile_img.paste(children_tile_images[1], (256, 0))
-        downscaled_tile_img.paste(children_tile_images[3], (0, 256))
-        downscaled_tile_img.paste(children_tile_images[2], (256, 256))
-        return downscaled_tile_img.resize((256, 256))
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile became available within timeout, None otherwise
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            image_bytes = self.get_tile_bytes(tile, year)
+            if image_bytes:
+                return image_bytes
+            if time.monotonic() + poll_interval > deadline:
+                return None
+            time.sleep(poll_interval)
 
     def get_tile_image_from_upscaling(self, tile: mercantile.Tile, year: int) -> Image:
         """Create tile image via cropping & upscaling the tile from the previous zoom level.
@@ -201,6 +473,207 @@ class TileCache(ABC):
         return parent_tile_image.crop(crop_region).resize((256, 256))
 
 
+def _map_concurrently(func: Callable, items: list, stop_at_missing: bool = False) -> dict:
+    """Map func over items using the rescale thread pool, or serially if already running in the pool.
+
+    If stop_at_missing, gives up as soon as func returns a falsy result - remaining calls are cancelled, and only the
+    results of the calls made are returned.
+    """
+    results = {}
+    if getattr(_rescale_thread_state, "is_rescale_worker", False) or len(items) < 2:
+        for item in items:
+            results[item] = func(item)
+            if stop_at_missing and not results[item]:
+                break
+        return results
+
+    executor = _get_rescale_executor()
+    futures = {executor.submit(func, item): item for item in items}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        results.update((futures[future], future.result()) for future in done)
+        if stop_at_missing and any(not future.result() for future in done):
+            for future in pending:
+                future.cancel()
+            break
+    return results
+
+
+@dataclass
+class RescalePlan:
+    """Plan for creating a missing tile from cached tiles of other zoom levels.
+
+    sources maps each tile to its cached encoded image, or None for tiles that are not cached (and will be created
+    by merging their children).
+    """
+
+    tile: mercantile.Tile
+    year: int
+    sources: dict[mercantile.Tile, bytes | None]
+    is_downscale: bool
+
+    @property
+    def fetch_count(self) -> int:
+        """Number of cached tiles the plan uses."""
+        return sum(1 for image_bytes in self.sources.values() if image_bytes)
+
+    def _merge_children(self, tile: mercantile.Tile) -> "np.ndarray":
+        image_bytes = self.sources.get(tile)
+        if image_bytes:
+            return np.asarray(Image.open(BytesIO(image_bytes)).convert("RGBA"))
+
+        # mercantile.children order is top-left, top-right, bottom-right, bottom-left
+        tl, tr, br, bl = [self._merge_children(child_tile) for child_tile in mercantile.children(tile)]
+        merged_tile_data = np.concatenate((np.concatenate((tl, tr), axis=1), np.concatenate((bl, br), axis=1)), axis=0)
+        return np.asarray(Image.fromarray(merged_tile_data).resize((256, 256)))
+
+    def execute(self) -> Image:
+        """Create tile image from the plan's cached tiles.
+
+        Returns
+        -------
+        Image
+            rescaled tile image
+        """
+        if self.is_downscale:
+            return Image.fromarray(self._merge_children(self.tile))
+
+        # upscale - crop the region of the (single) cached ancestor tile covering the tile
+        ancestor_tile, image_bytes = next((t, b) for t, b in self.sources.items() if b)
+        scale = 2 ** (self.tile.z - ancestor_tile.z)
+        size = 256 // scale
+        left = (self.tile.x - ancestor_tile.x * scale) * size
+        top = (self.tile.y - ancestor_tile.y * scale) * size
+        ancestor_tile_image = Image.open(BytesIO(image_bytes))
+        return ancestor_tile_image.crop((left, top, left + size, top + size)).resize((256, 256))
+
+
+class RescalePlanner:
+    """Plans how a missing tile can be created by rescaling cached tiles.
+
+    Rather than recursively rescaling one zoom level at a time, the planner looks up the cached ancestors (for
+    upscaling) or descendants (for downscaling) of a tile up front, one zoom level at a time with concurrent lookups.
+    Planning gives up once max_depth zoom levels have been searched, or the plan would need more than max_fetches
+    cached tiles, or more fetches than the estimated cost of rendering the tile from NAIP imagery.  Lookups are
+    memoized, and the fetched images are reused when the plan is executed.
+    """
+
+    def __init__(
+        self,
+        tile_cache: "TileCache",
+        max_depth: int | None = None,
+        max_fetches: int | None = None,
+        render_cost_estimator: Callable[[mercantile.Tile, int], int] | None = None,
+        respect_zoom_limits: bool = True,
+    ):
+        """Initialize RescalePlanner.
+
+        Parameters
+        ----------
+        tile_cache: TileCache
+            tile cache to plan against
+        max_depth: int | None
+            max number of zoom levels away from requested tile to look for cached tiles, defaults to tile cache's
+        max_fetches: int | None
+            max number of cached tiles a plan may use, defaults to tile cache's
+        render_cost_estimator: Callable[[mercantile.Tile, int], int] | None
+            function estimating cost (in tile fetches) of rendering a tile for a year, defaults to tile cache's
+        respect_zoom_limits: bool
+            if False, tiles at any zoom level may be upscaled from their ancestors - used to serve an approximate
+            tile while the exact tile is being rendered elsewhere
+        """
+        self._tile_cache = tile_cache
+        self._respect_zoom_limits = respect_zoom_limits
+        self._max_depth = max_depth if max_depth is not None else tile_cache.rescale_max_depth
+        self._max_fetches = max_fetches if max_fetches is not None else tile_cache.rescale_max_fetches
+        self._render_cost_estimator = render_cost_estimator or tile_cache.render_cost_estimator
+        self._lookups = {}
+
+    def _lookup(self, tiles: list[mercantile.Tile], year: int, stop_at_missing: bool = False) -> bool:
+        """Look up tiles not looked up yet, returns False if stop_at_missing and any of the tiles is missing."""
+        new_tiles = [tile for tile in tiles if (tile, year) not in self._lookups]
+        tile_images = _map_concurrently(lambda t: self._tile_cache.get_tile_bytes(t, year), new_tiles, stop_at_missing)
+        for tile, image_bytes in tile_images.items():
+            self._lookups[(tile, year)] = image_bytes
+        return not stop_at_missing or all(self._lookups.get((tile, year)) for tile in tiles)
+
+    def _get_max_fetches(self, tile: mercantile.Tile, year: int) -> int:
+        if not self._render_cost_estimator:
+            return self._max_fetches
+        return min(self._max_fetches, self._render_cost_estimator(tile, year))
+
+    def _plan_downscale(self, tile: mercantile.Tile, year: int, max_fetches: int) -> RescalePlan | None:
+        sources = {}
+        unresolved_tiles = [tile]
+        for depth in range(self._max_depth):
+            # children of tiles above downscale_max_zoom are never merged
+            if unresolved_tiles[0].z > self._tile_cache.downscale_max_zoom:
+                return None
+            children_tiles = [child_tile for t in unresolved_tiles for child_tile in mercantile.children(t)]
+            # every child tile costs at least one fetch
+            if sum(1 for b in sources.values() if b) + len(children_tiles) > max_fetches:
+                return None
+
+            # a missing child on the last level searched can't be merged from its own children, so the plan fails
+            # at the first one - cancel the remaining lookups rather than waiting on them
+            is_last_level = depth == self._max_depth - 1 or children_tiles[0].z > self._tile_cache.downscale_max_zoom
+            if not self._lookup(children_tiles, year, stop_at_missing=is_last_level):
+                return None
+            unresolved_tiles = []
+            for child_tile in children_tiles:
+                image_bytes = self._lookups[(child_tile, year)]
+                sources[child_tile] = image_bytes
+                if not image_bytes:
+                    unresolved_tiles.append(child_tile)
+
+            if not unresolved_tiles:
+                return RescalePlan(tile=tile, year=year, sources=sources, is_downscale=True)
+        return None
+
+    def _plan_upscale(self, tile: mercantile.Tile, year: int, max_fetches: int) -> RescalePlan | None:
+        if max_fetches < 1:
+            return None
+        ancestor_tiles = []
+        ancestor_tile = tile
+        for _ in range(self._max_depth):
+            # only tiles at or above upscale_min_zoom are created from their parents
+            if ancestor_tile.z == 0 or (
+                self._respect_zoom_limits and ancestor_tile.z < self._tile_cache.upscale_min_zoom
+            ):
+                break
+            ancestor_tile = mercantile.parent(ancestor_tile)
+            ancestor_tiles.append(ancestor_tile)
+
+        self._lookup(ancestor_tiles, year)
+        for ancestor_tile in ancestor_tiles:
+            image_bytes = self._lookups[(ancestor_tile, year)]
+            if image_bytes:
+                return RescalePlan(tile=tile, year=year, sources={ancestor_tile: image_bytes}, is_downscale=False)
+        return None
+
+    def plan(self, tile: mercantile.Tile, year: int) -> RescalePlan | None:
+        """Plan how to create a missing tile by rescaling cached tiles.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        RescalePlan | None
+            plan if tile can be created within limits, None otherwise
+        """
+        if tile.z <= self._tile_cache.downscale_max_zoom:
+            return self._plan_downscale(tile, year, self._get_max_fetches(tile, year))
+        if tile.z >= self._tile_cache.upscale_min_zoom or not self._respect_zoom_limits:
+            return self._plan_upscale(tile, year, self._get_max_fetches(tile, year))
+        return None
+
+
 class S3TileCache(TileCache):
     """S3 implementation of TileCache."""
 
@@ -221,15 +694,18 @@ class S3TileCache(TileCache):
             kick-in.
         """
         super(S3TileCache, self).__init__(rescaling_enabled, downscale_max_zoom, upscale_min_zoom)
-        self.s3 = boto3.resource("s3").Bucket(bucket)
+        self.s3 = resources.get_s3_resource().Bucket(bucket)
         if not self.s3.creation_date:
             raise ValueError(f"S3 Bucket: {bucket} not found")
+        # unlike resources, clients are thread safe - use client for per tile calls made from rescaling threads
+        self._bucket = bucket
+        self._client = self.s3.meta.client
 
     def _get_key(self, tile: mercantile.Tile, year: int):
         return f"{year}/{tile.z}/{tile.y}/{tile.x}.png"
 
-    def get_tile_image(self, tile: mercantile.Tile, year: int) -> Image:
-        """Get tile image from cache.
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
 
         Parameters
         ----------
@@ -240,30 +716,50 @@ class S3TileCache(TileCache):
 
         Returns
         -------
-        Image
-            image if tile found in cache, None if not
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
 
         """
-        if self.contains_tile_image(tile, year):
-            file_key = self._get_key(tile, year)
-            image_bytes = BytesIO(self.s3.Object(key=file_key).get()["Body"].read())
-            return Image.open(image_bytes)
+        file_key = self._get_key(tile, year)
+        try:
+            return self._client.get_object(Bucket=self._bucket, Key=file_key)["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
 
-        rescaled_tile = None
-        if tile.z <= self.downscale_max_zoom:
-            rescaled_tile = self.get_tile_image_from_downscaling(tile, year)
-        elif tile.z >= self.upscale_min_zoom:
-            rescaled_tile = self.get_tile_image_from_upscaling(tile, year)
-        if rescaled_tile:
-            self.save_tile_image(tile, year, rescaled_tile, is_rescaled=True)
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
 
-        return rescaled_tile
+        Returns
+        -------
+            None
+        """
+        file_key = self._get_key(tile, year)
+        self._client.put_object(
+            Bucket=self._bucket,
+            Key=file_key,
+            Body=image_bytes,
+            ContentType="image/png",
+            Metadata={"is_rescaled": "true"} if is_rescaled else {},
+        )
 
-    def handle_null_tile_image(self, tile: mercantile.Tile, year: int) -> None:
-        """Handle null tile image.
+    def get_tile_etag(self, tile: mercantile.Tile, year: int) -> str | None:
+        """Get entity tag (MD5 hex digest of PNG encoded image) of a cached tile, without reading the tile.
+
+        For objects uploaded with a single PUT (as tiles are), the S3 ETag is the MD5 of the object.
 
-        To maximize efficacy of rescaling and prevent redundant,expensive calls to generate tiles where NAIP imagery
-        is not available, just save blank tiles
         Parameters
         ----------
         tile: mercantile.Tile
@@ -273,14 +769,29 @@ class S3TileCache(TileCache):
 
         Returns
         -------
-        None
-
+        str | None
+            entity tag if tile found in cache, None if not
         """
-        blank_tile = Image.new("RGBA", (256, 256), (255, 0, 0, 0))
-        self.save_tile_image(tile, year, blank_tile)
+        try:
+            etag = self._client.head_object(Bucket=self._bucket, Key=self._get_key(tile, year))["ETag"].strip('"')
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        # multipart upload ETags (e.g. tiles copied in by other tools) aren't a MD5 of the object
+        return etag if "-" not in etag else super(S3TileCache, self).get_tile_etag(tile, year)
 
-    def save_tile_image(self, tile: mercantile.Tile, year: int, image: Image, is_rescaled: bool = False) -> None:
-        """Save tile image to cache.
+    def get_tile_url(
+        self,
+        tile: mercantile.Tile,
+        year: int,
+        base_url: str = "",
+        expires_in: int = 3600,
+        cache_control: str | None = None,
+    ) -> str | None:
+        """Get a URL clients can download a cached tile from directly - a CDN URL or a presigned S3 URL.
+
+        The tile is not checked to exist in cache.
 
         Parameters
         ----------
@@ -288,22 +799,25 @@ class S3TileCache(TileCache):
             mercator slippy-map tile
         year: int
             naip year
-        image: Image
-            tile image
-        is_rescaled: bool
-            boolean to indicate if tile was created from rescaling other tiles
+        base_url: str
+            base URL of a CDN (e.g. CloudFront) in front of the bucket, if empty a presigned URL is created
+        expires_in: int
+            seconds a presigned URL is valid for
+        cache_control: str | None
+            Cache-Control header S3 serves the tile with (presigned URLs only)
 
         Returns
         -------
-            None
+        str | None
+            URL of tile
         """
         file_key = self._get_key(tile, year)
-        image_bytes = BytesIO()
-        image.save(image_bytes, format="PNG")
-        self.s3.Object(key=file_key).put(
-            Body=image_bytes.getvalue(),
-            Metadata={"is_rescaled": "true"} if is_rescaled else {},
-        )
+        if base_url:
+            return f"{base_url.rstrip('/')}/{file_key}"
+        params = {"Bucket": self._bucket, "Key": file_key}
+        if cache_control:
+            params["ResponseCacheControl"] = cache_control
+        return self._client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
 
     def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
         """Checks if tile image exists in cache.
@@ -322,7 +836,8 @@ class S3TileCache(TileCache):
 
         """
         file_key = self._get_key(tile, year)
-        return len(list(self.s3.objects.filter(Prefix=file_key))) > 0
+        response = self._client.list_objects_v2(Bucket=self._bucket, Prefix=file_key, MaxKeys=1)
+        return response.get("KeyCount", 0) > 0
 
     def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
         """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
@@ -341,9 +856,1544 @@ class S3TileCache(TileCache):
 
         """
         inventory = set()
-        for obj in self.s3.objects.filter(Prefix=(str(year))):
+        for obj in self.s3.objects.filter(Prefix=f"{year}/"):
             if obj.key.endswith(".png"):
                 _, z, y, x = obj.key.split("/")
                 inventory.add((int(x.split(".")[0]), int(y), int(z)))
 
         return list(filter(lambda tile: (tile.x, tile.y, tile.z) not in inventory, tiles))
+
+    def _get_lease_key(self, tile: mercantile.Tile, year: int):
+        return f"leases/{year}/{tile.z}/{tile.y}/{tile.x}.lease"
+
+    def acquire_render_lease(self, tile: mercantile.Tile, year: int, ttl: int) -> bool:
+        """Try to acquire a lease to render a tile, so concurrent invocations don't all render the same tile.
+
+        The lease is an S3 object created with a conditional (If-None-Match) put, which only one invocation can win.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        ttl: int
+            seconds after which a lease is considered abandoned (e.g. holder timed out) and can be taken over
+
+        Returns
+        -------
+        bool
+            True if lease acquired, False if another invocation holds the lease
+        """
+        lease_key = self._get_lease_key(tile, year)
+        for _ in range(2):
+            try:
+                self._client.put_object(Bucket=self._bucket, Key=lease_key, Body=b"", IfNoneMatch="*")
+                return True
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    raise
+
+            try:
+                lease_created = self._client.head_object(Bucket=self._bucket, Key=lease_key)["LastModified"]
+            except ClientError:
+                # lease released in the meantime
+                continue
+            if (datetime.now(timezone.utc) - lease_created).total_seconds() < ttl:
+                return False
+            self._client.delete_object(Bucket=self._bucket, Key=lease_key)
+        return False
+
+    def release_render_lease(self, tile: mercantile.Tile, year: int) -> None:
+        """Release a lease acquired with acquire_render_lease.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        None
+        """
+        self._client.delete_object(Bucket=self._bucket, Key=self._get_lease_key(tile, year))
+
+
+class MemoryTileCache(TileCache):
+    """In-process, byte bounded LRU implementation of TileCache.
+
+    Intended to be used as the first tier of a TieredTileCache so that warm containers/workers can serve repeated
+    requests for the same tiles without a round trip to a slower cache.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: int | None = None,
+        rescaling_enabled: bool = False,
+        downscale_max_zoom: int = 11,
+        upscale_min_zoom: int = 18,
+    ):
+        """Initialize MemoryTileCache instance.
+
+        Parameters
+        ----------
+        max_bytes: int
+            max number of encoded tile bytes held in memory before least recently used tiles are evicted
+        ttl: int | None
+            seconds a tile stays valid after being saved, None for no expiration
+        rescaling_enabled: bool
+            Create missing tiles by rescaling cached tiles
+        downscale_max_zoom: int
+            Max zoom level where attempts to create missing tile from downscaling will kick in
+        upscale_min_zoom: int
+            Min zoom level where attempts to create missing tile from upscaling will kick in
+        """
+        super(MemoryTileCache, self).__init__(rescaling_enabled, downscale_max_zoom, upscale_min_zoom)
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        """Number of encoded tile bytes currently held in memory."""
+        return self._size_bytes
+
+    def _get_key(self, tile: mercantile.Tile, year: int):
+        return year, tile.z, tile.y, tile.x
+
+    def _pop(self, key: tuple) -> None:
+        image_bytes, _ = self._entries.pop(key)
+        self._size_bytes -= len(image_bytes)
+
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        key = self._get_key(tile, year)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            image_bytes, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return image_bytes
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles (not tracked in memory)
+
+        Returns
+        -------
+            None
+        """
+        if len(image_bytes) > self._max_bytes:
+            return
+
+        key = self._get_key(tile, year)
+        expires_at = time.monotonic() + self._ttl if self._ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (image_bytes, expires_at)
+            self._size_bytes += len(image_bytes)
+            while self._size_bytes > self._max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        return self.get_tile_bytes(tile, year) is not None
+
+    def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        return [tile for tile in tiles if not self.contains_tile_image(tile, year)]
+
+
+class FileSystemTileCache(TileCache):
+    """Filesystem (local disk, EFS, etc.) implementation of TileCache.
+
+    Tiles are stored using the same year/z/y/x layout as S3TileCache keys.  To avoid huge directory listings at high
+    zoom levels, y directories and x files are grouped into shard directories of shard_size entries, e.g. with a
+    shard_size of 256: {year}/{z}/{y // 256}/{y}/{x // 256}/{x}.png.  A shard_size of 0 disables sharding, which mirrors
+    S3TileCache keys exactly.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        shard_size: int = 256,
+        rescaling_enabled: bool = True,
+        downscale_max_zoom: int = 11,
+        upscale_min_zoom: int = 18,
+    ):
+        """Initialize FileSystemTileCache instance.
+
+        Parameters
+        ----------
+        directory: str
+            root directory of tile cache, created if it does not exist
+        shard_size: int
+            max number of y directories/x files grouped under a single shard directory, 0 to disable sharding
+        rescaling_enabled: bool
+            Create missing tiles by rescaling cached tiles
+        downscale_max_zoom: int
+            Max zoom level where attempts to create missing tile from downscaling will kick in
+        upscale_min_zoom: int
+            Min zoom level where attempts to create missing tile from upscaling will kick in
+        """
+        super(FileSystemTileCache, self).__init__(rescaling_enabled, downscale_max_zoom, upscale_min_zoom)
+        self._directory = directory
+        self._shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        """Root directory of tile cache."""
+        return self._directory
+
+    def _get_key(self, tile: mercantile.Tile, year: int):
+        if self._shard_size:
+            return os.path.join(
+                self._directory,
+                str(year),
+                str(tile.z),
+                str(tile.y // self._shard_size),
+                str(tile.y),
+                str(tile.x // self._shard_size),
+                f"{tile.x}.png",
+            )
+        return os.path.join(self._directory, str(year), str(tile.z), str(tile.y), f"{tile.x}.png")
+
+    def _scan_tile_files(self, path: str = None):
+        """Recursively yield os.DirEntry of every tile file under path (defaults to cache root directory)."""
+        try:
+            with os.scandir(path or self._directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield from self._scan_tile_files(entry.path)
+                    elif entry.name.endswith(".png"):
+                        yield entry
+        except FileNotFoundError:
+            return
+
+    def _scan_zoom(self, year: int, zoom: int) -> set[tuple[int, int, int]]:
+        zoom_dir = os.path.join(self._directory, str(year), str(zoom))
+        # position of the y directory, relative to the zoom directory
+        y_index = 1 if self._shard_size else 0
+        inventory = set()
+        for entry in self._scan_tile_files(zoom_dir):
+            parts = os.path.relpath(entry.path, zoom_dir).split(os.sep)
+            inventory.add((int(entry.name[:-4]), int(parts[y_index]), zoom))
+        return inventory
+
+    def _write(self, path: str, image_bytes: bytes) -> None:
+        # write to a temp file in the same directory and rename, so readers never see a partially written tile
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fid:
+                fid.write(image_bytes)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        try:
+            with open(self._get_key(tile, year), "rb") as fid:
+                return fid.read()
+        except FileNotFoundError:
+            return None
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles (not tracked on filesystem)
+
+        Returns
+        -------
+            None
+        """
+        self._write(self._get_key(tile, year), image_bytes)
+
+    def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        return os.path.exists(self._get_key(tile, year))
+
+    def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
+
+        Only the zoom level directories of the requested tiles are scanned.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        inventory = set()
+        for zoom in {tile.z for tile in tiles}:
+            inventory |= self._scan_zoom(year, zoom)
+
+        return list(filter(lambda tile: (tile.x, tile.y, tile.z) not in inventory, tiles))
+
+    def _get_lease_key(self, tile: mercantile.Tile, year: int):
+        return os.path.join(self._directory, "leases", str(year), str(tile.z), str(tile.y), f"{tile.x}.lease")
+
+    def acquire_render_lease(self, tile: mercantile.Tile, year: int, ttl: int) -> bool:
+        """Try to acquire a lease to render a tile, so concurrent processes don't all render the same tile.
+
+        The lease is a lock file created exclusively (O_EXCL), which only one process can win.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        ttl: int
+            seconds after which a lease is considered abandoned (e.g. holder crashed) and can be taken over
+
+        Returns
+        -------
+        bool
+            True if lease acquired, False if another process holds the lease
+        """
+        lease_path = self._get_lease_key(tile, year)
+        os.makedirs(os.path.dirname(lease_path), exist_ok=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                pass
+
+            try:
+                lease_created = os.path.getmtime(lease_path)
+            except FileNotFoundError:
+                # lease released in the meantime
+                continue
+            if time.time() - lease_created < ttl:
+                return False
+            self.release_render_lease(tile, year)
+        return False
+
+    def release_render_lease(self, tile: mercantile.Tile, year: int) -> None:
+        """Release a lease acquired with acquire_render_lease.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        None
+        """
+        try:
+            os.remove(self._get_lease_key(tile, year))
+        except FileNotFoundError:
+            pass
+
+
+class DiskTileCache(FileSystemTileCache):
+    """Size capped FileSystemTileCache, with optional TTL.
+
+    Intended to be used as a middle tier of a TieredTileCache, backed by Lambda's ephemeral /tmp storage or a local
+    disk.  Least recently used tiles are evicted when the cache grows past max_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str = "/tmp/naip-tile-cache",
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl: int | None = None,
+        shard_size: int = 256,
+        rescaling_enabled: bool = False,
+        downscale_max_zoom: int = 11,
+        upscale_min_zoom: int = 18,
+    ):
+        """Initialize DiskTileCache instance.
+
+        Parameters
+        ----------
+        directory: str
+            directory tiles are written to, created if it does not exist
+        max_bytes: int
+            max number of bytes written to disk before least recently used tiles are evicted
+        ttl: int | None
+            seconds a tile stays valid after being saved, None for no expiration
+        shard_size: int
+            max number of y directories/x files grouped under a single shard directory, 0 to disable sharding
+        rescaling_enabled: bool
+            Create missing tiles by rescaling cached tiles
+        downscale_max_zoom: int
+            Max zoom level where attempts to create missing tile from downscaling will kick in
+        upscale_min_zoom: int
+            Min zoom level where attempts to create missing tile from upscaling will kick in
+        """
+        super(DiskTileCache, self).__init__(
+            directory, shard_size, rescaling_enabled, downscale_max_zoom, upscale_min_zoom
+        )
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._size_bytes = sum(entry.stat().st_size for entry in self._scan_tile_files())
+
+    @property
+    def size_bytes(self) -> int:
+        """Number of tile bytes currently written to disk."""
+        return self._size_bytes
+
+    def _is_expired(self, mtime: float) -> bool:
+        return self._ttl is not None and mtime + self._ttl < time.time()
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._size_bytes -= size
+
+    def _evict(self) -> None:
+        # evict least recently accessed tiles until cache is comfortably below its cap
+        tile_files = sorted(self._scan_tile_files(), key=lambda entry: entry.stat().st_atime)
+        for tile_file in tile_files:
+            if self._size_bytes <= self._max_bytes * 0.8:
+                break
+            self._remove(tile_file.path)
+
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        path = self._get_key(tile, year)
+        try:
+            mtime = os.path.getmtime(path)
+            if self._is_expired(mtime):
+                self._remove(path)
+                return None
+            with open(path, "rb") as fid:
+                image_bytes = fid.read()
+            # record access time explicitly, filesystems are often mounted with noatime/relatime
+            os.utime(path, (time.time(), mtime))
+            return image_bytes
+        except FileNotFoundError:
+            return None
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles (not tracked on disk)
+
+        Returns
+        -------
+            None
+        """
+        if len(image_bytes) > self._max_bytes:
+            return
+
+        path = self._get_key(tile, year)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._write(path, image_bytes)
+
+        with self._lock:
+            self._size_bytes += len(image_bytes) - previous_size
+        if self._size_bytes > self._max_bytes:
+            self._evict()
+
+    def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        try:
+            return not self._is_expired(os.path.getmtime(self._get_key(tile, year)))
+        except FileNotFoundError:
+            return False
+
+    def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        if self._ttl is None:
+            return super(DiskTileCache, self).get_missing_tile_images(tiles, year)
+        return [tile for tile in tiles if not self.contains_tile_image(tile, year)]
+
+
+class TieredTileCache(TileCache):
+    """TileCache composed of multiple TileCache tiers, ordered fastest to slowest.
+
+    Reads go through the tiers in order, and a tile found in a slower tier is copied into all faster tiers.  Writes
+    go through to every tier.  Rescaling happens at this level (against all tiers) so tiers themselves should have
+    rescaling disabled.
+    """
+
+    def __init__(
+        self,
+        tiers: list[TileCache],
+        rescaling_enabled: bool = True,
+        downscale_max_zoom: int = 11,
+        upscale_min_zoom: int = 18,
+    ):
+        """Initialize TieredTileCache instance.
+
+        Parameters
+        ----------
+        tiers: list[TileCache]
+            cache tiers, ordered fastest to slowest
+        rescaling_enabled: bool
+            Create missing tiles by rescaling cached tiles
+        downscale_max_zoom: int
+            Max zoom level where attempts to create missing tile from downscaling will kick in
+        upscale_min_zoom: int
+            Min zoom level where attempts to create missing tile from upscaling will kick in
+        """
+        super(TieredTileCache, self).__init__(rescaling_enabled, downscale_max_zoom, upscale_min_zoom)
+        if not tiers:
+            raise ValueError("TieredTileCache requires at least one tier")
+        self.tiers = tiers
+
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from the fastest tier that has it, backfilling faster tiers.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        for i, tier in enumerate(self.tiers):
+            image_bytes = tier.get_tile_bytes(tile, year)
+            if image_bytes:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.save_tile_bytes(tile, year, image_bytes)
+                return image_bytes
+        return None
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to every tier.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
+
+        Returns
+        -------
+            None
+        """
+        for tier in self.tiers:
+            tier.save_tile_bytes(tile, year, image_bytes, is_rescaled)
+
+    def handle_null_tile_image(self, tile: mercantile.Tile, year: int) -> None:
+        """Handle null tile image by deferring to every tier.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        None
+
+        """
+        for tier in self.tiers:
+            tier.handle_null_tile_image(tile, year)
+
+    def get_tile_etag(self, tile: mercantile.Tile, year: int) -> str | None:
+        """Get entity tag of a cached tile from the first (i.e. fastest) tier it is cached in.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        str | None
+            entity tag if tile found in cache, None if not
+        """
+        for tier in self.tiers:
+            etag = tier.get_tile_etag(tile, year)
+            if etag:
+                return etag
+        return None
+
+    def get_tile_url(
+        self,
+        tile: mercantile.Tile,
+        year: int,
+        base_url: str = "",
+        expires_in: int = 3600,
+        cache_control: str | None = None,
+    ) -> str | None:
+        """Get a URL clients can download a cached tile from directly, from the last (i.e. shared) tier.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        base_url: str
+            base URL (e.g. of a CDN) the cache is served from, if empty a presigned URL is created (if supported)
+        expires_in: int
+            seconds a presigned URL is valid for
+        cache_control: str | None
+            Cache-Control header the tile should be served with, if supported
+
+        Returns
+        -------
+        str | None
+            URL of tile, None if last tier isn't reachable over HTTP
+        """
+        return self.tiers[-1].get_tile_url(tile, year, base_url, expires_in, cache_control)
+
+    def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in any tier.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        return any(tier.contains_tile_image(tile, year) for tier in self.tiers)
+
+    def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in every tier from a large/deep list of tiles.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        missing_tiles = tiles
+        for tier in self.tiers:
+            if not missing_tiles:
+                break
+            missing_tiles = tier.get_missing_tile_images(missing_tiles, year)
+        return missing_tiles
+
+    def acquire_render_lease(self, tile: mercantile.Tile, year: int, ttl: int) -> bool:
+        """Try to acquire a lease to render a tile, using the slowest (i.e. shared) tier.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        ttl: int
+            seconds after which a lease is considered abandoned (e.g. holder timed out) and can be taken over
+
+        Returns
+        -------
+        bool
+            True if lease acquired, False if another invocation holds the lease
+        """
+        return self.tiers[-1].acquire_render_lease(tile, year, ttl)
+
+    def release_render_lease(self, tile: mercantile.Tile, year: int) -> None:
+        """Release a lease acquired with acquire_render_lease.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        None
+        """
+        self.tiers[-1].release_render_lease(tile, year)
+
+
+# seconds a write waits for another connection's (batch) transaction to finish
+MBTILES_BUSY_TIMEOUT = 60
+
+_MBTILES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS images (tile_id TEXT PRIMARY KEY, tile_data BLOB);
+CREATE TABLE IF NOT EXISTS map (
+    zoom_level INTEGER,
+    tile_column INTEGER,
+    tile_row INTEGER,
+    tile_id TEXT,
+    is_rescaled INTEGER DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS map_index ON map (zoom_level, tile_column, tile_row);
+CREATE VIEW IF NOT EXISTS tiles AS
+    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column, map.tile_row AS tile_row,
+           images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+
+class MBTilesTileCache(TileCache):
+    """MBTiles (SQLite) implementation of TileCache.
+
+    One MBTiles file per year is kept in directory (e.g. 2021.mbtiles), using WAL journal mode so that readers are not
+    blocked by writers.  Tile images are deduplicated by content hash - which is particularly effective for the many
+    identical blank tiles saved by handle_null_tile_image.  Per the MBTiles spec, tile_row uses the TMS (flipped y)
+    scheme.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        rescaling_enabled: bool = True,
+        downscale_max_zoom: int = 11,
+        upscale_min_zoom: int = 18,
+    ):
+        """Initialize MBTilesTileCache instance.
+
+        Parameters
+        ----------
+        directory: str
+            directory MBTiles files are kept in, created if it does not exist
+        rescaling_enabled: bool
+            Create missing tiles by rescaling cached tiles
+        downscale_max_zoom: int
+            Max zoom level where attempts to create missing tile from downscaling will kick in
+        upscale_min_zoom: int
+            Min zoom level where attempts to create missing tile from upscaling will kick in
+        """
+        super(MBTilesTileCache, self).__init__(rescaling_enabled, downscale_max_zoom, upscale_min_zoom)
+        self._directory = directory
+        # connections shared by threads (and the lock guarding them), and per thread connections of open batches
+        self._connections = {}
+        self._lock = threading.RLock()
+        self._batch_state = threading.local()
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, year: int) -> str:
+        """Path of the MBTiles file for a year.
+
+        Parameters
+        ----------
+        year: int
+            naip year
+
+        Returns
+        -------
+        str
+            path of MBTiles file
+        """
+        return os.path.join(self._directory, f"{year}.mbtiles")
+
+    def _connect(self, year: int) -> sqlite3.Connection:
+        # autocommit mode, transactions are managed explicitly so writes can be batched.  writes wait (up to timeout
+        # seconds) for another connection's open batch transaction, rather than failing as "database is locked"
+        connection = sqlite3.connect(
+            self.get_path(year), check_same_thread=False, isolation_level=None, timeout=MBTILES_BUSY_TIMEOUT
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_MBTILES_SCHEMA)
+        connection.executemany(
+            "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+            [("name", f"naip-{year}"), ("format", "png"), ("type", "baselayer")],
+        )
+        return connection
+
+    def _get_connection(self, year: int) -> sqlite3.Connection:
+        with self._lock:
+            connection = self._connections.get(year)
+            if connection is None:
+                connection = self._connections[year] = self._connect(year)
+            return connection
+
+    @contextmanager
+    def _use_connection(self, year: int):
+        batch_connections = getattr(self._batch_state, "connections", None)
+        if batch_connections is None:
+            # shared connection - the lock is only held for the statements run with it
+            with self._lock:
+                yield self._get_connection(year)
+            return
+
+        # connection of this thread's batch, with its transaction open until the batch exits
+        connection = batch_connections.get(year)
+        if connection is None:
+            connection = batch_connections[year] = self._connect(year)
+            connection.execute("BEGIN")
+        yield connection
+
+    @staticmethod
+    def _get_key(tile: mercantile.Tile) -> tuple[int, int, int]:
+        return tile.z, tile.x, (2**tile.z) - 1 - tile.y
+
+    @contextmanager
+    def batch(self):
+        """Context manager that groups all writes made within it into a single transaction per year.
+
+        Intended for seeding/exporting, where committing every tile individually would dominate write time.  Batches
+        are per thread: the batch's writes go through its own connections, so other threads aren't blocked by it - but
+        don't see its writes until it exits.  A batch opened within a batch (by the same thread) joins it.
+        """
+        if getattr(self._batch_state, "connections", None) is not None:
+            yield self
+            return
+
+        batch_connections = self._batch_state.connections = {}
+        try:
+            yield self
+        except BaseException:
+            for connection in batch_connections.values():
+                connection.execute("ROLLBACK")
+            raise
+        else:
+            for connection in batch_connections.values():
+                connection.execute("COMMIT")
+        finally:
+            del self._batch_state.connections
+            for connection in batch_connections.values():
+                connection.close()
+
+    def close(self) -> None:
+        """Close all open MBTiles connections."""
+        with self._lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
+
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        with self._use_connection(year) as connection:
+            row = connection.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                self._get_key(tile),
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
+
+        Returns
+        -------
+            None
+        """
+        tile_id = hashlib.sha1(image_bytes).hexdigest()
+        with self._use_connection(year) as connection:
+            # only the connections of batches are in a transaction
+            in_batch_transaction = connection.in_transaction
+            if not in_batch_transaction:
+                connection.execute("BEGIN")
+            connection.execute(
+                "INSERT OR IGNORE INTO images (tile_id, tile_data) VALUES (?, ?)", (tile_id, image_bytes)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id, is_rescaled) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (*self._get_key(tile), tile_id, int(is_rescaled)),
+            )
+            if not in_batch_transaction:
+                connection.execute("COMMIT")
+
+    def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        with self._use_connection(year) as connection:
+            row = connection.execute(
+                "SELECT 1 FROM map WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                self._get_key(tile),
+            ).fetchone()
+        return row is not None
+
+    def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
+
+        The requested tiles are loaded into a temp table and joined against the map index in a single query.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        with self._use_connection(year) as connection:
+            in_batch_transaction = connection.in_transaction
+            if not in_batch_transaction:
+                connection.execute("BEGIN")
+            connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS requested_tiles (zoom_level INTEGER, tile_column INTEGER, tile_row "
+                "INTEGER)"
+            )
+            connection.execute("DELETE FROM requested_tiles")
+            connection.executemany("INSERT INTO requested_tiles VALUES (?, ?, ?)", map(self._get_key, tiles))
+            inventory = set(
+                connection.execute(
+                    "SELECT r.zoom_level, r.tile_column, r.tile_row FROM requested_tiles r JOIN map m "
+                    "ON m.zoom_level = r.zoom_level AND m.tile_column = r.tile_column AND m.tile_row = r.tile_row"
+                ).fetchall()
+            )
+            if not in_batch_transaction:
+                connection.execute("COMMIT")
+
+        return [tile for tile in tiles if self._get_key(tile) not in inventory]
+
+
+# bundle layout: header (magic, bundle size), index of bundle_size * bundle_size (offset, length) entries in row major
+# order, then tile data.  The high bit of an index entry's length flags the tile as rescaled.
+_BUNDLE_MAGIC = b"NTB1"
+_BUNDLE_HEADER = struct.Struct("<4sI")
+_BUNDLE_INDEX_ENTRY = struct.Struct("<II")
+_BUNDLE_RESCALED_FLAG = 1 << 31
+
+
+class S3BundleTileCache(TileCache):
+    """S3 implementation of TileCache that packs tiles into bundles.
+
+    Instead of one S3 object per tile, a bundle_size x bundle_size block of tiles of one zoom level is stored in a
+    single S3 object, with a fixed size index at the start of the object (similar to Esri compact cache bundles).
+    Tiles are read with ranged GETs, and bundle indexes are cached in process, so a cache hit costs a single request
+    once the bundle index is known.
+
+    Rewriting a bundle means reading & writing the whole object, so tiles saved outside batch() (e.g. on the Lambda
+    miss path) are written as loose, per tile objects next to their bundle, and read from there until compact() merges
+    them into the bundle offline.  Tiles saved within batch() (e.g. when seeding or exporting) are written straight to
+    their bundles, with a single rewrite per bundle.  Bundle rewrites are guarded by S3 conditional writes so that
+    concurrent writers don't lose each others tiles, and ranged reads by the ETag of the bundle the index was read from,
+    so a stale index never reads another tile's bytes.  Loose tiles take precedence over their bundle: the positions of
+    a bundle's loose tiles are listed (and cached) along with its index, so a tile re-saved after being merged into its
+    bundle is served from its loose object - by other processes once their cached index expires.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        bundle_size: int = 128,
+        index_cache_size: int = 64,
+        index_ttl: int = 300,
+        rescaling_enabled: bool = True,
+        downscale_max_zoom: int = 11,
+        upscale_min_zoom: int = 18,
+    ):
+        """Initialize S3BundleTileCache instance.
+
+        Parameters
+        ----------
+        bucket: str
+            S3 bucket name to be used as tile cache
+        bundle_size: int
+            number of tile rows/columns in a bundle
+        index_cache_size: int
+            max number of bundle indexes cached in process
+        index_ttl: int
+            seconds a cached bundle index is trusted before being fetched again
+        rescaling_enabled: bool
+            Create missing tiles by rescaling cached tiles
+        downscale_max_zoom: int
+            Max zoom level where attempts to create missing tile from downscaling will kick in
+        upscale_min_zoom: int
+            Min zoom level where attempts to create missing tile from upscaling will kick in
+        """
+        super(S3BundleTileCache, self).__init__(rescaling_enabled, downscale_max_zoom, upscale_min_zoom)
+        self.s3 = resources.get_s3_resource().Bucket(bucket)
+        if not self.s3.creation_date:
+            raise ValueError(f"S3 Bucket: {bucket} not found")
+        self._bucket = bucket
+        self._client = self.s3.meta.client
+        self._bundle_size = bundle_size
+        self._header_size = _BUNDLE_HEADER.size + (bundle_size**2) * _BUNDLE_INDEX_ENTRY.size
+        self._index_cache_size = index_cache_size
+        self._index_ttl = index_ttl
+        self._indexes = OrderedDict()
+        self._pending = {}
+        self._batch_depth = 0
+        self._lock = threading.RLock()
+
+    def _get_key(self, tile: mercantile.Tile, year: int) -> tuple[str, int]:
+        row, col = tile.y // self._bundle_size, tile.x // self._bundle_size
+        position = (tile.y % self._bundle_size) * self._bundle_size + (tile.x % self._bundle_size)
+        return f"bundles/{year}/{tile.z}/{row}/{col}.bundle", position
+
+    @staticmethod
+    def _get_loose_key(key: str, position: int) -> str:
+        return f"{key}.d/{position}.png"
+
+    def _cache_index(self, key: str, index: bytes | None, etag: str | None, loose_positions: set[int]) -> None:
+        with self._lock:
+            self._indexes[key] = (index, etag, loose_positions, time.monotonic() + self._index_ttl)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self._index_cache_size:
+                self._indexes.popitem(last=False)
+
+    def _drop_index(self, key: str) -> None:
+        with self._lock:
+            self._indexes.pop(key, None)
+
+    def _add_loose_position(self, key: str, position: int) -> None:
+        # a loose tile overrides its bundled version - make it visible to cached index readers right away
+        with self._lock:
+            cached_index = self._indexes.get(key)
+            if cached_index:
+                cached_index[2].add(position)
+
+    def _get_cached_index(self, key: str) -> tuple[bytes | None, str | None, set[int]] | None:
+        with self._lock:
+            cached_index = self._indexes.get(key)
+            if cached_index and cached_index[3] > time.monotonic():
+                self._indexes.move_to_end(key)
+                return cached_index[0], cached_index[1], set(cached_index[2])
+        return None
+
+    def _get_index(self, key: str) -> tuple[bytes | None, str | None, set[int]]:
+        # bundle index, ETag of the bundle it was read from, and positions of the bundle's loose tiles
+        return self._get_cached_index(key) or self._fetch_index(key)
+
+    def _fetch_index(self, key: str) -> tuple[bytes | None, str | None, set[int]]:
+        try:
+            response = self._client.get_object(Bucket=self._bucket, Key=key, Range=f"bytes=0-{self._header_size - 1}")
+            index, etag = response["Body"].read(), response["ETag"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            index, etag = None, None
+
+        if index is not None:
+            magic, bundle_size = _BUNDLE_HEADER.unpack_from(index)
+            if magic != _BUNDLE_MAGIC or bundle_size != self._bundle_size:
+                raise ValueError(f"{key} is not a bundle with bundle_size: {self._bundle_size}")
+        loose_positions = self._list_loose_positions(key)
+        self._cache_index(key, index, etag, loose_positions)
+        return index, etag, loose_positions
+
+    def _get_index_entry(self, index: bytes, position: int) -> tuple[int, int, bool] | None:
+        offset, length = _BUNDLE_INDEX_ENTRY.unpack_from(
+            index, _BUNDLE_HEADER.size + position * _BUNDLE_INDEX_ENTRY.size
+        )
+        if not length:
+            return None
+        return offset, length & ~_BUNDLE_RESCALED_FLAG, bool(length & _BUNDLE_RESCALED_FLAG)
+
+    def _unpack_bundle(self, bundle: bytes) -> dict[int, tuple[bytes, bool]]:
+        tiles = {}
+        for position in range(self._bundle_size**2):
+            index_entry = self._get_index_entry(bundle, position)
+            if index_entry:
+                offset, length, is_rescaled = index_entry
+                tiles[position] = (bundle[offset : offset + length], is_rescaled)
+        return tiles
+
+    def _pack_bundle(self, tiles: dict[int, tuple[bytes, bool]]) -> bytes:
+        index = bytearray(self._header_size)
+        _BUNDLE_HEADER.pack_into(index, 0, _BUNDLE_MAGIC, self._bundle_size)
+        data = BytesIO()
+        # identical tiles (e.g. blank tiles) share the same data
+        offsets = {}
+        for position, (image_bytes, is_rescaled) in sorted(tiles.items()):
+            if image_bytes not in offsets:
+                offsets[image_bytes] = self._header_size + data.tell()
+                data.write(image_bytes)
+            length = len(image_bytes) | (_BUNDLE_RESCALED_FLAG if is_rescaled else 0)
+            _BUNDLE_INDEX_ENTRY.pack_into(
+                index, _BUNDLE_HEADER.size + position * _BUNDLE_INDEX_ENTRY.size, offsets[image_bytes], length
+            )
+        return bytes(index) + data.getvalue()
+
+    def _write_bundle(self, key: str, tiles: dict[int, tuple[bytes, bool]], max_attempts: int = 5) -> None:
+        for _ in range(max_attempts):
+            try:
+                response = self._client.get_object(Bucket=self._bucket, Key=key)
+                bundle_tiles = self._unpack_bundle(response["Body"].read())
+                condition = {"IfMatch": response["ETag"]}
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                    raise
+                bundle_tiles = {}
+                condition = {"IfNoneMatch": "*"}
+
+            bundle_tiles.update(tiles)
+            bundle = self._pack_bundle(bundle_tiles)
+            try:
+                response = self._client.put_object(Bucket=self._bucket, Key=key, Body=bundle, **condition)
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    # another writer updated the bundle since it was read - merge again
+                    continue
+                raise
+            # tiles written to the bundle replace their loose versions
+            etag, loose_positions = response["ETag"], self._list_loose_positions(key)
+            self._delete_loose_tiles(key, loose_positions & set(tiles))
+            self._cache_index(key, bundle[: self._header_size], etag, loose_positions - set(tiles))
+            return
+
+        raise RuntimeError(f"Unable to write bundle {key} after {max_attempts} attempts")
+
+    def _get_bundle_tile_bytes(self, key: str, position: int) -> bytes | None:
+        for _ in range(2):
+            index, etag, _ = self._get_index(key)
+            index_entry = self._get_index_entry(index, position) if index else None
+            if not index_entry:
+                return None
+
+            offset, length, _ = index_entry
+            try:
+                response = self._client.get_object(
+                    Bucket=self._bucket, Key=key, Range=f"bytes={offset}-{offset + length - 1}", IfMatch=etag
+                )
+                return response["Body"].read()
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("PreconditionFailed", "412"):
+                    raise
+                # bundle rewritten (and compacted) since its index was read - offsets are stale
+                self._drop_index(key)
+        raise RuntimeError(f"Bundle {key} keeps changing while being read")
+
+    def _get_loose_tile_bytes(self, key: str, position: int) -> bytes | None:
+        try:
+            return self._client.get_object(Bucket=self._bucket, Key=self._get_loose_key(key, position))["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def _delete_loose_tiles(self, key: str, positions: set[int]) -> None:
+        loose_objects = [{"Key": self._get_loose_key(key, position)} for position in sorted(positions)]
+        for i in range(0, len(loose_objects), 1000):
+            self._client.delete_objects(Bucket=self._bucket, Delete={"Objects": loose_objects[i : i + 1000]})
+
+    def _list_loose_positions(self, key: str) -> set[int]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        positions = set()
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=f"{key}.d/"):
+            for obj in page.get("Contents", []):
+                positions.add(int(obj["Key"].rsplit("/", 1)[1].split(".")[0]))
+        return positions
+
+    @contextmanager
+    def batch(self):
+        """Context manager that defers bundle writes until it exits, writing each bundle touched within it once."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+        self.flush()
+
+    def flush(self) -> None:
+        """Write all pending tiles to their bundles."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                key, pending_tiles = next(iter(self._pending.items()))
+                tiles = dict(pending_tiles)
+
+            # tiles stay pending (and readable) while their bundle is written, unless saved again meanwhile
+            self._write_bundle(key, tiles)
+            with self._lock:
+                for position, tile in tiles.items():
+                    if pending_tiles.get(position) is tile:
+                        del pending_tiles[position]
+                if not pending_tiles and self._pending.get(key) is pending_tiles:
+                    del self._pending[key]
+
+    def get_tile_bytes(self, tile: mercantile.Tile, year: int) -> bytes | None:
+        """Get encoded tile image from cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bytes | None
+            PNG encoded image if tile found in cache, None if not
+
+        """
+        key, position = self._get_key(tile, year)
+        with self._lock:
+            pending_tile = self._pending.get(key, {}).get(position)
+        if pending_tile:
+            return pending_tile[0]
+
+        cached_index = self._get_cached_index(key)
+        index, _, loose_positions = cached_index or self._fetch_index(key)
+        if position not in loose_positions and index and self._get_index_entry(index, position):
+            image_bytes = self._get_bundle_tile_bytes(key, position)
+            if image_bytes is not None:
+                return image_bytes
+
+        # loose tiles override their bundled version - and with a cached index, may have been saved (by another
+        # process) since the bundle's loose tiles were listed
+        if position in loose_positions or cached_index:
+            image_bytes = self._get_loose_tile_bytes(key, position)
+            if image_bytes is not None:
+                self._add_loose_position(key, position)
+                return image_bytes
+            if position in loose_positions:
+                # merged into the bundle (by compact) since its loose tiles were listed
+                self._drop_index(key)
+                return self._get_bundle_tile_bytes(key, position)
+        return None
+
+    def save_tile_bytes(self, tile: mercantile.Tile, year: int, image_bytes: bytes, is_rescaled: bool = False) -> None:
+        """Save encoded tile image to cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+        image_bytes: bytes
+            PNG encoded tile image
+        is_rescaled: bool
+            boolean to indicate if tile was created from rescaling other tiles
+
+        Returns
+        -------
+            None
+        """
+        key, position = self._get_key(tile, year)
+        with self._lock:
+            if self._batch_depth:
+                self._pending.setdefault(key, {})[position] = (image_bytes, is_rescaled)
+                return
+
+        self._client.put_object(
+            Bucket=self._bucket,
+            Key=self._get_loose_key(key, position),
+            Body=image_bytes,
+            ContentType="image/png",
+            Metadata={"is_rescaled": "true"} if is_rescaled else {},
+        )
+        self._add_loose_position(key, position)
+
+    def contains_tile_image(self, tile: mercantile.Tile, year: int) -> bool:
+        """Checks if tile image exists in cache.
+
+        Parameters
+        ----------
+        tile: mercantile.Tile
+            mercator slippy-map tile
+        year: int
+            naip year
+
+        Returns
+        -------
+        bool
+            True if tile exists, False if not exists
+
+        """
+        key, position = self._get_key(tile, year)
+        with self._lock:
+            if position in self._pending.get(key, {}):
+                return True
+        index, _, loose_positions = self._get_index(key)
+        if position in loose_positions or (index and self._get_index_entry(index, position)):
+            return True
+        try:
+            self._client.head_object(Bucket=self._bucket, Key=self._get_loose_key(key, position))
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return False
+            raise
+
+    def get_missing_tile_images(self, tiles: list[mercantile.Tile], year: int) -> list[mercantile.Tile]:
+        """Efficiently find what tile images are missing in this cache from a large/deep list of tiles.
+
+        Only the index (and list of loose tiles) of each bundle the tiles fall in is read.
+
+        Parameters
+        ----------
+        tiles: list[mercantile.Tile]
+            list of tiles to check
+        year: int
+            naip year
+
+        Returns
+        -------
+        list[mercantile.Tile]
+            subset of tiles not found in cache
+
+        """
+        bundles = {}
+        for tile in tiles:
+            key, position = self._get_key(tile, year)
+            bundles.setdefault(key, []).append((tile, position))
+
+        inventory = set()
+        for key, bundle_tiles in bundles.items():
+            index, _, loose_positions = self._get_index(key)
+            with self._lock:
+                cached_positions = set(self._pending.get(key, {})) | loose_positions
+            for tile, position in bundle_tiles:
+                if position in cached_positions or (index and self._get_index_entry(index, position)):
+                    inventory.add(tile)
+
+        return [tile for tile in tiles if tile not in inventory]
+
+    def compact(self, year: int | None = None) -> int:
+        """Merge loose tiles (saved outside batch()) into their bundles, and delete them.
+
+        Meant to be run offline (e.g. from the admin CLI), each bundle with loose tiles is rewritten once.
+
+        Parameters
+        ----------
+        year: int | None
+            naip year to compact, None for all years
+
+        Returns
+        -------
+        int
+            number of tiles merged into bundles
+        """
+        loose_keys = {}
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=f"bundles/{year}/" if year else "bundles/"):
+            for obj in page.get("Contents", []):
+                if ".bundle.d/" in obj["Key"]:
+                    key, loose_name = obj["Key"].split(".d/", 1)
+                    loose_keys.setdefault(key, {})[int(loose_name.split(".")[0])] = obj["Key"]
+
+        merged_tiles = 0
+        for key, positions in loose_keys.items():
+            tiles = {}
+            for position, loose_key in positions.items():
+                response = self._client.get_object(Bucket=self._bucket, Key=loose_key)
+                tiles[position] = (response["Body"].read(), response["Metadata"].get("is_rescaled") == "true")
+            # merged loose tiles are deleted by the bundle write
+            self._write_bundle(key, tiles)
+            merged_tiles += len(tiles)
+        return merged_tiles
@@ -0,0 +1,107 @@
+import math
+
+import mercantile
+import numpy as np
+import shapely
+from shapely import Geometry
+
+# latitude limits of the web mercator projection (and so of slippy map tiles)
+MAX_LATITUDE = 85.0511287798066
+
+
+def _lng_to_tile_x(lng: np.ndarray, zoom: int) -> np.ndarray:
+    return (lng + 180.0) / 360.0 * 2**zoom
+
+
+def _lat_to_tile_y(lat: np.ndarray, zoom: int) -> np.ndarray:
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    return (1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * 2**zoom
+
+
+def _tile_bounds(xs: np.ndarray, ys: np.ndarray, zoom: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # vectorized mercantile.bounds
+    west = xs / 2**zoom * 360.0 - 180.0
+    east = (xs + 1) / 2**zoom * 360.0 - 180.0
+    north = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * ys / 2**zoom))))
+    south = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (ys + 1) / 2**zoom))))
+    return west, south, east, north
+
+
+def _tile_ranges(footprint_bounds: np.ndarray, zoom: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # tiles only touching a footprint's edge don't intersect it - same as mercantile.tiles
+    max_tile = 2**zoom - 1
+    west, south, east, north = footprint_bounds.T
+    min_x = np.clip(np.floor(_lng_to_tile_x(west, zoom)), 0, max_tile).astype(np.int64)
+    max_x = np.clip(np.ceil(_lng_to_tile_x(east, zoom)) - 1, min_x, max_tile).astype(np.int64)
+    min_y = np.clip(np.floor(_lat_to_tile_y(north, zoom)), 0, max_tile).astype(np.int64)
+    max_y = np.clip(np.ceil(_lat_to_tile_y(south, zoom)) - 1, min_y, max_tile).astype(np.int64)
+    return min_x, max_x, min_y, max_y
+
+
+def enumerate_tiles(footprint_bounds: np.ndarray, zoom: int, coverage: Geometry | None = None) -> list[mercantile.Tile]:
+    """Enumerate the tiles of a zoom level intersecting any of a set of (rectangular) imagery footprints.
+
+    Footprints (e.g. NAIP geotiff extents) are WGS84 rectangles, as are slippy map tiles - so the tiles intersecting a
+    footprint are exactly the block of tiles spanned by its bounds.  Blocks are generated and deduplicated with numpy,
+    instead of testing every tile in the bounds of all footprints, so tiles in gaps between footprints are never
+    generated.  Tiles are then (optionally) filtered by a coverage geometry with a single vectorized shapely predicate.
+
+    Parameters
+    ----------
+    footprint_bounds: np.ndarray
+        (n, 4) array of footprint west, south, east, north bounds (WGS84)
+    zoom: int
+        zoom level
+    coverage: Geometry | None
+        WGS84 geometry tiles must also intersect, None for no coverage filter
+
+    Returns
+    -------
+    list[mercantile.Tile]
+        tiles, ordered by x then y
+    """
+    footprint_bounds = np.asarray(footprint_bounds, dtype=float).reshape(-1, 4)
+    if not len(footprint_bounds):
+        return []
+
+    min_x, max_x, min_y, max_y = _tile_ranges(footprint_bounds, zoom)
+    widths = max_x - min_x + 1
+    counts = widths * (max_y - min_y + 1)
+
+    # expand each footprint's block of tiles - offset of each tile within its block
+    footprint_index = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = min_x[footprint_index] + offsets % widths[footprint_index]
+    ys = min_y[footprint_index] + offsets // widths[footprint_index]
+
+    # deduplicate tiles of overlapping footprints, as x,y packed in a single integer
+    keys = np.unique((xs << zoom) | ys)
+    xs, ys = keys >> zoom, keys & (2**zoom - 1)
+
+    if coverage is not None:
+        shapely.prepare(coverage)
+        tile_boxes = shapely.box(*_tile_bounds(xs, ys, zoom))
+        intersects = shapely.intersects(coverage, tile_boxes)
+        xs, ys = xs[intersects], ys[intersects]
+
+    return [mercantile.Tile(x, y, zoom) for x, y in zip(xs.tolist(), ys.tolist())]
+
+
+def intersects_footprints(tile: mercantile.Tile, footprint_bounds: np.ndarray) -> bool:
+    """Test if a tile intersects any of a set of (rectangular) imagery footprints, the same way enumerate_tiles does.
+
+    Parameters
+    ----------
+    tile: mercantile.Tile
+        mercator slippy-map tile
+    footprint_bounds: np.ndarray
+        (n, 4) array of footprint west, south, east, north bounds (WGS84)
+
+    Returns
+    -------
+    bool
+        True if tile intersects a footprint, False otherwise
+    """
+    footprint_bounds = np.asarray(footprint_bounds, dtype=float).reshape(-1, 4)
+    min_x, max_x, min_y, max_y = _tile_ranges(footprint_bounds, tile.z)
+    return bool(np.any((min_x <= tile.x) & (tile.x <= max_x) & (min_y <= tile.y) & (tile.y <= max_y)))
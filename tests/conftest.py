@@ -4,6 +4,8 @@ from io import BytesIO
 import pytest
 from PIL import Image
 
+from src.utils.env import TileServerConfig
+
 
 class Helpers:
     """A class to contain generic helper methods to be used in tests."""
@@ -47,3 +49,36 @@ class Helpers:
 @pytest.fixture
 def helpers():
     return Helpers
+
+
+@pytest.fixture
+def local_tile_server_config(tmp_path, monkeypatch):
+    """Return a function configuring the tile server with a filesystem tile cache (in tmp_path) & no rescaling.
+
+    Keyword arguments override TileServerConfig fields.  NAIP tiles are rendered as solid green tiles, unless the test
+    patches src.utils.naip.get_tile_image itself.
+    """
+
+    def _local_tile_server_config(**overrides) -> TileServerConfig:
+        tile_server_config = TileServerConfig(
+            **{
+                "image_format": "PNG",
+                "max_zoom": 20,
+                "min_zoom": 10,
+                "downscale_max_zoom": 11,
+                "upscale_min_zoom": 18,
+                "rescaling_enabled": False,
+                "tile_cache_bucket": "",
+                "tile_cache_backend": "filesystem",
+                "tile_cache_dir": str(tmp_path),
+                **overrides,
+            }
+        )
+        monkeypatch.setattr("src.lambda_functions.get_naip_tile._get_tile_server_config", lambda: tile_server_config)
+        monkeypatch.setattr(
+            "src.utils.naip.get_tile_image",
+            lambda _tile, _year, *_args, **_kwargs: Image.new("RGBA", (256, 256), (0, 128, 0, 255)),
+        )
+        return tile_server_config
+
+    return _local_tile_server_config
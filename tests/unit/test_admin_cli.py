@@ -1,6 +1,6 @@
 from click.testing import CliRunner
 
-from src.admin_cli.commands.cache import seed
+from src.admin_cli.commands.cache import export_mbtiles, prune, seed
 
 
 def test_seed_cache_missing_required_params():
@@ -36,3 +36,25 @@ def test_seed_cache_invalid_coverage_wkt():
     runner = CliRunner()
     result = runner.invoke(seed, ["--to_zoom", 10, "-y", 2011, "--coverage", "foo", "--dry-run"])
     assert result.exit_code == 2
+
+
+def test_seed_cache_checkpoint_requires_http_api(tmp_path):
+    """Test confirms that a checkpoint with local seeding (which doesn't record one) will signal a usage error."""
+    runner = CliRunner()
+    checkpoint = str(tmp_path / "seed.checkpoint")
+    result = runner.invoke(seed, ["--to_zoom", 10, "-y", 2011, "--local", "--checkpoint", checkpoint, "--dry-run"])
+    assert result.exit_code == 2
+
+
+def test_export_mbtiles_missing_required_params():
+    """Test confirms that if required parameters are not provided, CLI will signal usage error."""
+    runner = CliRunner()
+    result = runner.invoke(export_mbtiles, [])
+    assert result.exit_code == 2
+
+
+def test_prune_cache_requires_policy():
+    """Test confirms that if no prune filter is provided, CLI will signal usage error."""
+    runner = CliRunner()
+    result = runner.invoke(prune, ["-y", 2021, "--bucket", "some-bucket"])
+    assert result.exit_code == 2
@@ -0,0 +1,89 @@
+import asyncio
+import uuid
+
+import boto3
+import mercantile
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.utils.async_tile_cache import AsyncS3TileCache
+
+# tests run against a local moto S3 server - skipped unless moto[server] is installed
+ThreadedMotoServer = pytest.importorskip("moto.server").ThreadedMotoServer
+
+
+@pytest.fixture(scope="module")
+def moto_server(monkeypatch_module):
+    """Start a local moto S3 server, returning its endpoint url."""
+    monkeypatch_module.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch_module.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch_module.delenv("AWS_SESSION_TOKEN", raising=False)
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def monkeypatch_module():
+    with pytest.MonkeyPatch.context() as mp:
+        yield mp
+
+
+@pytest.fixture(scope="module")
+def test_bucket(moto_server):
+    """Return name of bucket created on moto server for this run of tests."""
+    test_bucket_name = f"aws-naip-tile-server-test-{uuid.uuid4()}"
+    s3 = boto3.resource("s3", endpoint_url=moto_server, region_name="us-west-2")
+    s3.create_bucket(Bucket=test_bucket_name, CreateBucketConfiguration={"LocationConstraint": "us-west-2"})
+    return test_bucket_name
+
+
+@pytest.fixture()
+def tile_image():
+    """Return random tile sized image."""
+    imarray = np.random.rand(256, 256, 3) * 255
+    return Image.fromarray(imarray.astype("uint8")).convert("RGBA")
+
+
+def _async_tile_cache(moto_server, test_bucket) -> AsyncS3TileCache:
+    return AsyncS3TileCache(test_bucket, max_connections=20, region="us-west-2", endpoint_url=moto_server)
+
+
+def test_async_save_and_get_tile(moto_server, test_bucket, tile_image):
+    """Test confirms saving tile and getting it back works."""
+
+    async def _run():
+        async with _async_tile_cache(moto_server, test_bucket) as tile_cache:
+            tile = mercantile.Tile(1, 1, 1)
+            await tile_cache.save_tile_image(tile, 2099, tile_image)
+            assert await tile_cache.contains_tile_image(tile, 2099)
+            assert await tile_cache.get_tile_image(tile, 2099) is not None
+
+    asyncio.run(_run())
+
+
+def test_async_get_nonexisting_tile(moto_server, test_bucket):
+    """Test confirms getting non-cached tile returns None."""
+
+    async def _run():
+        async with _async_tile_cache(moto_server, test_bucket) as tile_cache:
+            tile = mercantile.Tile(1, 1, 5)
+            assert not await tile_cache.contains_tile_image(tile, 2099)
+            assert await tile_cache.get_tile_bytes(tile, 2099) is None
+
+    asyncio.run(_run())
+
+
+def test_async_get_missing_tiles(moto_server, test_bucket, tile_image):
+    """Test confirms concurrent saves and inventory listing find exactly the tiles that were not saved."""
+    tiles = list(mercantile.tiles(-105.3, 38.8, -105.0, 39.1, zooms=[12, 13]))
+
+    async def _run():
+        async with _async_tile_cache(moto_server, test_bucket) as tile_cache:
+            await asyncio.gather(*[tile_cache.save_tile_image(tile, 2098, tile_image) for tile in tiles[::2]])
+            return await tile_cache.get_missing_tile_images(tiles, 2098)
+
+    assert asyncio.run(_run()) == tiles[1::2]
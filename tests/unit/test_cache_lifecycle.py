@@ -0,0 +1,90 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import mercantile
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.utils.cache_lifecycle import (
+    CachePrunePolicy,
+    delete_cached_tiles,
+    list_cached_tiles,
+    select_tiles_to_prune,
+    summarize_cached_tiles,
+)
+from src.utils.tile_cache import S3TileCache
+
+
+@pytest.fixture()
+def s3_tile_cache():
+    """Return S3TileCache instance backed by bucket created for this test."""
+    test_bucket_name = f"aws-naip-tile-server-test-{uuid.uuid4()}"
+    s3 = boto3.resource("s3")
+    s3.create_bucket(
+        Bucket=test_bucket_name,
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    yield S3TileCache(test_bucket_name)
+    bucket = s3.Bucket(test_bucket_name)
+    bucket.objects.all().delete()
+    bucket.delete()
+
+
+@pytest.fixture()
+def cached_tiles(s3_tile_cache):
+    """Cache a few real, blank & rescaled tiles at zoom levels 10 & 11 and return them as listed."""
+    tile_image = Image.fromarray((np.random.rand(256, 256, 3) * 255).astype("uint8")).convert("RGBA")
+    s3_tile_cache.save_tile_image(mercantile.Tile(1, 1, 10), 2099, tile_image)
+    s3_tile_cache.save_tile_image(mercantile.Tile(2, 2, 10), 2099, tile_image, is_rescaled=True)
+    s3_tile_cache.handle_null_tile_image(mercantile.Tile(3, 3, 10), 2099)
+    s3_tile_cache.save_tile_image(mercantile.Tile(1, 1, 11), 2099, tile_image)
+    return list(list_cached_tiles(s3_tile_cache._bucket, 2099))
+
+
+def test_summarize_cached_tiles(cached_tiles):
+    """Test confirms cached tiles are counted & sized per year/zoom, and blank tiles are recognized."""
+    summary = summarize_cached_tiles(cached_tiles)
+    assert list(summary.keys()) == [(2099, 10), (2099, 11)]
+    assert summary[(2099, 10)]["tiles"] == 3
+    assert summary[(2099, 10)]["blank tiles"] == 1
+    assert summary[(2099, 11)]["bytes"] == next(t.size for t in cached_tiles if t.zoom == 11)
+
+
+def test_prune_by_zoom_and_blank(s3_tile_cache, cached_tiles):
+    """Test confirms zoom range & blank filters are combined."""
+    policy = CachePrunePolicy(max_zoom=10, blank_only=True)
+    prune_tiles = select_tiles_to_prune(s3_tile_cache._bucket, cached_tiles, policy)
+    assert [t.key for t in prune_tiles] == ["2099/10/3/3.png"]
+
+
+def test_prune_rescaled(s3_tile_cache, cached_tiles):
+    """Test confirms only rescaled tiles are selected by rescaled filter."""
+    policy = CachePrunePolicy(rescaled_only=True)
+    prune_tiles = select_tiles_to_prune(s3_tile_cache._bucket, cached_tiles, policy)
+    assert [t.key for t in prune_tiles] == ["2099/10/2/2.png"]
+
+
+def test_prune_by_ttl(s3_tile_cache, cached_tiles):
+    """Test confirms only tiles older than ttl are selected."""
+    policy = CachePrunePolicy(ttl=3600)
+    now = datetime.now(timezone.utc)
+    assert not select_tiles_to_prune(s3_tile_cache._bucket, cached_tiles, policy, now=now)
+    later = now + timedelta(hours=2)
+    assert len(select_tiles_to_prune(s3_tile_cache._bucket, cached_tiles, policy, now=later)) == len(cached_tiles)
+
+
+def test_prune_to_max_bytes(s3_tile_cache, cached_tiles):
+    """Test confirms oldest tiles are selected until remaining tiles fit max_bytes."""
+    max_bytes = sum(t.size for t in cached_tiles) - 1
+    prune_tiles = select_tiles_to_prune(s3_tile_cache._bucket, cached_tiles, CachePrunePolicy(max_bytes=max_bytes))
+    assert prune_tiles == [min(cached_tiles, key=lambda t: t.last_modified)]
+
+
+def test_delete_cached_tiles(s3_tile_cache, cached_tiles):
+    """Test confirms deleted tiles & reclaimed bytes are reported, and tiles are removed from cache."""
+    deleted_tiles, deleted_bytes = delete_cached_tiles(s3_tile_cache._bucket, cached_tiles)
+    assert deleted_tiles == len(cached_tiles)
+    assert deleted_bytes == sum(t.size for t in cached_tiles)
+    assert not list(list_cached_tiles(s3_tile_cache._bucket, 2099))
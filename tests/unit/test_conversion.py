@@ -1,7 +1,17 @@
+import base64
+import io
+
 import mercantile
 import shapely
+from PIL import Image
 
-from src.utils.conversion import bbox_to_box, val_to_type
+from src.utils.conversion import (
+    bbox_to_box,
+    img_to_b64,
+    img_to_bytes,
+    val_to_type,
+    val_to_year,
+)
 
 
 def test_bbox_to_box():
@@ -17,3 +27,20 @@ def test_val_to_type():
     """Test confirms typed conversion of arbitrary object."""
     converted_val = val_to_type("6", int)
     assert converted_val == 6
+
+
+def test_val_to_year():
+    """Test confirms conversion of years, year ranges and "latest", and rejection of anything else."""
+    assert val_to_year("2021") == 2021
+    assert val_to_year("Latest") == "latest"
+    assert val_to_year("2016-2021") == "2016-2021"
+    assert val_to_year("2021-2016") is None
+    assert val_to_year("newest") is None
+
+
+def test_img_to_bytes():
+    """Test confirms image encoding matches base64 encoding, and RGB images are PNG encoded with an alpha band."""
+    image = Image.new("RGB", (256, 256), (0, 128, 0))
+    image_bytes = img_to_bytes(image, "PNG")
+    assert base64.b64encode(image_bytes) == img_to_b64(image, "PNG")
+    assert Image.open(io.BytesIO(image_bytes)).mode == "RGBA"
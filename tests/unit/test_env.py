@@ -0,0 +1,46 @@
+import pytest
+
+from src.utils.env import TileServerConfig
+from src.utils.tile_cache import FileSystemTileCache, MemoryTileCache, TieredTileCache
+
+
+@pytest.fixture(autouse=True)
+def filesystem_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("TILE_CACHE_BACKEND", "filesystem")
+    monkeypatch.setenv("TILE_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("MEMORY_CACHE_MAX_BYTES", raising=False)
+    monkeypatch.delenv("DISK_CACHE_MAX_BYTES", raising=False)
+
+
+def test_filesystem_tile_cache_from_env():
+    """Test confirms TILE_CACHE_BACKEND env var selects FileSystemTileCache."""
+    tile_cache = TileServerConfig.from_env().tile_cache
+    assert isinstance(tile_cache, FileSystemTileCache)
+
+
+def test_filesystem_tile_cache_missing_dir(monkeypatch):
+    """Test confirms no tile cache is created for filesystem backend without a TILE_CACHE_DIR."""
+    monkeypatch.setenv("TILE_CACHE_DIR", "")
+    assert TileServerConfig.from_env().tile_cache is None
+
+
+def test_tiered_tile_cache_from_env(monkeypatch):
+    """Test confirms configuring a memory cache tier wraps backend tile cache in a TieredTileCache."""
+    monkeypatch.setenv("MEMORY_CACHE_MAX_BYTES", "1048576")
+    tile_cache = TileServerConfig.from_env().tile_cache
+    assert isinstance(tile_cache, TieredTileCache)
+    assert isinstance(tile_cache.tiers[0], MemoryTileCache)
+    assert isinstance(tile_cache.tiers[-1], FileSystemTileCache)
+    assert not tile_cache.tiers[-1].rescaling_enabled
+
+
+def test_cache_control_by_zoom(monkeypatch):
+    """Test confirms Cache-Control max-age is configurable per zoom level and for empty tiles."""
+    monkeypatch.setenv("CACHE_CONTROL_MAX_AGE", "600")
+    monkeypatch.setenv("CACHE_CONTROL_MAX_AGE_BY_ZOOM", "10-12:3600, 20:0")
+    monkeypatch.setenv("CACHE_CONTROL_EMPTY_MAX_AGE", "60")
+    tile_server_config = TileServerConfig.from_env()
+    assert tile_server_config.get_cache_control(11) == "public, max-age=3600"
+    assert tile_server_config.get_cache_control(15) == "public, max-age=600"
+    assert tile_server_config.get_cache_control(20) == "no-cache"
+    assert tile_server_config.get_cache_control(11, is_empty=True) == "public, max-age=60"
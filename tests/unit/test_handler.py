@@ -1,9 +1,17 @@
+import base64
+import json
 import os
+import threading
+from io import BytesIO
 
 import boto3
+import mercantile
 import pytest
+from PIL import Image
 
-from src.lambda_functions.get_naip_tile import _get_tile_server_config, handler
+import src.utils.naip as naip
+import src.utils.resources as resources
+from src.lambda_functions.get_naip_tile import handler
 from src.utils.env import TileServerConfig
 
 
@@ -77,7 +85,7 @@ def test_max_zoom_violation(tile_server_config):
 
 def test_no_cache_bucket():
     """Test confirms Lambda handler (via event) returns valid image even when no TileCacheBucket provided."""
-    _get_tile_server_config.cache_clear()
+    resources.refresh()
     os.environ["TileCacheBucket"] = ""
     result = handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
     assert result["statusCode"] == 200
@@ -85,7 +93,200 @@ def test_no_cache_bucket():
 
 def test_non_existing_bucket():
     """Test confirms Lambda handler (via event) returns valid image even when erroneous TileCacheBucket provided."""
-    _get_tile_server_config.cache_clear()
+    resources.refresh()
     os.environ["TileCacheBucket"] = "some-non-existent-bucket"
     result = handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
     assert result["statusCode"] == 200
+
+
+@pytest.mark.parametrize("cache_write_behind", [True, False])
+def test_rendered_tile_cached_before_return(local_tile_server_config, cache_write_behind):
+    """Test confirms a rendered tile is cached by the time the handler returns, and encoded only once."""
+    tile_server_config = local_tile_server_config(cache_write_behind=cache_write_behind)
+    result = handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
+    assert result["statusCode"] == 200
+    cached_bytes = tile_server_config.tile_cache.get_tile_bytes(mercantile.Tile(425, 776, 11), 2021)
+    assert base64.b64decode(result["body"]) == cached_bytes
+
+
+def test_render_lease_lost_serves_cached_tile(local_tile_server_config, monkeypatch, capsys):
+    """Test confirms a tile rendered by the invocation holding the render lease is served as a cache hit."""
+    tile_server_config = local_tile_server_config(render_lease_ttl=60, render_lease_wait=5)
+    monkeypatch.setattr("src.utils.naip.get_tile_image", lambda *_args: pytest.fail("tile rendered twice"))
+    tile = mercantile.Tile(425, 776, 11)
+    tile_cache = tile_server_config.tile_cache
+    assert tile_cache.acquire_render_lease(tile, 2021, ttl=60)
+    image = Image.new("RGBA", (256, 256), (0, 128, 0, 255))
+    threading.Timer(0.5, tile_cache.save_tile_image, (tile, 2021, image)).start()
+    capsys.readouterr()
+    result = handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
+    assert result["statusCode"] == 200
+    assert result["headers"]["Cache-Control"] == "public, max-age=86400" and "X-Tile-Degraded" not in result["headers"]
+    assert base64.b64decode(result["body"]) == tile_cache.get_tile_bytes(tile, 2021)
+    emf_events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert "CacheHit" in emf_events[0] and "CacheMissRender" not in emf_events[0]
+
+
+def test_rendered_tile_metrics(local_tile_server_config, capsys):
+    """Test confirms a cache miss followed by a cache hit are logged as metrics."""
+    local_tile_server_config()
+    capsys.readouterr()
+    handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
+    handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
+    emf_events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert "CacheMissRender" in emf_events[0] and "BytesWritten" in emf_events[0]
+    assert "CacheHit" in emf_events[1]
+
+
+def test_not_modified(local_tile_server_config):
+    """Test confirms a tile response has an ETag, and a request with a matching If-None-Match gets a 304."""
+    local_tile_server_config()
+    event = {"x": 425, "y": 776, "z": 11, "year": 2021}
+    result = handler(event, {})
+    etag = result["headers"]["ETag"]
+    assert result["headers"]["Cache-Control"] == "public, max-age=86400"
+
+    result = handler({**event, "headers": {"If-None-Match": f'W/{etag}, "other"'}}, {})
+    assert result["statusCode"] == 304
+    assert result["headers"]["ETag"] == etag and not result["body"]
+
+    result = handler({**event, "headers": {"if-none-match": '"other"'}}, {})
+    assert result["statusCode"] == 200
+
+
+def test_cached_tile_redirect(local_tile_server_config, monkeypatch):
+    """Test confirms a tile is returned on a cache miss, and redirected to the tile cache once cached."""
+    tile_server_config = local_tile_server_config(
+        cache_redirect=True, cache_redirect_base_url="https://cdn.example.com"
+    )
+    monkeypatch.setattr(
+        tile_server_config.tile_cache,
+        "get_tile_url",
+        lambda tile, year, base_url, **_kwargs: f"{base_url}/{year}/{tile.z}/{tile.y}/{tile.x}.png",
+    )
+    event = {"x": 425, "y": 776, "z": 11, "year": 2021}
+    assert handler(event, {})["statusCode"] == 200
+    result = handler(event, {})
+    assert result["statusCode"] == 302
+    assert result["headers"]["Location"] == "https://cdn.example.com/2021/11/776/425.png"
+    assert result["headers"]["Cache-Control"] == "public, max-age=86400"
+
+
+def test_batch_render(local_tile_server_config, monkeypatch):
+    """Test confirms a batch of tiles is rendered & cached in a single invocation, with a status per tile."""
+    tile_server_config = local_tile_server_config()
+
+    def _get_tile_images(tiles, _year):
+        for tile in tiles:
+            yield tile, Image.new("RGBA", (256, 256), (0, 128, 0, 255)) if tile.x % 2 else None
+
+    monkeypatch.setattr("src.utils.naip.get_tile_images", _get_tile_images)
+    event = {"year": 2021, "tile_range": {"z": 12, "min_x": 850, "max_x": 851, "min_y": 1550, "max_y": 1551}}
+    result = handler(event, {})
+    assert result["statusCode"] == 200
+    summary = json.loads(result["body"])
+    assert summary["counts"] == {"rendered": 2, "empty": 2}
+    for t in summary["tiles"]:
+        assert tile_server_config.tile_cache.contains_tile_image(mercantile.Tile(t["x"], t["y"], t["z"]), 2021)
+
+    result = handler({"year": 2021, "tiles": [{"x": 1, "y": 1, "z": 1}]}, {})
+    assert json.loads(result["body"])["counts"] == {"invalid": 1}
+
+
+def test_prefetch_queued(local_tile_server_config, monkeypatch):
+    """Test confirms likely next tiles are queued for prefetching, and cached tiles are skipped by batch mode."""
+    tile_server_config = local_tile_server_config(prefetch_max_tiles=8, render_function_name="get-naip-tile")
+    queued = []
+    monkeypatch.setattr(tile_server_config.prefetcher, "queue", lambda tiles, year: queued.append((tiles, year)))
+    assert handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})["statusCode"] == 200
+    tiles, year = queued[0]
+    assert len(tiles) == 8 and year == 2021
+
+    tile_server_config.tile_cache.save_tile_image(tiles[0], 2021, Image.new("RGBA", (256, 256)))
+    monkeypatch.setattr("src.utils.naip.get_tile_images", lambda tiles, _year: ((t, None) for t in tiles))
+    event = {"year": 2021, "tiles": [{"x": t.x, "y": t.y, "z": t.z} for t in tiles], "skip_cached": True}
+    assert json.loads(handler(event, {})["body"])["counts"] == {"cached": 1, "empty": 7}
+
+
+def test_render_deadline_degraded_tile(local_tile_server_config, monkeypatch):
+    """Test confirms a render out of time serves its partial tile uncached, and queues a full render."""
+    tile_server_config = local_tile_server_config(render_function_name="get-naip-tile")
+
+    def _get_tile_image(_tile, _year, deadline=None):
+        assert deadline is not None
+        raise naip.RenderDeadlineExceeded(Image.new("RGBA", (256, 256), (0, 128, 0, 255)))
+
+    monkeypatch.setattr("src.utils.naip.get_tile_image", _get_tile_image)
+    queued = []
+    monkeypatch.setattr(
+        "src.lambda_functions.get_naip_tile.queue_renders",
+        lambda function_name, tiles, year: queued.append((function_name, tiles, year)),
+    )
+    result = handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
+    assert result["statusCode"] == 200
+    assert result["headers"]["Cache-Control"] == "no-cache"
+    assert result["headers"]["X-Tile-Degraded"] == "true"
+    assert queued == [("get-naip-tile", [mercantile.Tile(425, 776, 11)], 2021)]
+    assert not tile_server_config.tile_cache.contains_tile_image(mercantile.Tile(425, 776, 11), 2021)
+
+
+def test_render_deadline_draft_out_of_time(local_tile_server_config, monkeypatch, helpers):
+    """Test confirms the draft fallback render has a deadline too, and a blank uncached tile is served past it."""
+    local_tile_server_config()
+    deadlines = []
+
+    def _get_tile_image(_tile, _year, deadline=None, draft=False):
+        deadlines.append((deadline, draft))
+        raise naip.RenderDeadlineExceeded(None)
+
+    monkeypatch.setattr("src.utils.naip.get_tile_image", _get_tile_image)
+    result = handler({"x": 425, "y": 776, "z": 11, "year": 2021}, {})
+    assert result["statusCode"] == 200
+    assert result["headers"]["X-Tile-Degraded"] == "true"
+    assert helpers.is_blank_image(helpers.decode_b64_image(result["body"]))
+    (render_deadline, _), (draft_deadline, draft) = deadlines
+    assert draft and draft_deadline == render_deadline + 5
+
+
+def test_bbox_image(local_tile_server_config, monkeypatch):
+    """Test confirms an image of a bounding box is rendered in a single call, and oversized requests are rejected."""
+    local_tile_server_config(image_max_size=1024)
+    calls = []
+
+    def _get_image(bbox, year, width, height, epsg, **_kwargs):
+        calls.append((bbox, year, epsg))
+        return Image.new("RGBA", (width, height), (0, 128, 0, 255))
+
+    monkeypatch.setattr("src.utils.naip.get_image", _get_image)
+    event = {
+        "pathParameters": {"year": "2021"},
+        "queryStringParameters": {
+            "bbox": "-105.27,38.88,-105.04,39.08",
+            "width": "512",
+            "height": "300",
+            "epsg": "4326",
+        },
+    }
+    result = handler(event, {})
+    assert result["statusCode"] == 200
+    assert Image.open(BytesIO(base64.b64decode(result["body"]))).size == (512, 300)
+    assert calls == [((-105.27, 38.88, -105.04, 39.08), 2021, 4326)]
+
+    result = handler({"year": 2021, "bbox": [0, 0, 1000, 1000], "width": 2048, "height": 256}, {})
+    assert result["statusCode"] == 400
+    result = handler({"year": 2021, "bbox": [1000, 0, 0, 1000], "width": 256, "height": 256}, {})
+    assert result["statusCode"] == 400
+    assert len(calls) == 1
+
+
+def test_bbox_image_too_large(local_tile_server_config, monkeypatch):
+    """Test confirms an image too large to return once encoded is answered with a 413, instead of a failed response."""
+    local_tile_server_config()
+    monkeypatch.setattr("src.lambda_functions.get_naip_tile.MAX_RESPONSE_BODY_BYTES", 256 * 1024)
+    # noise doesn't compress - encoded image is larger than the raw 512x512 RGBA pixels (1 MB)
+    noise_image = Image.frombytes("RGBA", (512, 512), os.urandom(512 * 512 * 4))
+    monkeypatch.setattr("src.utils.naip.get_image", lambda *_args, **_kwargs: noise_image)
+    result = handler({"year": 2021, "bbox": [0, 0, 1000, 1000], "width": 512, "height": 512}, {})
+    assert result["statusCode"] == 413 and not result["body"]
+    result = handler({"year": 2021, "bbox": [0, 0, 1000, 1000], "width": 2048, "height": 512}, {})
+    assert result["statusCode"] == 400
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+from src.utils.lazy import lazy_import
+
+_HEAVY_MODULES = ("numpy", "PIL.Image", "rasterio", "polars", "pyproj", "shapely", "src.utils.naip")
+
+
+def test_lazy_import_loads_on_attribute_access():
+    """Test confirms a lazily imported module is usable."""
+    json = lazy_import("json")
+    assert json.dumps({"a": 1}) == '{"a": 1}'
+
+
+def test_handler_import_excludes_rendering_stack():
+    """Test confirms importing the Lambda function handler doesn't load the rendering stack."""
+    script = (
+        "import sys\n"
+        "from importlib.util import _LazyModule\n"
+        "import src.lambda_functions.get_naip_tile\n"
+        f"print(','.join(m for m in {_HEAVY_MODULES!r} "
+        "if m in sys.modules and not isinstance(sys.modules[m], _LazyModule)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_cached_tile_response_excludes_rendering_stack(tmp_path):
+    """Test confirms serving cached tiles (200 and 304 responses) doesn't load the rendering stack."""
+    script = (
+        "import sys\n"
+        "from importlib.util import _LazyModule\n"
+        "import mercantile\n"
+        "import src.lambda_functions.get_naip_tile as get_naip_tile\n"
+        "from src.utils.env import TileServerConfig\n"
+        "from src.utils.tile_cache import BLANK_TILE_BYTES, BLANK_TILE_ETAG\n"
+        "config = TileServerConfig('PNG', 20, 0, 11, 18, True, '', memory_cache_max_bytes=2**20,\n"
+        f"    tile_cache_backend='filesystem', tile_cache_dir={str(tmp_path)!r})\n"
+        "tile, blank_tile = mercantile.Tile(1, 1, 12), mercantile.Tile(2, 1, 12)\n"
+        "config.tile_cache.save_tile_bytes(tile, 2099, b'not a blank tile')\n"
+        "config.tile_cache.save_tile_bytes(blank_tile, 2099, BLANK_TILE_BYTES)\n"
+        "assert get_naip_tile._get_cached_tile_response(tile, 2099, config)['statusCode'] == 200\n"
+        "assert get_naip_tile._get_cached_tile_response(blank_tile, 2099, config)['statusCode'] == 200\n"
+        "response = get_naip_tile._get_cached_tile_response(blank_tile, 2099, config, f'\"{BLANK_TILE_ETAG}\"')\n"
+        "assert response['statusCode'] == 304\n"
+        f"print(','.join(m for m in {_HEAVY_MODULES!r} "
+        "if m in sys.modules and not isinstance(sys.modules[m], _LazyModule)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
@@ -0,0 +1,46 @@
+import json
+
+import mercantile
+from PIL import Image
+
+from src.utils import metrics
+from src.utils.tile_cache import MemoryTileCache
+
+
+def test_collect_metrics_logs_emf(capsys):
+    """Test confirms metrics recorded within context are logged as a single Embedded Metric Format event."""
+    with metrics.collect_metrics("TestNamespace", Zoom=12):
+        metrics.put_metric(metrics.CACHE_HIT)
+        metrics.put_metric(metrics.BYTES_READ, 100, "Bytes")
+        metrics.put_metric(metrics.BYTES_READ, 200, "Bytes")
+    emf = json.loads(capsys.readouterr().out)
+    assert emf["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "TestNamespace"
+    assert emf["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [[], ["Zoom"]]
+    assert emf["Zoom"] == "12"
+    assert emf[metrics.CACHE_HIT] == 1
+    assert emf[metrics.BYTES_READ] == [100, 200]
+
+
+def test_put_metric_outside_context(capsys):
+    """Test confirms metrics recorded outside of a collect_metrics context are ignored."""
+    metrics.put_metric(metrics.CACHE_HIT)
+    with metrics.collect_metrics("TestNamespace"):
+        pass
+    assert capsys.readouterr().out == ""
+
+
+def test_tile_cache_metrics():
+    """Test confirms tile cache records hits, downscaling and bytes read/written."""
+    tile_cache = MemoryTileCache(max_bytes=16 * 1024 * 1024, rescaling_enabled=True)
+    tile = mercantile.Tile(10, 10, 10)
+    for children_tile in mercantile.children(tile):
+        tile_cache.save_tile_image(children_tile, 2099, Image.new("RGBA", (256, 256), (0, 128, 0, 255)))
+
+    with metrics.collect_metrics("") as collector:
+        tile_cache.get_tile_image(tile, 2099)
+        tile_cache.get_tile_image(tile, 2099)
+    emf = collector.to_emf()
+    assert emf[metrics.DOWNSCALE] == 1
+    assert emf[metrics.CACHE_HIT] == 1
+    assert len(emf[metrics.BYTES_READ]) == 5
+    assert emf[metrics.BYTES_WRITTEN] == emf[metrics.BYTES_READ][-1]
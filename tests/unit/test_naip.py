@@ -1,8 +1,24 @@
+import time
+
 import mercantile
+import numpy as np
 import pytest
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
 from shapely import wkt
+from shapely.geometry import box
 
-from src.utils.naip import get_naip_geotiffs, get_tile_image
+from src.utils.naip import (
+    AWSGeotiff,
+    RenderDeadlineExceeded,
+    _composite_image,
+    get_cache_year,
+    get_image,
+    get_naip_geotiffs,
+    get_tile_image,
+    resolve_years,
+)
 
 
 @pytest.fixture
@@ -51,3 +67,92 @@ def test_get_naip_geotiffs_by_year_and_coverage(sample_aoi):
     """Test confirms that querying NAIP geotiffs by coverage & year returns expected result."""
     geotiffs = get_naip_geotiffs(coverage=sample_aoi, year=2013)
     assert len(geotiffs) == 20
+
+
+def test_resolve_years():
+    """Test confirms year ranges resolve to years newest first."""
+    assert resolve_years(2021) == [2021]
+    assert resolve_years("2018-2021") == [2021, 2020, 2019, 2018]
+
+
+def test_get_cache_year(monkeypatch):
+    """Test confirms "latest" tiles are cached under the range of years in the NAIP index, and others as is."""
+    monkeypatch.setattr("src.utils.naip.get_years", lambda: [2022, 2020, 2018])
+    assert get_cache_year("latest") == "2018-2022"
+    monkeypatch.setattr("src.utils.naip.get_years", lambda: [2024, 2022, 2020, 2018])
+    assert get_cache_year("latest") == "2018-2024"
+    assert get_cache_year(2021) == 2021 and get_cache_year("2016-2021") == "2016-2021"
+
+
+def test_get_image_max_geotiffs(monkeypatch):
+    """Test confirms an image covering more geotiffs than allowed, or with an invalid epsg, is rejected."""
+    geotiffs = [AWSGeotiff(f"{i}.tif", 0, 0, 1, 1, 2021) for i in range(3)]
+    monkeypatch.setattr("src.utils.naip.get_naip_geotiffs", lambda _coverage, _years, _epsg: geotiffs)
+    with pytest.raises(ValueError):
+        get_image((0, 0, 1000, 1000), 2021, 256, 256, max_geotiffs=2)
+    with pytest.raises(ValueError):
+        get_image((0, 0, 1000, 1000), 2021, 256, 256, epsg=1)
+
+
+def _memory_geotiff(datasets: dict, year: int, bounds: tuple, color: tuple) -> AWSGeotiff:
+    data = np.zeros((3, 64, 64), "uint8") + np.array(color, "uint8").reshape(3, 1, 1)
+    memfile = MemoryFile()
+    with memfile.open(
+        driver="GTiff",
+        width=64,
+        height=64,
+        count=3,
+        dtype="uint8",
+        crs="EPSG:3857",
+        transform=from_bounds(*bounds, 64, 64),
+    ) as dataset:
+        dataset.write(data)
+    datasets[f"{year}.tif"] = memfile.open()
+    return AWSGeotiff(f"{year}.tif", *bounds, year)
+
+
+def test_composite_image_newest_year_first():
+    """Test confirms older imagery only fills pixels newer imagery has no data for, and isn't read once filled."""
+    datasets = {}
+    opened = []
+
+    def _open_vrt(geotiff: AWSGeotiff) -> rasterio.DatasetReader:
+        opened.append(geotiff.year)
+        return datasets[geotiff.s3_path]
+
+    geotiffs = [
+        _memory_geotiff(datasets, 2016, (0, 0, 256, 256), (0, 0, 255)),
+        _memory_geotiff(datasets, 2021, (0, 0, 128, 256), (255, 0, 0)),
+        _memory_geotiff(datasets, 2018, (0, 0, 256, 256), (0, 255, 0)),
+    ]
+    image = np.asarray(_composite_image(box(0, 0, 256, 256), geotiffs, _open_vrt))
+    assert tuple(image[128, 32]) == (255, 0, 0, 255)
+    assert tuple(image[128, 224]) == (0, 255, 0, 255)
+    assert opened == [2021, 2018]
+
+
+def test_composite_image_deadline():
+    """Test confirms a render past its deadline stops reading geotiffs, and keeps the partially composited image."""
+    datasets = {}
+
+    def _open_vrt(geotiff: AWSGeotiff) -> rasterio.DatasetReader:
+        time.sleep(0.1)
+        return datasets[geotiff.s3_path]
+
+    geotiffs = [
+        _memory_geotiff(datasets, 2021, (0, 0, 128, 256), (255, 0, 0)),
+        _memory_geotiff(datasets, 2018, (0, 0, 256, 256), (0, 255, 0)),
+    ]
+    with pytest.raises(RenderDeadlineExceeded) as exc_info:
+        _composite_image(box(0, 0, 256, 256), geotiffs, _open_vrt, deadline=time.monotonic() + 0.05)
+    image = np.asarray(exc_info.value.image)
+    assert tuple(image[128, 32]) == (255, 0, 0, 255)
+    assert tuple(image[128, 224]) == (0, 0, 0, 0)
+
+    with pytest.raises(RenderDeadlineExceeded) as exc_info:
+        _composite_image(box(0, 0, 256, 256), geotiffs, _open_vrt, deadline=0)
+    assert exc_info.value.image is None
+
+    draft_image = np.asarray(_composite_image(box(0, 0, 256, 256), geotiffs, _open_vrt, draft=True))
+    assert draft_image.shape == (256, 256, 4)
+    assert tuple(draft_image[128, 32]) == (255, 0, 0, 255)
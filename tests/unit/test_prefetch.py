@@ -0,0 +1,23 @@
+import mercantile
+
+from src.utils.prefetch import Prefetcher, get_prefetch_candidates
+
+
+def test_prefetch_candidates():
+    """Test confirms prefetch candidates are edge neighbours then children, within tile grid and max zoom."""
+    candidates = get_prefetch_candidates(mercantile.Tile(0, 0, 1), max_zoom=20)
+    assert candidates[:2] == [mercantile.Tile(1, 0, 1), mercantile.Tile(0, 1, 1)]
+    assert candidates[2:] == mercantile.children(mercantile.Tile(0, 0, 1))
+    assert len(get_prefetch_candidates(mercantile.Tile(5, 5, 4), max_zoom=4)) == 4
+
+
+def test_prefetch_budget():
+    """Test confirms prefetching is bounded per request & per container, and known tiles aren't prefetched again."""
+    prefetcher = Prefetcher("get-naip-tile", max_tiles=6, max_tiles_per_minute=10)
+    tile = mercantile.Tile(425, 776, 11)
+    tiles = prefetcher.select(tile, 2021, max_zoom=20)
+    assert len(tiles) == 6
+    assert tile not in tiles
+    # the remaining 2 candidates of the same tile, within the remaining container budget of 4
+    assert len(prefetcher.select(tile, 2021, max_zoom=20)) == 2
+    assert len(prefetcher.select(mercantile.Tile(100, 100, 11), 2021, max_zoom=20)) == 2
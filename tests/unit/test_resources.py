@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import src.utils.resources as resources
+from src.utils.resources import ResourceRegistry
+
+
+def test_registry_creates_resource_once():
+    """Test confirms a resource is created once, even when first requested concurrently."""
+    registry = ResourceRegistry()
+    created = []
+
+    def _factory():
+        created.append(1)
+        return object()
+
+    with ThreadPoolExecutor(8) as executor:
+        resources_ = list(executor.map(lambda _: registry.get("resource", _factory), range(32)))
+    assert len(created) == 1
+    assert all(resource is resources_[0] for resource in resources_)
+
+
+def test_registry_refresh():
+    """Test confirms a refreshed resource is created again on next use."""
+    registry = ResourceRegistry()
+    first_resource = registry.get("resource", object)
+    registry.refresh("resource")
+    assert registry.get("resource", object) is not first_resource
+
+
+def test_s3_client_shared_and_tuned():
+    """Test confirms S3 client is shared until refreshed, and has a connection pool sized for concurrent use."""
+    s3_client = resources.get_s3_client()
+    assert resources.get_s3_client() is s3_client
+    assert s3_client.meta.config.max_pool_connections == resources.S3_MAX_POOL_CONNECTIONS
+    assert s3_client.meta.config.tcp_keepalive
+    resources.refresh()
+    assert resources.get_s3_client() is not s3_client
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import mercantile
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.tile_server.seed import seed_pyramid, seed_tiles
+
+
+def test_seed_tiles_local(local_tile_server_config, monkeypatch):
+    """Test confirms tiles are rendered block by block, straight into the tile cache, with counts by status."""
+    tile_server_config = local_tile_server_config()
+    blocks = []
+
+    def _get_tile_images(tiles, _year):
+        blocks.append(tiles)
+        for tile in tiles:
+            yield tile, Image.new("RGBA", (256, 256), (0, 128, 0, 255)) if tile.x % 2 else None
+
+    monkeypatch.setattr("src.utils.naip.get_tile_images", _get_tile_images)
+    tiles = list(mercantile.tiles(-105.2, 38.9, -105.0, 39.1, zooms=14))
+    counts = seed_tiles(tiles, 2021, block_size=4, render_executor=ThreadPoolExecutor(max_workers=2))
+    assert sum(counts.values()) == len(tiles) and set(counts) == {"rendered", "empty"}
+    assert all(len(block) <= 4 for block in blocks)
+    assert all(tile_server_config.tile_cache.contains_tile_image(tile, 2021) for tile in tiles)
+
+
+def test_seed_pyramid(local_tile_server_config, monkeypatch):
+    """Test confirms only max zoom tiles are rendered, and lower zoom levels are built without reading the cache."""
+    tile_server_config = local_tile_server_config()
+    rendered = []
+
+    def _get_tile_images(tiles, _year):
+        rendered.extend(tiles)
+        for tile in tiles:
+            # imagery only covers the left half of the area
+            yield tile, Image.new("RGBA", (256, 256), (0, 128, 0, 255)) if tile.x < 54064 else None
+
+    monkeypatch.setattr("src.utils.naip.get_tile_images", _get_tile_images)
+    tile_cache = tile_server_config.tile_cache
+    monkeypatch.setattr(tile_cache, "get_tile_image", lambda *_args: pytest.fail("tile read back from cache"))
+    root = mercantile.Tile(1689, 3250, 13)
+    tiles = [root] + [tile for zoom in range(14, 19) for tile in mercantile.children(root, zoom=zoom)]
+    counts = seed_pyramid(tiles, 2021, render_executor=ThreadPoolExecutor(max_workers=2))
+
+    assert sorted(rendered) == sorted(t for t in tiles if t.z == 18)
+    assert sum(counts.values()) == len(tiles) and counts["rendered"] + counts["empty"] + counts["downscaled"] == len(
+        tiles
+    )
+    assert all(tile_cache.contains_tile_image(tile, 2021) for tile in tiles)
+    root_data = np.asarray(Image.open(BytesIO(tile_cache.get_tile_bytes(root, 2021))).convert("RGBA"))
+    assert tuple(root_data[128, 16]) == (0, 128, 0, 255) and root_data[128, 240, 3] == 0
+
+
+def test_seed_pyramid_reads_imagery_outside_tiles(local_tile_server_config, monkeypatch):
+    """Test confirms left out tiles with imagery are read from cache, and parents missing them aren't built."""
+    tile_server_config = local_tile_server_config()
+    monkeypatch.setattr(
+        "src.utils.naip.get_tile_images",
+        lambda tiles, _year: ((tile, Image.new("RGBA", (256, 256), (0, 128, 0, 255))) for tile in tiles),
+    )
+    tile_cache = tile_server_config.tile_cache
+    root = mercantile.Tile(27040, 50000, 17)
+    # e.g. the last child is outside coverage
+    tiles = [root] + mercantile.children(root)[:3]
+    footprint_bounds = np.array([mercantile.bounds(root)])
+
+    counts = seed_pyramid(
+        tiles, 2021, render_executor=ThreadPoolExecutor(max_workers=1), footprint_bounds=footprint_bounds
+    )
+    assert counts == {"rendered": 3, "partial": 1}
+    assert not tile_cache.contains_tile_image(root, 2021)
+
+    tile_cache.save_tile_image(mercantile.children(root)[3], 2021, Image.new("RGBA", (256, 256), (0, 0, 128, 255)))
+    counts = seed_pyramid(
+        tiles, 2021, render_executor=ThreadPoolExecutor(max_workers=1), footprint_bounds=footprint_bounds
+    )
+    assert counts == {"rendered": 3, "downscaled": 1}
+    root_data = np.asarray(Image.open(BytesIO(tile_cache.get_tile_bytes(root, 2021))).convert("RGBA"))
+    # bottom-left quadrant is the cached tile
+    assert tuple(root_data[64, 64]) == (0, 128, 0, 255) and tuple(root_data[192, 64]) == (0, 0, 128, 255)
@@ -0,0 +1,68 @@
+import asyncio
+
+import mercantile
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.utils.seeding import AIMDConcurrency, HttpTileSeeder, SeedCheckpoint
+
+
+def test_aimd_concurrency():
+    """Test confirms the limit grows by one per limit's worth of successes, and is halved on overload."""
+    concurrency = AIMDConcurrency(initial=4, max_limit=8, target_latency=1, cooldown=0)
+    for _ in range(5):
+        concurrency.on_success(0.1)
+    assert concurrency.limit == 5
+    concurrency.on_overload()
+    assert concurrency.limit == 2
+    concurrency.on_success(5)
+    assert concurrency.limit == 1
+    concurrency.on_overload()
+    assert concurrency.limit == 1
+
+
+def test_seed_checkpoint(tmp_path):
+    """Test confirms seeded tiles are recorded, and loaded again by the next run."""
+    checkpoint = SeedCheckpoint(tmp_path / "seed.checkpoint")
+    checkpoint.add([mercantile.Tile(1, 2, 3), mercantile.Tile(2, 2, 3)], 2021)
+    checkpoint.close()
+
+    checkpoint = SeedCheckpoint(tmp_path / "seed.checkpoint")
+    assert checkpoint.count == 2
+    assert checkpoint.contains(mercantile.Tile(1, 2, 3), 2021)
+    assert not checkpoint.contains(mercantile.Tile(1, 2, 3), 2020)
+
+
+def test_http_tile_seeder(tmp_path):
+    """Test confirms throttled & degraded tiles are retried, failures aren't, and seeded tiles are checkpointed."""
+    requests = []
+
+    async def _get_tile(request: web.Request) -> web.Response:
+        x = int(request.match_info["x"])
+        requests.append(x)
+        if x == 0:
+            return web.Response(status=400)
+        if x == 1:
+            return web.Response(status=404)
+        if x == 2:
+            # render out of time on every request - never cached
+            return web.Response(status=200, body=b"tile", headers={"X-Tile-Degraded": "true"})
+        # every other tile is throttled on its first request
+        return web.Response(status=429 if requests.count(x) == 1 else 200, body=b"tile")
+
+    async def _seed(tiles: list[mercantile.Tile], checkpoint: SeedCheckpoint) -> tuple[dict, AIMDConcurrency]:
+        app = web.Application()
+        app.router.add_get("/tile/{year}/{z}/{y}/{x}", _get_tile)
+        async with TestServer(app) as server:
+            concurrency = AIMDConcurrency(initial=8)
+            seeder = HttpTileSeeder(str(server.make_url("/tile")), 2021, concurrency, checkpoint, backoff=0.01)
+            return await seeder.run(tiles), concurrency
+
+    checkpoint = SeedCheckpoint(tmp_path / "seed.checkpoint")
+    tiles = [mercantile.Tile(x, 0, 10) for x in range(6)]
+    counts, concurrency = asyncio.run(_seed(tiles, checkpoint))
+    assert counts == {"seeded": 3, "empty": 1, "failed": 2, "retries": 7}
+    # throttled requests in flight together only cut the limit once
+    assert 4 <= concurrency.limit < 8
+    assert sorted(requests) == [0, 1] + [2] * 5 + [3, 3, 4, 4, 5, 5]
+    assert checkpoint.count == 4 and not checkpoint.contains(tiles[0], 2021) and not checkpoint.contains(tiles[2], 2021)
@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_run_once():
+    """Test confirms concurrent calls for the same key share a single call."""
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def _slow_call():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(single_flight.do, "key", _slow_call) for _ in range(4)]
+        while not calls:
+            pass
+        release.set()
+        assert [future.result() for future in futures] == ["result"] * 4
+    assert len(calls) == 1
+
+
+def test_sequential_calls_run_again():
+    """Test confirms a call is made again once the previous call for the key has finished."""
+    single_flight = SingleFlight()
+    calls = []
+    single_flight.do("key", calls.append, 1)
+    single_flight.do("key", calls.append, 2)
+    assert calls == [1, 2]
+
+
+def test_exception_propagates():
+    """Test confirms an exception raised by the call is raised to the caller."""
+    single_flight = SingleFlight()
+
+    def _failing_call():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        single_flight.do("key", _failing_call)
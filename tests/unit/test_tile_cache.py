@@ -1,4 +1,6 @@
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 import mercantile
@@ -6,7 +8,19 @@ import numpy as np
 import pytest
 from PIL import Image
 
-from src.utils.tile_cache import S3TileCache
+from src.utils.tile_cache import (
+    BLANK_TILE_BYTES,
+    DiskTileCache,
+    FileSystemTileCache,
+    MBTilesTileCache,
+    MemoryTileCache,
+    RescalePlanner,
+    S3BundleTileCache,
+    S3TileCache,
+    TieredTileCache,
+    encode_tile_image,
+    tile_etag,
+)
 
 
 @pytest.fixture(scope="module")
@@ -74,15 +88,14 @@ def test_s3_downscale_tile(s3_tile_cache, tile_image):
     tile = mercantile.Tile(10, 10, 10)
     for children_tile in mercantile.children(tile):
         s3_tile_cache.save_tile_image(children_tile, 2099, tile_image)
-    tile_image = s3_tile_cache.get_tile_image_from_downscaling(tile, 2099)
-    assert tile_image is not None
+    rescale_plan = RescalePlanner(s3_tile_cache, max_depth=1).plan(tile, 2099)
+    assert rescale_plan.execute() is not None
 
 
-def test_s3_downscale_tile_null(s3_tile_cache, tile_image):
+def test_s3_downscale_tile_null(s3_tile_cache):
     """Test confirms that downscaling will return None if children tiles don't exist."""
     tile = mercantile.Tile(8, 8, 8)
-    tile_image = s3_tile_cache.get_tile_image_from_downscaling(tile, 2099)
-    assert tile_image is None
+    assert RescalePlanner(s3_tile_cache, max_depth=1).plan(tile, 2099) is None
 
 
 def test_s3_upscale_tile(s3_tile_cache, tile_image):
@@ -101,6 +114,31 @@ def test_s3_upscale_tile_null(s3_tile_cache, tile_image):
     assert tile_image is None
 
 
+def test_s3_get_tile_etag(s3_tile_cache, tile_image):
+    """Test confirms a cached tile's etag is the content hash of the tile, without reading the tile."""
+    tile = mercantile.Tile(2, 2, 2)
+    s3_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert s3_tile_cache.get_tile_etag(tile, 2099) == tile_etag(s3_tile_cache.get_tile_bytes(tile, 2099))
+    assert s3_tile_cache.get_tile_etag(mercantile.Tile(2, 2, 6), 2099) is None
+
+
+def test_s3_get_tile_url(s3_tile_cache):
+    """Test confirms cached tile urls are presigned S3 urls, or relative to a CDN base url if given."""
+    tile = mercantile.Tile(2, 2, 2)
+    url = s3_tile_cache.get_tile_url(tile, 2099)
+    assert "/2099/2/2/2.png?" in url and "Signature" in url
+    assert s3_tile_cache.get_tile_url(tile, 2099, base_url="https://cdn/") == "https://cdn/2099/2/2/2.png"
+
+
+def test_s3_get_missing_tiles_excludes_year_ranges(s3_tile_cache, tile_image):
+    """Test confirms tiles cached under a year range aren't counted as cached for the range's first year."""
+    tile = mercantile.Tile(3, 3, 4)
+    s3_tile_cache.save_tile_image(tile, "2099-2100", tile_image)
+    assert s3_tile_cache.get_missing_tile_images([tile], 2099) == [tile]
+    s3_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert s3_tile_cache.get_missing_tile_images([tile], 2099) == []
+
+
 def test_s3_save_rescaled_tile_metadata(s3_tile_cache, tile_image):
     """Test confirms saving tile with is_rescaled metadata works."""
     tile = mercantile.Tile(1, 2, 3)
@@ -112,3 +150,458 @@ def test_s3_save_rescaled_tile_metadata(s3_tile_cache, tile_image):
     is_rescaled_key = next((k for k in metadata.keys() if "is_rescaled" in k), None)
     assert is_rescaled_key
     assert metadata[is_rescaled_key]
+
+
+@pytest.fixture()
+def memory_tile_cache():
+    """Return MemoryTileCache instance big enough to hold a few tiles."""
+    return MemoryTileCache(max_bytes=1024 * 1024)
+
+
+@pytest.fixture()
+def disk_tile_cache(tmp_path):
+    """Return DiskTileCache instance backed by a temporary directory."""
+    return DiskTileCache(directory=str(tmp_path / "disk-cache"), max_bytes=1024 * 1024)
+
+
+def test_blank_tile_bytes_match_encoded_blank_image():
+    """Test confirms the PIL free blank tile is byte for byte the PNG encoding of a blank tile image."""
+    assert BLANK_TILE_BYTES == encode_tile_image(Image.new("RGBA", (256, 256), (255, 0, 0, 0)))
+
+
+def test_memory_save_and_get_tile(memory_tile_cache, tile_image):
+    """Test confirms saving tile to memory cache and getting it back works."""
+    tile = mercantile.Tile(1, 1, 1)
+    memory_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert memory_tile_cache.contains_tile_image(tile, 2099)
+    assert memory_tile_cache.get_tile_image(tile, 2099) is not None
+
+
+def test_memory_evicts_least_recently_used(tile_image):
+    """Test confirms memory cache evicts least recently used tiles once max_bytes is exceeded."""
+    tile_bytes = encode_tile_image(tile_image)
+    memory_tile_cache = MemoryTileCache(max_bytes=len(tile_bytes) * 2)
+    tiles = [mercantile.Tile(x, 1, 5) for x in range(3)]
+    memory_tile_cache.save_tile_bytes(tiles[0], 2099, tile_bytes)
+    memory_tile_cache.save_tile_bytes(tiles[1], 2099, tile_bytes)
+    memory_tile_cache.get_tile_bytes(tiles[0], 2099)
+    memory_tile_cache.save_tile_bytes(tiles[2], 2099, tile_bytes)
+    assert memory_tile_cache.contains_tile_image(tiles[0], 2099)
+    assert not memory_tile_cache.contains_tile_image(tiles[1], 2099)
+    assert memory_tile_cache.contains_tile_image(tiles[2], 2099)
+    assert memory_tile_cache.size_bytes <= len(tile_bytes) * 2
+
+
+def test_memory_ttl_expiration(tile_image):
+    """Test confirms memory cache does not return tiles older than its ttl."""
+    memory_tile_cache = MemoryTileCache(ttl=-1)
+    tile = mercantile.Tile(1, 1, 1)
+    memory_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert memory_tile_cache.get_tile_image(tile, 2099) is None
+
+
+def test_disk_save_and_get_tile(disk_tile_cache, tile_image):
+    """Test confirms saving tile to disk cache and getting it back works."""
+    tile = mercantile.Tile(1, 1, 1)
+    disk_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert disk_tile_cache.contains_tile_image(tile, 2099)
+    assert disk_tile_cache.get_tile_image(tile, 2099) is not None
+    assert disk_tile_cache.get_missing_tile_images([tile, mercantile.Tile(1, 1, 5)], 2099) == [mercantile.Tile(1, 1, 5)]
+
+
+def test_disk_evicts_when_over_max_bytes(tmp_path, tile_image):
+    """Test confirms disk cache stays under max_bytes by evicting tiles."""
+    tile_bytes = encode_tile_image(tile_image)
+    disk_tile_cache = DiskTileCache(directory=str(tmp_path), max_bytes=len(tile_bytes) * 3)
+    for x in range(5):
+        disk_tile_cache.save_tile_bytes(mercantile.Tile(x, 1, 5), 2099, tile_bytes)
+    assert disk_tile_cache.size_bytes <= len(tile_bytes) * 3
+
+
+def test_tiered_backfills_faster_tiers(memory_tile_cache, disk_tile_cache, tile_image):
+    """Test confirms a tile found in a slower tier is copied into faster tiers."""
+    tiered_tile_cache = TieredTileCache([memory_tile_cache, disk_tile_cache])
+    tile = mercantile.Tile(1, 1, 1)
+    disk_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert not memory_tile_cache.contains_tile_image(tile, 2099)
+    assert tiered_tile_cache.get_tile_image(tile, 2099) is not None
+    assert memory_tile_cache.contains_tile_image(tile, 2099)
+
+
+def test_tiered_writes_through(memory_tile_cache, disk_tile_cache, tile_image):
+    """Test confirms saving a tile to a tiered cache saves it to every tier."""
+    tiered_tile_cache = TieredTileCache([memory_tile_cache, disk_tile_cache])
+    tile = mercantile.Tile(1, 1, 1)
+    tiered_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert memory_tile_cache.contains_tile_image(tile, 2099)
+    assert disk_tile_cache.contains_tile_image(tile, 2099)
+
+
+def test_tiered_downscale_tile(memory_tile_cache, disk_tile_cache, tile_image):
+    """Test confirms tiered cache can downscale from children tiles spread across tiers."""
+    tiered_tile_cache = TieredTileCache([memory_tile_cache, disk_tile_cache])
+    tile = mercantile.Tile(10, 10, 10)
+    for i, children_tile in enumerate(mercantile.children(tile)):
+        tier = memory_tile_cache if i % 2 else disk_tile_cache
+        tier.save_tile_image(children_tile, 2099, tile_image)
+    assert tiered_tile_cache.get_tile_image(tile, 2099) is not None
+    assert disk_tile_cache.contains_tile_image(tile, 2099)
+
+
+@pytest.mark.parametrize("shard_size", [0, 4])
+def test_filesystem_save_and_get_tile(tmp_path, tile_image, shard_size):
+    """Test confirms saving tile to filesystem cache and getting it back works, with & without sharding."""
+    filesystem_tile_cache = FileSystemTileCache(str(tmp_path), shard_size=shard_size)
+    tile = mercantile.Tile(9, 6, 5)
+    filesystem_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert filesystem_tile_cache.contains_tile_image(tile, 2099)
+    assert filesystem_tile_cache.get_tile_image(tile, 2099) is not None
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_filesystem_unsharded_layout_matches_s3_keys(tmp_path, tile_image):
+    """Test confirms unsharded filesystem cache uses the same year/z/y/x layout as S3TileCache keys."""
+    filesystem_tile_cache = FileSystemTileCache(str(tmp_path), shard_size=0)
+    filesystem_tile_cache.save_tile_image(mercantile.Tile(9, 6, 5), 2099, tile_image)
+    assert (tmp_path / "2099" / "5" / "6" / "9.png").exists()
+
+
+@pytest.mark.parametrize("shard_size", [0, 4])
+def test_filesystem_get_missing_tiles(tmp_path, tile_image, shard_size):
+    """Test confirms filesystem cache inventory finds exactly the tiles that were not saved."""
+    filesystem_tile_cache = FileSystemTileCache(str(tmp_path), shard_size=shard_size)
+    tiles = list(mercantile.tiles(-105.3, 38.8, -105.0, 39.1, zooms=[10, 11]))
+    cached_tiles = tiles[::2]
+    for tile in cached_tiles:
+        filesystem_tile_cache.save_tile_image(tile, 2099, tile_image)
+    missing_tiles = filesystem_tile_cache.get_missing_tile_images(tiles, 2099)
+    assert missing_tiles == tiles[1::2]
+
+
+@pytest.fixture()
+def mbtiles_tile_cache(tmp_path):
+    """Return MBTilesTileCache instance backed by a temporary directory."""
+    mbtiles_tile_cache = MBTilesTileCache(str(tmp_path))
+    yield mbtiles_tile_cache
+    mbtiles_tile_cache.close()
+
+
+def test_mbtiles_save_and_get_tile(mbtiles_tile_cache, tile_image):
+    """Test confirms saving tile to MBTiles cache and getting it back works."""
+    tile = mercantile.Tile(9, 6, 5)
+    mbtiles_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert mbtiles_tile_cache.contains_tile_image(tile, 2099)
+    assert mbtiles_tile_cache.get_tile_image(tile, 2099) is not None
+    assert not mbtiles_tile_cache.contains_tile_image(mercantile.Tile(9, 6, 6), 2099)
+
+
+def test_mbtiles_deduplicates_tile_images(mbtiles_tile_cache):
+    """Test confirms identical tile images (e.g. blank tiles) are only stored once."""
+    for x in range(10):
+        mbtiles_tile_cache.handle_null_tile_image(mercantile.Tile(x, 1, 5), 2099)
+    connection = mbtiles_tile_cache._get_connection(2099)
+    assert connection.execute("SELECT COUNT(*) FROM map").fetchone()[0] == 10
+    assert connection.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 1
+
+
+def test_mbtiles_batch_writes(mbtiles_tile_cache, tile_image):
+    """Test confirms tiles saved in a batch are committed when batch exits."""
+    tiles = list(mercantile.tiles(-105.3, 38.8, -105.0, 39.1, zooms=[10, 11]))
+    with mbtiles_tile_cache.batch():
+        for tile in tiles:
+            mbtiles_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert not mbtiles_tile_cache._get_connection(2099).in_transaction
+    assert mbtiles_tile_cache.get_missing_tile_images(tiles, 2099) == []
+
+
+def test_mbtiles_batch_doesnt_block_other_threads(mbtiles_tile_cache, tile_image):
+    """Test confirms other threads can read while a batch is open, and see the batch's tiles once it exits."""
+    tile, other_tile = mercantile.Tile(0, 0, 5), mercantile.Tile(1, 0, 5)
+    mbtiles_tile_cache.save_tile_image(other_tile, 2099, tile_image)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with mbtiles_tile_cache.batch():
+            mbtiles_tile_cache.save_tile_image(tile, 2099, tile_image)
+            assert mbtiles_tile_cache.contains_tile_image(tile, 2099)
+            assert executor.submit(mbtiles_tile_cache.contains_tile_image, other_tile, 2099).result(timeout=5)
+            assert not executor.submit(mbtiles_tile_cache.contains_tile_image, tile, 2099).result(timeout=5)
+        assert executor.submit(mbtiles_tile_cache.contains_tile_image, tile, 2099).result(timeout=5)
+
+
+def test_mbtiles_get_missing_tiles(mbtiles_tile_cache, tile_image):
+    """Test confirms MBTiles cache inventory finds exactly the tiles that were not saved."""
+    tiles = list(mercantile.tiles(-105.3, 38.8, -105.0, 39.1, zooms=[10, 11]))
+    for tile in tiles[::2]:
+        mbtiles_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert mbtiles_tile_cache.get_missing_tile_images(tiles, 2099) == tiles[1::2]
+
+
+@pytest.fixture(scope="module")
+def s3_bundle_bucket():
+    """Return name of bucket created for this run of bundle tests."""
+    test_bucket_name = f"aws-naip-tile-server-test-{uuid.uuid4()}"
+    s3 = boto3.resource("s3")
+    s3.create_bucket(
+        Bucket=test_bucket_name,
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+
+    yield test_bucket_name
+
+    bucket = s3.Bucket(test_bucket_name)
+    bucket.objects.all().delete()
+    bucket.delete()
+
+
+@pytest.fixture()
+def s3_bundle_tile_cache(s3_bundle_bucket):
+    """Return S3BundleTileCache instance with small bundles."""
+    return S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+
+
+def test_s3_bundle_save_and_get_tile(s3_bundle_tile_cache, tile_image):
+    """Test confirms saving tile to bundle cache and getting it back works."""
+    tile = mercantile.Tile(9, 6, 5)
+    s3_bundle_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert s3_bundle_tile_cache.contains_tile_image(tile, 2099)
+    assert s3_bundle_tile_cache.get_tile_bytes(tile, 2099) == encode_tile_image(tile_image)
+    assert not s3_bundle_tile_cache.contains_tile_image(mercantile.Tile(10, 6, 5), 2099)
+
+
+def test_s3_bundle_batch_writes_one_object_per_bundle(s3_bundle_bucket, s3_bundle_tile_cache, tile_image):
+    """Test confirms tiles saved in a batch are packed into a single object per bundle."""
+    tiles = [mercantile.Tile(x, y, 6) for x in range(8) for y in range(8)]
+    with s3_bundle_tile_cache.batch():
+        for tile in tiles:
+            s3_bundle_tile_cache.save_tile_image(tile, 2099, tile_image)
+    bundle_objects = list(boto3.resource("s3").Bucket(s3_bundle_bucket).objects.filter(Prefix="bundles/2099/6/"))
+    assert len(bundle_objects) == 1
+    assert s3_bundle_tile_cache.get_missing_tile_images(tiles + [mercantile.Tile(8, 0, 6)], 2099) == [
+        mercantile.Tile(8, 0, 6)
+    ]
+
+
+def test_s3_bundle_deduplicates_tile_images(s3_bundle_bucket, s3_bundle_tile_cache):
+    """Test confirms identical tile images (e.g. blank tiles) share data within a bundle."""
+    with s3_bundle_tile_cache.batch():
+        for x in range(8):
+            s3_bundle_tile_cache.handle_null_tile_image(mercantile.Tile(x, 0, 7), 2099)
+    bundle_object = boto3.resource("s3").Object(s3_bundle_bucket, "bundles/2099/7/0/0.bundle")
+    assert bundle_object.content_length < s3_bundle_tile_cache._header_size + 2 * len(BLANK_TILE_BYTES)
+
+
+def test_s3_bundle_concurrent_writers(s3_bundle_bucket, tile_image):
+    """Test confirms two cache instances writing to the same bundle don't lose each others tiles."""
+    cache_a = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    cache_b = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    tile_a, tile_b = mercantile.Tile(0, 0, 9), mercantile.Tile(1, 0, 9)
+    assert not cache_b.contains_tile_image(tile_a, 2099)
+    with cache_a.batch():
+        cache_a.save_tile_image(tile_a, 2099, tile_image)
+    with cache_b.batch():
+        cache_b.save_tile_image(tile_b, 2099, tile_image)
+    cache_c = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    assert cache_c.contains_tile_image(tile_a, 2099)
+    assert cache_c.contains_tile_image(tile_b, 2099)
+
+
+def test_s3_bundle_saves_loose_tiles_outside_batch(s3_bundle_bucket, tile_image):
+    """Test confirms tiles saved outside a batch don't rewrite their bundle, and are merged into it by compact."""
+    tile_cache = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    tiles = [mercantile.Tile(x, 0, 10) for x in range(3)]
+    for tile in tiles:
+        tile_cache.save_tile_image(tile, 2098, tile_image, is_rescaled=tile.x == 0)
+    bucket = boto3.resource("s3").Bucket(s3_bundle_bucket)
+    assert not any(obj.key.endswith(".bundle") for obj in bucket.objects.filter(Prefix="bundles/2098/"))
+    assert tile_cache.get_tile_bytes(tiles[1], 2098) == encode_tile_image(tile_image)
+    assert tile_cache.contains_tile_image(tiles[2], 2098)
+    assert tile_cache.get_missing_tile_images(tiles + [mercantile.Tile(3, 0, 10)], 2098) == [mercantile.Tile(3, 0, 10)]
+
+    assert tile_cache.compact(2098) == 3
+    assert [obj.key for obj in bucket.objects.filter(Prefix="bundles/2098/")] == ["bundles/2098/10/0/0.bundle"]
+    fresh_cache = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    assert fresh_cache.get_tile_bytes(tiles[1], 2098) == encode_tile_image(tile_image)
+    assert not fresh_cache.get_missing_tile_images(tiles, 2098)
+
+
+def test_s3_bundle_stale_index(s3_bundle_bucket):
+    """Test confirms a cached index of a bundle rewritten by another writer is refetched, not used to read tiles."""
+    reader = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    writer = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    tile_a, tile_b = mercantile.Tile(0, 0, 11), mercantile.Tile(1, 0, 11)
+    with writer.batch():
+        writer.save_tile_bytes(tile_b, 2099, b"b" * 10)
+    assert reader.get_tile_bytes(tile_b, 2099) == b"b" * 10
+    # shifts tile b's data in the bundle, after reader cached its index
+    with writer.batch():
+        writer.save_tile_bytes(tile_a, 2099, b"a" * 20)
+    assert reader.get_tile_bytes(tile_b, 2099) == b"b" * 10
+    assert reader.get_tile_bytes(tile_a, 2099) == b"a" * 20
+
+
+def test_s3_bundle_loose_tile_overrides_bundle(s3_bundle_bucket):
+    """Test confirms a tile re-saved outside a batch is served instead of its bundled version, until merged again."""
+    writer = S3BundleTileCache(s3_bundle_bucket, bundle_size=8)
+    tile = mercantile.Tile(0, 0, 12)
+    with writer.batch():
+        writer.save_tile_bytes(tile, 2099, b"old")
+    assert writer.get_tile_bytes(tile, 2099) == b"old"
+    writer.save_tile_bytes(tile, 2099, b"new")
+    assert writer.get_tile_bytes(tile, 2099) == b"new"
+    assert S3BundleTileCache(s3_bundle_bucket, bundle_size=8).get_tile_bytes(tile, 2099) == b"new"
+
+    # a batch write replaces the loose tile
+    with writer.batch():
+        writer.save_tile_bytes(tile, 2099, b"newest")
+    assert S3BundleTileCache(s3_bundle_bucket, bundle_size=8).get_tile_bytes(tile, 2099) == b"newest"
+    bucket = boto3.resource("s3").Bucket(s3_bundle_bucket)
+    assert not list(bucket.objects.filter(Prefix="bundles/2099/12/0/0.bundle.d/"))
+
+
+def test_s3_bundle_batch_doesnt_block_other_threads(s3_bundle_tile_cache, tile_image):
+    """Test confirms other threads can read while a batch is open, and see its tiles before it's written."""
+    tile, other_tile = mercantile.Tile(0, 0, 13), mercantile.Tile(1, 0, 13)
+    s3_bundle_tile_cache.save_tile_image(other_tile, 2099, tile_image)
+    with ThreadPoolExecutor(max_workers=1) as executor, s3_bundle_tile_cache.batch():
+        s3_bundle_tile_cache.save_tile_image(tile, 2099, tile_image)
+        assert executor.submit(s3_bundle_tile_cache.contains_tile_image, other_tile, 2099).result(timeout=5)
+        assert executor.submit(s3_bundle_tile_cache.contains_tile_image, tile, 2099).result(timeout=5)
+    assert s3_bundle_tile_cache.get_tile_bytes(tile, 2099) == encode_tile_image(tile_image)
+
+
+def test_rescale_plan_downscale_quadrants(memory_tile_cache):
+    """Test confirms each child tile ends up in the correct quadrant of the downscaled tile."""
+    tile = mercantile.Tile(10, 10, 10)
+    colors = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255), (255, 255, 0, 255)]
+    for children_tile, color in zip(mercantile.children(tile), colors):
+        memory_tile_cache.save_tile_image(children_tile, 2099, Image.new("RGBA", (256, 256), color))
+    downscaled_tile_image = RescalePlanner(memory_tile_cache).plan(tile, 2099).execute()
+    assert downscaled_tile_image.getpixel((64, 64)) == colors[0]
+    assert downscaled_tile_image.getpixel((192, 64)) == colors[1]
+    assert downscaled_tile_image.getpixel((192, 192)) == colors[2]
+    assert downscaled_tile_image.getpixel((64, 192)) == colors[3]
+
+
+def test_rescale_plan_stops_at_missing_child(memory_tile_cache, tile_image, monkeypatch):
+    """Test confirms planning gives up at the first missing child on the last level, without looking up the rest."""
+    tile = mercantile.Tile(10, 10, 10)
+    children_tiles = mercantile.children(tile)
+    for children_tile in children_tiles[1:]:
+        memory_tile_cache.save_tile_image(children_tile, 2099, tile_image)
+    lookups = []
+    get_tile_bytes = memory_tile_cache.get_tile_bytes
+
+    def _slow_get_tile_bytes(t, year):
+        lookups.append(t)
+        if t != children_tiles[0]:
+            time.sleep(0.2)
+        return get_tile_bytes(t, year)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr("src.utils.tile_cache._get_rescale_executor", lambda: executor)
+    monkeypatch.setattr(memory_tile_cache, "get_tile_bytes", _slow_get_tile_bytes)
+    assert RescalePlanner(memory_tile_cache, max_depth=1).plan(tile, 2099) is None
+    # the lookup already running when the missing child was found completes, the queued ones are cancelled
+    assert lookups[0] == children_tiles[0] and len(lookups) < len(children_tiles)
+
+
+@pytest.fixture()
+def rescaling_memory_tile_cache():
+    """Return MemoryTileCache instance with rescaling enabled."""
+    return MemoryTileCache(max_bytes=16 * 1024 * 1024, rescaling_enabled=True)
+
+
+def test_rescale_plan_downscale_multiple_levels(rescaling_memory_tile_cache, tile_image):
+    """Test confirms a tile can be downscaled from cached tiles two zoom levels below it."""
+    tile = mercantile.Tile(10, 10, 10)
+    for grandchild_tile in [gc for c in mercantile.children(tile) for gc in mercantile.children(c)]:
+        rescaling_memory_tile_cache.save_tile_image(grandchild_tile, 2099, tile_image)
+    rescale_plan = RescalePlanner(rescaling_memory_tile_cache).plan(tile, 2099)
+    assert rescale_plan.fetch_count == 16
+    assert rescaling_memory_tile_cache.get_tile_image(tile, 2099) is not None
+    assert rescaling_memory_tile_cache.contains_tile_image(tile, 2099)
+
+
+def test_rescale_plan_max_fetches(rescaling_memory_tile_cache, tile_image):
+    """Test confirms planning gives up when a plan would need more than max_fetches cached tiles."""
+    tile = mercantile.Tile(10, 10, 10)
+    for grandchild_tile in [gc for c in mercantile.children(tile) for gc in mercantile.children(c)]:
+        rescaling_memory_tile_cache.save_tile_image(grandchild_tile, 2099, tile_image)
+    assert RescalePlanner(rescaling_memory_tile_cache, max_fetches=8).plan(tile, 2099) is None
+    assert RescalePlanner(rescaling_memory_tile_cache, max_depth=1).plan(tile, 2099) is None
+
+
+def test_rescale_plan_render_cost(rescaling_memory_tile_cache, tile_image):
+    """Test confirms planning gives up when rescaling would cost more than rendering the tile."""
+    tile = mercantile.Tile(10, 10, 10)
+    for children_tile in mercantile.children(tile):
+        rescaling_memory_tile_cache.save_tile_image(children_tile, 2099, tile_image)
+    rescaling_memory_tile_cache.render_cost_estimator = lambda _tile, _year: 2
+    assert RescalePlanner(rescaling_memory_tile_cache).plan(tile, 2099) is None
+    rescaling_memory_tile_cache.render_cost_estimator = lambda _tile, _year: 16
+    assert RescalePlanner(rescaling_memory_tile_cache).plan(tile, 2099) is not None
+
+
+def test_rescale_plan_upscale_from_grandparent(rescaling_memory_tile_cache):
+    """Test confirms a tile can be upscaled from the correct region of a cached grandparent tile."""
+    grandparent_tile = mercantile.Tile(100, 100, 18)
+    grandparent_tile_image = Image.new("RGBA", (256, 256), (255, 0, 0, 255))
+    grandparent_tile_image.paste((0, 0, 255, 255), (192, 192, 256, 256))
+    rescaling_memory_tile_cache.save_tile_image(grandparent_tile, 2099, grandparent_tile_image)
+    tile = mercantile.Tile(403, 403, 20)
+    tile_image = rescaling_memory_tile_cache.get_tile_image(tile, 2099)
+    assert tile_image.getpixel((128, 128)) == (0, 0, 255, 255)
+
+
+def test_rescale_plan_memoizes_lookups(rescaling_memory_tile_cache, tile_image, monkeypatch):
+    """Test confirms each tile is looked up at most once while planning & executing a rescale."""
+    tile = mercantile.Tile(10, 10, 10)
+    for children_tile in mercantile.children(tile):
+        rescaling_memory_tile_cache.save_tile_image(children_tile, 2099, tile_image)
+    lookups = []
+    get_tile_bytes = rescaling_memory_tile_cache.get_tile_bytes
+
+    def _counting_get_tile_bytes(t, year):
+        lookups.append(t)
+        return get_tile_bytes(t, year)
+
+    monkeypatch.setattr(rescaling_memory_tile_cache, "get_tile_bytes", _counting_get_tile_bytes)
+    assert rescaling_memory_tile_cache.get_tile_image(tile, 2099) is not None
+    assert len(lookups) == len(set(lookups))
+
+
+def test_rescale_plan_ignoring_zoom_limits(rescaling_memory_tile_cache, tile_image):
+    """Test confirms an approximate tile can be upscaled below upscale_min_zoom when zoom limits are ignored."""
+    rescaling_memory_tile_cache.save_tile_image(mercantile.Tile(100, 100, 14), 2099, tile_image)
+    tile = mercantile.Tile(200, 200, 15)
+    assert RescalePlanner(rescaling_memory_tile_cache).plan(tile, 2099) is None
+    assert RescalePlanner(rescaling_memory_tile_cache, respect_zoom_limits=False).plan(tile, 2099) is not None
+
+
+def test_filesystem_render_lease(tmp_path):
+    """Test confirms only one holder of a filesystem render lease at a time, and abandoned leases are taken over."""
+    tile_cache = FileSystemTileCache(str(tmp_path))
+    tile = mercantile.Tile(1, 1, 1)
+    assert tile_cache.acquire_render_lease(tile, 2099, ttl=60)
+    assert not tile_cache.acquire_render_lease(tile, 2099, ttl=60)
+    assert tile_cache.acquire_render_lease(tile, 2099, ttl=0)
+    tile_cache.release_render_lease(tile, 2099)
+    assert tile_cache.acquire_render_lease(tile, 2099, ttl=60)
+
+
+def test_s3_render_lease(s3_bundle_bucket):
+    """Test confirms only one holder of a S3 render lease at a time."""
+    tile_cache = S3TileCache(s3_bundle_bucket)
+    tile = mercantile.Tile(1, 1, 1)
+    assert tile_cache.acquire_render_lease(tile, 2099, ttl=60)
+    assert not tile_cache.acquire_render_lease(tile, 2099, ttl=60)
+    tile_cache.release_render_lease(tile, 2099)
+    assert tile_cache.acquire_render_lease(tile, 2099, ttl=60)
+    tile_cache.release_render_lease(tile, 2099)
+
+
+def test_wait_for_tile_bytes(memory_tile_cache, tile_image):
+    """Test confirms waiting for a tile returns it once cached, and gives up after timeout otherwise."""
+    tile = mercantile.Tile(1, 1, 1)
+    assert memory_tile_cache.wait_for_tile_bytes(tile, 2099, timeout=0.1, poll_interval=0.05) is None
+    memory_tile_cache.save_tile_image(tile, 2099, tile_image)
+    assert memory_tile_cache.wait_for_tile_bytes(tile, 2099, timeout=0.1) == encode_tile_image(tile_image)
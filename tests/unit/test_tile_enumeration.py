@@ -0,0 +1,30 @@
+import mercantile
+import numpy as np
+from shapely import wkt
+from shapely.geometry import box
+
+from src.utils.tile_enumeration import enumerate_tiles, intersects_footprints
+
+
+def test_enumerate_tiles_matches_footprints():
+    """Test confirms enumerated tiles are exactly the tiles intersecting any footprint, and coverage."""
+    rng = np.random.default_rng(0)
+    west, south = rng.uniform(-110, -100, 50), rng.uniform(35, 45, 50)
+    footprint_bounds = np.column_stack((west, south, west + 0.0625, south + 0.0625))
+    coverage = wkt.loads("POLYGON ((-105 38, -103 38, -104 40, -105 38))")
+
+    for zoom in (8, 12, 14):
+        expected = sorted({t for bounds in footprint_bounds for t in mercantile.tiles(*bounds, zooms=zoom)})
+        assert enumerate_tiles(footprint_bounds, zoom) == expected
+        neighbours = {mercantile.Tile(t.x + dx, t.y, zoom) for t in expected for dx in (-1, 1)}
+        assert all(intersects_footprints(t, footprint_bounds) == (t in expected) for t in neighbours)
+        expected = [t for t in expected if coverage.intersects(box(*mercantile.bounds(t)))]
+        assert enumerate_tiles(footprint_bounds, zoom, coverage) == expected
+
+
+def test_enumerate_tiles_skips_gaps():
+    """Test confirms tiles between footprints aren't enumerated, and tiles only touching a footprint are excluded."""
+    tile_bounds = [mercantile.bounds(mercantile.Tile(x, 100, 8)) for x in (10, 13)]
+    tiles = enumerate_tiles(np.array(tile_bounds), 8)
+    assert tiles == [mercantile.Tile(10, 100, 8), mercantile.Tile(13, 100, 8)]
+    assert enumerate_tiles(np.empty((0, 4)), 8) == []
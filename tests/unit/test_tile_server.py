@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import mercantile
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from PIL import Image
+
+from src.tile_server.app import create_app
+
+
+@pytest.fixture()
+def tile_server_config(local_tile_server_config):
+    tile_server_config = local_tile_server_config(metrics_namespace="")
+    return tile_server_config
+
+
+async def _get_tiles(app, paths: list[str]) -> list[tuple[int, bytes]]:
+    async with TestClient(TestServer(app)) as client:
+        responses = await asyncio.gather(*[client.get(path) for path in paths])
+        return [(response.status, await response.read()) for response in responses]
+
+
+def test_concurrent_requests_share_render(tile_server_config, monkeypatch):
+    """Test confirms concurrent requests for the same tile are served by a single render, and then from cache."""
+    renders = []
+
+    def _get_tile_image(tile, _year, *_args):
+        renders.append(tile)
+        return Image.new("RGBA", (256, 256), (0, 128, 0, 255))
+
+    monkeypatch.setattr("src.utils.naip.get_tile_image", _get_tile_image)
+    app = create_app(render_executor=ThreadPoolExecutor(max_workers=2))
+    results = asyncio.run(_get_tiles(app, ["/tile/2021/11/776/425"] * 4 + ["/tile/2021/1/0/0"]))
+    assert [status for status, _ in results] == [200] * 4 + [400]
+    assert len({body for _, body in results[:4]}) == 1
+    assert len(renders) == 1
+    assert tile_server_config.tile_cache.get_tile_bytes(renders[0], 2021) == results[0][1]
+
+
+def test_render_backpressure(tile_server_config):
+    """Test confirms tiles that would have to be rendered are turned away once the render queue is full."""
+    app = create_app(max_pending=0, render_executor=ThreadPoolExecutor(max_workers=1))
+    assert asyncio.run(_get_tiles(app, ["/tile/2021/11/776/425"]))[0][0] == 503
+    assert not tile_server_config.tile_cache.contains_tile_image(mercantile.Tile(425, 776, 11), 2021)